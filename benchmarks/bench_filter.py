@@ -0,0 +1,119 @@
+"""
+Benchmark of the buildname filter when loading bugs.
+
+Usage: PYTHONPATH=. python benchmarks/bench_filter.py [nb_intermittents]
+
+Creates a synthetic json store (by default two million intermittents over
+a few hundred distinct buildnames), then loads it with the intermittents
+filter of the default configuration, first the way mozbattue did before
+(every regex tried on every intermittent, in a second pass after the
+decoding), then with mozbattue.utils.load_bugs, and prints the time taken
+by both.
+"""
+
+import random
+import re
+import sys
+import time
+from StringIO import StringIO
+
+from mozbattue import utils
+
+BRANCHES = ['mozilla-central', 'mozilla-inbound', 'fx-team', 'try',
+            'comm-central', 'comm-aurora', 'comm-beta', 'mozilla-aurora']
+PLATFORMS = ['Ubuntu VM 12.04', 'Ubuntu VM 12.04 x64', 'Windows 7 32-bit',
+             'Windows XP 32-bit', 'Rev5 MacOSX Yosemite 10.10']
+TESTS = ['mochitest-%d' % i for i in range(1, 6)] + \
+    ['xpcshell', 'crashtest', 'reftest', 'jsreftest', 'marionette']
+
+FILTER = """\
+.*comm-central.*
+.*comm-aurora.*
+.*comm-beta.*
+"""
+
+INTERMITTENTS_BY_BUG = 200
+
+
+def create_store(nb_intermittents):
+    rand = random.Random(42)
+    buildnames = ['%s %s opt test %s' % (p, b, t)
+                  for p in PLATFORMS for b in BRANCHES for t in TESTS]
+    bugs = {}
+    for bugid in xrange(nb_intermittents // INTERMITTENTS_BY_BUG):
+        bug_buildnames = rand.sample(buildnames, 10)
+        bugs[str(bugid)] = {
+            'status': 'NEW',
+            'product': 'Core',
+            'assigned_to': 'nobody@mozilla.org',
+            'intermittents': {
+                'timestamps': sorted(rand.randint(1427846400, 1430438400)
+                                     for _ in xrange(INTERMITTENTS_BY_BUG)),
+                'buildnames': [rand.choice(bug_buildnames)
+                               for _ in xrange(INTERMITTENTS_BY_BUG)],
+                'revisions': ['%012x' % rand.getrandbits(48)
+                              for _ in xrange(INTERMITTENTS_BY_BUG)],
+                'sorted': True,
+            },
+        }
+    stream = StringIO()
+    utils.dump_bugs(dict((bugid, utils.decode_bug(bug))
+                         for bugid, bug in bugs.iteritems()), stream)
+    return stream.getvalue()
+
+
+class ReferenceFilter(object):
+    # the filter mozbattue used before the compiled one
+    def __init__(self, regexes_str):
+        self.regexes = [re.compile(r) for r in regexes_str.splitlines() if r]
+
+    def __call__(self, intermittent):
+        for regex in self.regexes:
+            if regex.match(intermittent['buildname']):
+                return False
+        return True
+
+
+def reference_load(data):
+    # decode everything, then filter the intermittents in a second pass
+    bugs = utils.load_bugs(StringIO(data), kept_no_intermittents=True)
+    filter = ReferenceFilter(FILTER)
+    for bugid, bug in bugs.items():
+        intermittents = bug['intermittents']
+        bug['intermittents'] = intermittents.take(
+            [i for i in xrange(len(intermittents))
+             if filter(intermittents[i])])
+        if not bug['intermittents']:
+            del bugs[bugid]
+    return bugs
+
+
+def load(data):
+    return utils.load_bugs(
+        StringIO(data),
+        filter_intermittents=utils.create_filter_intermittents(FILTER))
+
+
+def bench(name, func, data):
+    start = time.time()
+    result = func(data)
+    elapsed = time.time() - start
+    print "%-10s %8.2fs  %10d intermittents kept" % (
+        name, elapsed, sum(len(b['intermittents']) for b in result.values()))
+    return result
+
+
+def main():
+    nb_intermittents = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    print "Creating a store of %d intermittents..." % nb_intermittents
+    data = create_store(nb_intermittents)
+    reference = bench('reference', reference_load, data)
+    result = bench('compiled', load, data)
+    assert sorted(result) == sorted(reference), "loaded bugs differ"
+    for bugid, bug in result.iteritems():
+        assert bug['intermittents'] == reference[bugid]['intermittents'], \
+            "filtered intermittents differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark of the intermittent comments parser.
+
+Usage: PYTHONPATH=. python benchmarks/bench_parser.py [nb_comments]
+
+Parses a synthetic corpus of bug comments (by default one million, one in
+four being an intermittent report) with the single-line regex approach that
+mozbattue used before, then with mozbattue.parser, and prints the
+throughput of both.
+"""
+
+import datetime
+import random
+import re
+import sys
+import time
+
+from mozbattue import parser
+
+INTERMITTENT = """\
+log: https://treeherder.mozilla.org/logviewer.html#?repo=mozilla-inbound
+repository: mozilla-inbound
+start_time: 2015-04-%02dT%02d:16:25
+who: someone[at]mozilla[dot]com
+machine: tst-linux64-spot-%d
+buildname: Ubuntu VM 12.04 x64 mozilla-inbound opt test mochitest-%d
+revision: %012x
+
+TEST-UNEXPECTED-FAIL | dom/tests/test_something.html | Test timed out.
+"""
+
+DISCUSSION = """\
+I had a look at the logs, and this seems to happen only on linux64 when
+the machine is under heavy load. The test relies on a timer that is not
+guaranteed to fire before the page load event, so we should probably
+rewrite it to wait for the event explicitly.
+
+Comment on attachment %d
+Patch v%d
+""" * 3
+
+
+class FakeComment(object):
+    def __init__(self, text):
+        self.text = text
+
+
+def create_corpus(nb_comments):
+    rand = random.Random(42)
+    corpus = []
+    for i in xrange(nb_comments):
+        if i % 4 == 0:
+            text = INTERMITTENT % (rand.randint(1, 28), rand.randint(0, 23),
+                                   i, rand.randint(1, 5),
+                                   rand.getrandbits(48))
+        else:
+            text = DISCUSSION % ((i, i % 7) * 3)
+        corpus.append(FakeComment(text))
+    return corpus
+
+
+RE_EXTRACT_BUG_INFO = \
+    re.compile("^(buildname|revision|start_time|submit_timestamp): (.+)")
+
+
+def reference_parse_comments(comments):
+    # the line by line parser mozbattue used before mozbattue.parser
+    intermittents = []
+    for comment in comments:
+        intermittent = {}
+        for line in comment.text.splitlines():
+            res = RE_EXTRACT_BUG_INFO.match(line)
+            if not res:
+                continue
+            key, value = res.groups()
+            intermittent[key] = value
+        if 'start_time' in intermittent:
+            intermittent['timestamp'] = intermittent.pop('start_time')
+        if 'submit_timestamp' in intermittent:
+            intermittent['timestamp'] = intermittent.pop('submit_timestamp')
+        if len(intermittent) == 3:
+            intermittent['timestamp'] = \
+                datetime.datetime.strptime(intermittent['timestamp'],
+                                           '%Y-%m-%dT%H:%M:%S')
+            intermittents.append(intermittent)
+    return intermittents
+
+
+def bench(name, func, corpus):
+    start = time.time()
+    result = func(corpus)
+    elapsed = time.time() - start
+    print "%-10s %8.2fs  %10d comments/s" % (name, elapsed,
+                                             len(corpus) / elapsed)
+    return result
+
+
+def main():
+    nb_comments = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print "Creating a corpus of %d comments..." % nb_comments
+    corpus = create_corpus(nb_comments)
+    reference = bench('reference', reference_parse_comments, corpus)
+    result = bench('parser', parser.parse_comments, corpus)
+    assert result == reference, "parsers results differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+"""
+Bisection of the push that introduced an intermittent failure.
+
+A push is bad as soon as one of its runs fails, but it is only considered
+good after enough runs without failure: with a failure rate *p* per run,
+retries_for_confidence(p, confidence) runs without failure give the
+*confidence* that the failure is absent.
+
+The runs of a push are triggered in rounds, and a push is known to be bad
+at the first round with a failure, so testing a bad push is cheaper than
+testing a good one. The next push to test is the one minimizing the
+expected number of runs of the whole bisection, which is not always the
+middle one.
+
+The Bisection only holds the state of the search (a json serializable
+dict, stored between runs by BisectionStore), the runs are triggered by a
+backend: TriggerBackend triggers real builds, SimulatedBackend fails at a
+given rate to test the search offline.
+"""
+
+import json
+import math
+import os
+import random
+
+from mozbattue.utils import MozBattueError, atomic_write
+
+
+def retries_for_confidence(failure_rate, confidence):
+    """
+    Return the number of runs without failure needed to have the
+    *confidence* that a failure happening with *failure_rate* per run is
+    absent.
+    """
+    if not 0 < failure_rate <= 1:
+        raise MozBattueError("The failure rate must be in ]0, 1], not %r"
+                             % failure_rate)
+    if not 0 < confidence < 1:
+        raise MozBattueError("The confidence must be in ]0, 1[, not %r"
+                             % confidence)
+    if failure_rate == 1:
+        return 1
+    return max(1, int(math.ceil(math.log(1 - confidence) /
+                                math.log(1 - failure_rate))))
+
+
+def estimate_failure_rate(average_day, runs_per_day):
+    """
+    Estimate the failure rate per run of a bug, from its average number of
+    intermittents per day and the number of runs of its build per day.
+    """
+    if not average_day:
+        raise MozBattueError("The bug has no intermittent rate, give the "
+                             "failure rate")
+    return min(1.0, float(average_day) / runs_per_day)
+
+
+def round_sizes(retries, rounds):
+    """
+    Split *retries* runs in at most *rounds* rounds.
+    """
+    rounds = max(1, min(rounds, retries))
+    size, extra = divmod(retries, rounds)
+    return [size + 1] * extra + [size] * (rounds - extra)
+
+
+def expected_bad_runs(failure_rate, sizes):
+    """
+    Expected number of runs of a bad push, stopping at the first round
+    with a failure.
+    """
+    expected = 0.0
+    previous = 0
+    for size in sizes:
+        # the round is run if no failure happened in the previous ones
+        expected += size * (1 - failure_rate) ** previous
+        previous += size
+    return expected
+
+
+def best_splits(nb, good_cost, bad_cost):
+    """
+    Return a list giving, for each number k < *nb* of candidate pushes,
+    the number j (1 <= j < k) of candidates before the push to test (the
+    tested push is the j-th candidate) minimizing the expected cost of the
+    search, with the culprit equally likely to be any candidate.
+    """
+    cost = [0.0] * nb
+    splits = [0] * nb
+    for k in xrange(2, nb):
+        best = None
+        for j in xrange(1, k):
+            # the tested push is bad when the culprit is one of the j
+            # first candidates
+            c = (j * (bad_cost + cost[j]) +
+                 (k - j) * (good_cost + cost[k - j])) / k
+            if best is None or c < best:
+                best, splits[k] = c, j
+        cost[k] = best
+    return splits
+
+
+class Bisection(object):
+    """
+    Search of the culprit among *revisions* (oldest first), the last one
+    being known as bad. The oldest one is tested first, as the failure
+    must be absent there for the culprit to be in the revisions.
+    """
+    def __init__(self, state):
+        self.state = state
+        self._splits = None
+
+    @classmethod
+    def start(cls, revisions, failure_rate, confidence=0.95, rounds=2,
+              **info):
+        """
+        Create a new bisection. *info* is stored in the state as is.
+        """
+        if len(revisions) < 2:
+            raise MozBattueError("At least two revisions are needed")
+        retries_for_confidence(failure_rate, confidence)  # check them
+        state = dict(info)
+        state.update({
+            'revisions': list(revisions),
+            'failure_rate': failure_rate,
+            'confidence': confidence,
+            'rounds': rounds,
+            'good': None,
+            'bad': len(revisions) - 1,
+            'current': None,
+            'runs': 0,
+            'failures': 0,
+            'triggered': None,
+            'history': [],
+        })
+        return cls(state)
+
+    @property
+    def retries(self):
+        return retries_for_confidence(self.state['failure_rate'],
+                                      self.state['confidence'])
+
+    @property
+    def finished(self):
+        return self.status != 'running'
+
+    @property
+    def status(self):
+        """
+        'running', 'found' when the culprit is found, or 'out of range'
+        when the oldest revision is bad too.
+        """
+        good, bad = self.state['good'], self.state['bad']
+        if good is None:
+            return 'out of range' if bad == 0 else 'running'
+        return 'found' if bad - good == 1 else 'running'
+
+    @property
+    def culprit(self):
+        if self.status == 'found':
+            return self.state['revisions'][self.state['bad']]
+
+    def next_index(self):
+        """
+        Return the index of the revision to test next.
+        """
+        if self.state['current'] is not None:
+            return self.state['current']
+        good = self.state['good']
+        if good is None:
+            return 0
+        if self._splits is None:
+            sizes = round_sizes(self.retries, self.state['rounds'])
+            self._splits = best_splits(
+                len(self.state['revisions']), self.retries,
+                expected_bad_runs(self.state['failure_rate'], sizes))
+        return good + self._splits[self.state['bad'] - good]
+
+    def next_step(self):
+        """
+        Return the (revision, times) to run next, or None if the bisection
+        is finished. The runs are pending until they are recorded, and are
+        not triggered again: *times* is 0 while the pending runs complete
+        the current round.
+        """
+        if self.finished:
+            return None
+        index = self.next_index()
+        self.state['current'] = index
+        pending = self.state['triggered'] or 0
+        # run the rest of the current round
+        end = 0
+        for size in round_sizes(self.retries, self.state['rounds']):
+            end += size
+            if end > self.state['runs']:
+                break
+        times = max(0, end - self.state['runs'] - pending)
+        self.state['triggered'] = pending + times
+        return self.state['revisions'][index], times
+
+    def record(self, failures, runs=None):
+        """
+        Record the results of runs of the current revision, by default of
+        all the pending runs. The other pending runs are still waited for,
+        unless the revision is known to be good or bad.
+        """
+        index = self.state['current']
+        if index is None:
+            raise MozBattueError("No revision is being tested")
+        pending = self.state['triggered'] or 0
+        if runs is None:
+            runs = pending
+        if runs > pending:
+            raise MozBattueError("Only %d runs of the revision are pending, "
+                                 "not %r" % (pending, runs))
+        if not 0 <= failures <= runs:
+            raise MozBattueError("Invalid number of failures %r for %r runs"
+                                 % (failures, runs))
+        self.state['triggered'] = pending - runs
+        self.state['runs'] += runs
+        self.state['failures'] += failures
+        if self.state['failures']:
+            self.state['bad'] = index
+        elif self.state['runs'] >= self.retries:
+            self.state['good'] = index
+        else:
+            return
+        self.state['history'].append({
+            'revision': self.state['revisions'][index],
+            'runs': self.state['runs'],
+            'failures': self.state['failures'],
+        })
+        self.state['current'] = None
+        self.state['triggered'] = None
+        self.state['runs'] = self.state['failures'] = 0
+
+    def total_runs(self):
+        return sum(h['runs'] for h in self.state['history']) + \
+            self.state['runs']
+
+
+def run(bisection, backend):
+    """
+    Run a bisection to its end with a backend giving the results of the
+    runs immediately, and return it.
+    """
+    while not bisection.finished:
+        revision, times = bisection.next_step()
+        backend.trigger(revision, times)
+        runs, failures = backend.results(revision)
+        bisection.record(failures, runs)
+    return bisection
+
+
+class SimulatedBackend(object):
+    """
+    Backend failing with *failure_rate* on the *culprit* revision and the
+    revisions after it in *revisions* (oldest first).
+    """
+    def __init__(self, revisions, culprit, failure_rate, seed=None):
+        self.failing = set(revisions[revisions.index(culprit):])
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.pending = {}
+
+    def trigger(self, revision, times):
+        rate = self.failure_rate if revision in self.failing else 0
+        failures = sum(1 for _ in xrange(times)
+                       if self.random.random() < rate)
+        self.pending[revision] = (times, failures)
+
+    def results(self, revision):
+        return self.pending.pop(revision)
+
+
+class TriggerBackend(object):
+    """
+    Backend triggering builds with *trigger* (trigger_jobs): the results
+    are read on treeherder and recorded by the user.
+    """
+    def __init__(self, trigger, buildername, **kwargs):
+        self._trigger = trigger
+        self.buildername = buildername
+        self.kwargs = kwargs
+
+    def trigger(self, revision, times):
+        return self._trigger(self.buildername, revision, back_revisions=-1,
+                             times=times, **self.kwargs)
+
+
+class BisectionStore(object):
+    """
+    States of the bisections of the bugs, stored in the json file *path*.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _write(self, states):
+        with atomic_write(self.path) as f:
+            json.dump(states, f, indent=1, sort_keys=True)
+
+    def get(self, bugid):
+        state = self._read().get(str(bugid))
+        return None if state is None else Bisection(state)
+
+    def save(self, bugid, bisection):
+        states = self._read()
+        states[str(bugid)] = bisection.state
+        self._write(states)
@@ -1,22 +1,93 @@
+import csv
+import datetime
+import heapq
+import itertools
+import json
+import os
+import stat
 import sys
-from mozbattue.utils import intermittents_by_time, MozBattueError
+from collections import OrderedDict
+from mozbattue.utils import MozBattueError, DATETIME_FORMAT
+from mozbattue.intermittents import from_epoch
+from mozbattue.summary import with_summary
+from mozbattue.stats import STATS_COLUMNS
 
 
 class Column(object):
-    def __init__(self, renderer=str, desc=''):
+    """
+    A table column. *width*, if given, is the known width of the rendered
+    values.
+    """
+    def __init__(self, renderer=str, desc='', width=None):
         self.renderer = renderer
         self.desc = desc
+        self.width = width
 
     def render_value(self, value):
         return self.renderer(value)
 
 
+def parse_string_sort(string_sort):
+    """
+    Return the (column name, reverse) list from a string like
+    '>average_day, >nb, id', where '>' is for a descending order.
+    """
+    sort_by = []
+    for k in string_sort.split(','):
+        k = k.strip()
+        reverse = False
+        if k.startswith('>'):
+            k = k[1:]
+            reverse = True
+        elif k.startswith('<'):
+            k = k[1:]
+        sort_by.append((k, reverse))
+    return sort_by
+
+
+def optional_float(fmt):
+    """
+    Return a renderer for floats that may be None.
+    """
+    return lambda value: '-' if value is None else fmt % value
+
+
+class Reversed(object):
+    """
+    Wrap a value to reverse its ordering in a sort key.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+
 class Table(object):
+    """
+    A table of rows (dicts, or anything indexable by column name).
+
+    Filtering, sorting and limiting the rows is lazy: these are only
+    applied when the rows are rendered, in one pass, in that order. The
+    rows are sorted once on all the sort keys, and only the first rows are
+    selected (without sorting all of them) when there is a limit.
+    """
     columns = {}
     visible_columns = ()
 
     def __init__(self, visible_columns=()):
         self.data = []
+        self.filters = []
+        self.sort_by = []
+        self.limit = None
         if visible_columns:
             self.visible_columns = visible_columns
 
@@ -24,73 +95,209 @@ class Table(object):
         self.data.append(row)
 
     def sort(self, sort_by=()):
-        for key, reverse in reversed(sort_by):
-            self.data = sorted(self.data, key=lambda b: b[key],
-                               reverse=reverse)
+        """
+        Sort the rows by the (column name, reverse) list *sort_by*. A
+        previous sort is kept for the rows with the same keys.
+        """
+        self.sort_by = list(sort_by) + self.sort_by
 
     def string_sort(self, string_sort):
-        sort_by = []
-        for k in string_sort.split(','):
-            k = k.strip()
-            reverse = False
-            if k.startswith('>'):
-                k = k[1:]
-                reverse = True
-            elif k.startswith('<'):
-                k = k[1:]
+        sort_by = parse_string_sort(string_sort)
+        for k, reverse in sort_by:
             if k not in self.columns:
                 raise MozBattueError("Unable to sort by unknown column %r" % k)
-            sort_by.append((k, reverse))
         self.sort(sort_by)
 
     def raw_filter(self, filter):
-        self.data = [d for d in self.data if filter(d)]
+        self.filters.append(filter)
+
+    def set_limit(self, limit):
+        """
+        Only keep the *limit* first rows (after filtering and sorting).
+        """
+        self.limit = limit
+
+    def _sort_key(self):
+        """
+        Return (key function, reverse) to sort the rows.
+        """
+        keys = [k for k, _ in self.sort_by]
+        reverses = set(reverse for _, reverse in self.sort_by)
+        if len(reverses) == 1:
+            return (lambda row: tuple(row[k] for k in keys)), reverses.pop()
+        sort_by = self.sort_by
+        return (lambda row: tuple(Reversed(row[k]) if reverse else row[k]
+                                  for k, reverse in sort_by)), False
+
+    def source_rows(self):
+        """
+        Return an iterable on all the rows.
+        """
+        return self.data
+
+    def rows(self):
+        """
+        Return an iterable on the filtered, sorted and limited rows.
+        """
+        rows = self.source_rows()
+        for filter in self.filters:
+            rows = itertools.ifilter(filter, rows)
+        if self.sort_by:
+            key, reverse = self._sort_key()
+            if self.limit is not None:
+                select = heapq.nlargest if reverse else heapq.nsmallest
+                return select(self.limit, rows, key=key)
+            return sorted(rows, key=key, reverse=reverse)
+        if self.limit is not None:
+            return itertools.islice(rows, self.limit)
+        return rows
+
+    def render(self, stream=sys.stdout, sep='  ', format='text'):
+        """
+        Render the rows, and return the number of rendered rows.
+
+        *format* is one of FORMATS: 'text' for aligned columns, or a
+        machine readable format in which the raw values are written as
+        soon as the rows are produced.
+        """
+        if format != 'text':
+            try:
+                writer = ROW_WRITERS[format]
+            except KeyError:
+                raise MozBattueError("Unknown format %r" % format)
+            names = self.visible_columns
+            return writer(names,
+                          ([export_value(row[name]) for name in names]
+                           for row in self.rows()),
+                          stream)
+        columns = [self.columns[name] for name in self.visible_columns]
+        renderer = TableRenderer(self.visible_columns, sep=sep,
+                                 widths=[c.width for c in columns])
+        return renderer.render(
+            (tuple(c.render_value(row[name])
+                   for c, name in itertools.izip(columns,
+                                                 self.visible_columns))
+             for row in self.rows()),
+            stream=stream)
+
+
+def export_value(value):
+    """
+    Return the value as written in the machine readable formats.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+
+def write_json_lines(names, rows, stream):
+    """
+    Write each row as a json object on its own line.
+    """
+    nb_rows = 0
+    for row in rows:
+        stream.write(json.dumps(OrderedDict(itertools.izip(names, row))))
+        stream.write('\n')
+        nb_rows += 1
+    return nb_rows
+
+
+def write_delimited(names, rows, stream, delimiter):
+    """
+    Write the column names then the rows, with the csv module.
+    """
+    def encode(value):
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return value
+
+    writer = csv.writer(stream, delimiter=delimiter, lineterminator='\n')
+    writer.writerow(names)
+    nb_rows = 0
+    for row in rows:
+        writer.writerow([encode(value) for value in row])
+        nb_rows += 1
+    return nb_rows
+
 
-    def render(self, stream=sys.stdout, sep='  '):
-        renderer = TableRenderer(self.visible_columns, sep=sep)
-        for row in self.data:
-            data_row = []
-            for column_name in self.visible_columns:
-                col = self.columns[column_name]
-                data_row.append(col.render_value(row[column_name]))
-            renderer.add_row(*data_row)
-        renderer.render(stream=stream)
+ROW_WRITERS = {
+    'json-lines': write_json_lines,
+    'csv': lambda names, rows, stream:
+        write_delimited(names, rows, stream, ','),
+    'tsv': lambda names, rows, stream:
+        write_delimited(names, rows, stream, '\t'),
+}
+
+FORMATS = ('text',) + tuple(sorted(ROW_WRITERS))
+
+
+def is_pipe(stream):
+    """
+    Return True if the stream writes to a pipe.
+    """
+    try:
+        return stat.S_ISFIFO(os.fstat(stream.fileno()).st_mode)
+    except (AttributeError, ValueError, OSError, IOError):
+        # not a real file, like StringIO
+        return False
 
 
 class TableRenderer(object):
-    def __init__(self, cols, sep='  '):
+    """
+    Write rows of strings as aligned columns, as they are produced.
+
+    The column widths are computed from the known *widths* (None for the
+    unknown ones) and the first *sample_size* rows. Longer values in the
+    next rows just shift the following columns. Rows are not aligned when
+    writing to a pipe, so that the output can be processed at once.
+    """
+    sample_size = 200
+
+    def __init__(self, cols, sep='  ', widths=None, sample_size=None):
         self.cols = cols
-        self.data = []
         self.sep = sep
+        self.widths = widths or [None] * len(cols)
+        if sample_size is not None:
+            self.sample_size = sample_size
 
-    def add_row(self, *data):
-        self.data.append(data)
-
-    def render(self, stream=sys.stdout):
-        # calculate column sizes
-        col_data = [[c] for c in self.cols]
-        for row in self.data:
-            for i, d in enumerate(row):
-                col_data[i].append(d)
-        col_sizes = []
-        for d in col_data:
-            col_sizes.append(max([len(d1) for d1 in d]))
-
-        fmt = self.sep.join(["%%-%ds"] * len(col_sizes))
-        fmt = fmt % tuple(col_sizes)
+    def render(self, rows, stream=sys.stdout, align=None):
+        """
+        Write the header and the rows (tuples of strings) in the stream,
+        and return the number of rows written. Rows are aligned if *align*
+        is True, or if it is None and the stream is not a pipe.
+        """
+        if align is None:
+            align = not is_pipe(stream)
+        rows = iter(rows)
+        if align:
+            sample = list(itertools.islice(rows, self.sample_size))
+            col_sizes = []
+            for i, col in enumerate(self.cols):
+                size = max([len(col), self.widths[i] or 0] +
+                           [len(row[i]) for row in sample])
+                col_sizes.append(size)
+            fmt = self.sep.join(["%%-%ds"] * len(col_sizes))
+            fmt = fmt % tuple(col_sizes)
+            rows = itertools.chain(sample, rows)
+        else:
+            fmt = self.sep.join(["%s"] * len(self.cols))
         # print header
         stream.write(fmt % tuple(self.cols))
         stream.write('\n\n')
-        for row in self.data:
-            stream.write(fmt % tuple(row))
+        nb_rows = 0
+        for row in rows:
+            stream.write(fmt % row)
             stream.write('\n')
+            nb_rows += 1
+        return nb_rows
 
 
 class BugTable(Table):
     columns = {
         'id': Column(str, desc='Id of the bug'),
         'nb': Column(str, desc='Number of intermittent occurences found'),
-        'date': Column(str, desc='Date of the first intermittent occurence'),
+        'date': Column(str, desc='Date of the first intermittent occurence',
+                       width=19),
         'rev': Column(str,
                       desc='Revision of the first intermittent occurence'),
         'status': Column(str, desc='Status of the bug'),
@@ -99,24 +306,47 @@ class BugTable(Table):
         'average_day': Column(lambda v: '%.2f' % v,
                               desc="Average number of intermittents occurences"
                                    " in one day"),
+        'nb_buildnames': Column(str, desc='Number of distinct buildnames'),
+        'last_24h': Column(str, desc='Number of intermittent occurences in '
+                                     'the last 24 hours'),
+        'last_7d': Column(str, desc='Number of intermittent occurences in '
+                                    'the last 7 days'),
+        'median_gap': Column(optional_float('%.1f'),
+                             desc='Median time between two intermittent '
+                                  'occurences, in hours'),
+        'wow_growth': Column(optional_float('%+.2f'),
+                             desc='Growth of the number of intermittent '
+                                  'occurences in the last 7 days compared '
+                                  'to the 7 days before'),
     }
 
-    def __init__(self, raw_bugs, visible_columns=()):
+    def __init__(self, raw_bugs, visible_columns=(), stats=None):
+        """
+        Create the table from the bugs summaries (see
+        mozbattue.summary). Bugs without summary must have their
+        intermittents, to compute it.
+
+        The columns of mozbattue.stats.STATS_COLUMNS are taken from
+        *stats* (see mozbattue.stats.compute_stats), and are None when it
+        is not given.
+        """
         Table.__init__(self, visible_columns=visible_columns)
         for bugid, bug in raw_bugs.iteritems():
-            intermittents = intermittents_by_time(bug['intermittents'])
-            oldest, newest = intermittents[0], intermittents[-1]
-            daterange = newest['timestamp'] - oldest['timestamp']
-            self.add_row({
+            summary = with_summary(bug)['summary']
+            row = {
                 'id': bugid,
-                'nb': len(intermittents),
-                'date': oldest['timestamp'],
-                'rev': oldest['revision'],
+                'nb': summary['nb'],
+                'date': from_epoch(summary['oldest']),
+                'rev': summary['oldest_revision'],
                 'status': bug['status'],
                 'assigned_to': bug['assigned_to'],
                 'product': bug['product'],
-                'average_day': len(intermittents) / float(daterange.days or 1),
-            })
+                'average_day': summary['average_day'],
+                'nb_buildnames': len(summary['buildnames']),
+            }
+            row.update((stats or {}).get(bugid) or
+                       dict.fromkeys(STATS_COLUMNS))
+            self.add_row(row)
 
 
 class BugTableComment(Table):
@@ -135,9 +365,30 @@ class BugTableComment(Table):
             })
 
 
+class IntermittentRow(object):
+    """
+    A row of IntermittentTable, reading its values from the Intermittents
+    arrays.
+    """
+    __slots__ = ('intermittents', 'index')
+
+    def __init__(self, intermittents, index):
+        self.intermittents = intermittents
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'date':
+            return self.intermittents.timestamp(self.index)
+        elif key == 'revision':
+            return self.intermittents.revision(self.index)
+        elif key == 'buildname':
+            return self.intermittents.buildname(self.index)
+        raise KeyError(key)
+
+
 class IntermittentTable(Table):
     columns = {
-        'date': Column(str),
+        'date': Column(str, width=19),
         'revision': Column(str),
         'buildname': Column(lambda v: repr(str(v))),
     }
@@ -145,12 +396,12 @@ class IntermittentTable(Table):
 
     def __init__(self, intermittents):
         Table.__init__(self)
-        for i in intermittents:
-            self.add_row({
-                'date': i['timestamp'],
-                'revision': i['revision'],
-                'buildname': i['buildname'],
-            })
+        self.intermittents = intermittents
+
+    def source_rows(self):
+        intermittents = self.intermittents
+        return (IntermittentRow(intermittents, i)
+                for i in xrange(len(intermittents)))
 
 
 class IntermittentsGroupedByNameTable(Table):
@@ -159,3 +410,28 @@ class IntermittentsGroupedByNameTable(Table):
         'occurences': Column(str),
     }
     visible_columns = ('occurences', 'buildname')
+
+
+class TriggerTable(Table):
+    """
+    Summary of the builds triggered for several revisions, from the
+    results of trigger_sweep.
+    """
+    columns = {
+        'back': Column(lambda v: '' if v is None else str(-v),
+                       "number of revisions before the oldest one"),
+        'revision': Column(str, "triggered revision"),
+        'status': Column(str, "number of requests accepted by buildbot"),
+        'url': Column(str, "treeherder url of the builds"),
+    }
+    visible_columns = ('back', 'revision', 'status', 'url')
+
+    def __init__(self, results):
+        Table.__init__(self)
+        for result in results:
+            self.add_row({
+                'back': result['back_revisions'],
+                'revision': result['revision'],
+                'status': result['status'],
+                'url': result['url'],
+            })
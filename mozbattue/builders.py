@@ -0,0 +1,94 @@
+"""
+Local index of the buildbot builder names.
+
+Buildnames found in bugs do not always have the case of the builders
+known by buildbot. The index maps lowercase builder names to their
+canonical names. It is stored on disk, and downloaded again only when it
+is older than its time to live, or when explicitly refreshed.
+"""
+
+import difflib
+import json
+import time
+
+from mozbattue.utils import LOG, MozBattueError, atomic_write
+
+
+class BuilderIndex(object):
+    """
+    Index of the builder names, stored in the json file *path* (only kept
+    in memory if *path* is None).
+
+    *query* is the function returning the list of the builder names, called
+    when the index is missing, older than *ttl* seconds, or refreshed.
+    """
+    def __init__(self, path, query, ttl=24 * 3600):
+        self.path = path
+        self.query = query
+        self.ttl = ttl
+        self._builders = None
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if time.time() - data['updated'] < self.ttl:
+                return data['builders']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _write(self, builders):
+        with atomic_write(self.path) as f:
+            json.dump({'updated': time.time(), 'builders': builders}, f)
+
+    def refresh(self):
+        """
+        Download the builder names again and store them.
+        """
+        LOG.info("Downloading the list of builders")
+        builders = dict((name.lower(), name) for name in self.query())
+        if self.path is not None:
+            self._write(builders)
+        self._builders = builders
+        return builders
+
+    @property
+    def builders(self):
+        if self._builders is None:
+            if self.path is not None:
+                self._builders = self._read()
+            if self._builders is None:
+                self.refresh()
+        return self._builders
+
+    def __len__(self):
+        return len(self.builders)
+
+    def get(self, buildername):
+        """
+        Return the canonical name of a builder, or None if it is unknown.
+        """
+        return self.builders.get(buildername.strip().lower())
+
+    def suggest(self, buildername, nb=5):
+        """
+        Return the names of the builders closest to *buildername*.
+        """
+        builders = self.builders
+        return [builders[name] for name in difflib.get_close_matches(
+            buildername.strip().lower(), builders, nb)]
+
+    def sanitize(self, buildername):
+        """
+        Return the canonical name of a builder, or raise a MozBattueError
+        suggesting the closest names if it is unknown.
+        """
+        canonical = self.get(buildername)
+        if canonical is None:
+            suggestions = self.suggest(buildername)
+            msg = "Unknown buildername '%s'." % buildername.strip()
+            if suggestions:
+                msg += " Closest names are:\n  %s" % '\n  '.join(suggestions)
+            raise MozBattueError(msg)
+        return canonical
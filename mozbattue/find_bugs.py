@@ -1,7 +1,14 @@
 import bugsy
+from bugsy.bug import Comment
+from bugsy.errors import BugsyException
 import datetime
-import re
+import itertools
+import requests
 import sys
+from multiprocessing.pool import ThreadPool
+
+from mozbattue.utils import LOG
+from mozbattue.parser import parse_comments
 
 
 class BugsyReporter(object):
@@ -24,73 +31,242 @@ class BugsyReporter(object):
         pass
 
 
-class BugsyFinder(object):
-    RE_EXTRACT_BUG_INFO = \
-        re.compile("^(buildname|revision|start_time|submit_timestamp): (.+)")
+class CommentsFetcher(object):
+    """
+    Retrieve bug comments from bugzilla, with one request per bug.
+    """
+    batch_size = 1
+
+    def __init__(self, bugzilla):
+        self.bugzilla = bugzilla
+
+    def _new_comments(self, comments, previous):
+        if not (previous and previous.get('last_comment_id')):
+            return comments
+        # new_since is inclusive, and comments may share the same time
+        return [c for c in comments if c.id > previous['last_comment_id']]
+
+    def get_comments(self, bug, previous=None):
+        """
+        Return the comments of the bug. If we already analyzed the bug in
+        *previous*, only the comments posted after the last one we saw are
+        requested.
+        """
+        if not (previous and previous.get('last_comment_id')):
+            return bug.get_comments()
+        bugid = str(bug.id)
+        res = self.bugzilla.request(
+            'bug/%s/comment' % bugid,
+            params={'new_since': previous['last_comment_time']})
+        comments = [Comment(bugsy=self.bugzilla, **c)
+                    for c in res['bugs'][bugid]['comments']]
+        return self._new_comments(comments, previous)
+
+    def get_batch_comments(self, batch):
+        """
+        Return a list of comments for each (bug, previous) item in *batch*.
+        """
+        return [self.get_comments(bug, previous) for bug, previous in batch]
+
+
+class BatchCommentsFetcher(CommentsFetcher):
+    """
+    Retrieve the comments of up to *batch_size* bugs in one request.
+
+    Batches that are refused by bugzilla are split in two until they
+    go through, ending with a per-bug request.
+    """
+    def __init__(self, bugzilla, batch_size=50):
+        CommentsFetcher.__init__(self, bugzilla)
+        self.batch_size = batch_size
+
+    def _request(self, bugs, new_since=None):
+        ids = [str(bug.id) for bug in bugs]
+        params = {}
+        if len(ids) > 1:
+            params['ids'] = ids[1:]
+        if new_since:
+            params['new_since'] = new_since
+        res = self.bugzilla.request('bug/%s/comment' % ids[0], params=params)
+        return dict(
+            (bugid, [Comment(bugsy=self.bugzilla, **c)
+                     for c in data['comments']])
+            for bugid, data in res['bugs'].iteritems()
+        )
+
+    def _fetch(self, batch, new_since=None):
+        try:
+            by_bug = self._request([bug for bug, _ in batch], new_since)
+        except (BugsyException, requests.RequestException, ValueError), exc:
+            if len(batch) == 1:
+                LOG.debug("Batch request failed for bug %s (%s), falling "
+                          "back to a single bug request", batch[0][0].id, exc)
+                return [self.get_comments(*batch[0])]
+            LOG.debug("Batch request failed for %d bugs (%s), splitting it",
+                      len(batch), exc)
+            middle = len(batch) // 2
+            return (self._fetch(batch[:middle], new_since) +
+                    self._fetch(batch[middle:], new_since))
+        return [self._new_comments(by_bug.get(str(bug.id), []), previous)
+                for bug, previous in batch]
+
+    def get_batch_comments(self, batch):
+        # bugs never analyzed need all their comments; the other ones are
+        # asked only comments posted since the oldest last seen comment.
+        full, incremental = [], []
+        for i, (bug, previous) in enumerate(batch):
+            if previous and previous.get('last_comment_id'):
+                incremental.append(i)
+            else:
+                full.append(i)
+        result = [None] * len(batch)
+        if full:
+            comments = self._fetch([batch[i] for i in full])
+            for i, bug_comments in zip(full, comments):
+                result[i] = bug_comments
+        if incremental:
+            new_since = min(batch[i][1]['last_comment_time']
+                            for i in incremental)
+            comments = self._fetch([batch[i] for i in incremental], new_since)
+            for i, bug_comments in zip(incremental, comments):
+                result[i] = bug_comments
+        return result
+
 
-    def __init__(self, reporter=None, previous_bugs=None):
-        self.bugzilla = bugsy.Bugsy()
+class BugsyFinder(object):
+    def __init__(self, reporter=None, previous_bugs=None, jobs=1,
+                 batch_size=1, bugzilla_url=None, journal=None):
+        if bugzilla_url:
+            self.bugzilla = bugsy.Bugsy(bugzilla_url=bugzilla_url)
+        else:
+            self.bugzilla = bugsy.Bugsy()
         self.reporter = reporter or BugsyReporter()
         self.previous_bugs = previous_bugs
+        self.journal = journal
+        self.jobs = max(1, jobs)
+        if batch_size > 1:
+            self.comments_fetcher = BatchCommentsFetcher(self.bugzilla,
+                                                         batch_size)
+        else:
+            self.comments_fetcher = CommentsFetcher(self.bugzilla)
 
-    def _get_intermittents(self, bug):
-        intermittents = []
-        for comment in bug.get_comments():
-            intermittent = {}
-            for line in comment.text.splitlines():
-                res = self.RE_EXTRACT_BUG_INFO.match(line)
-                if not res:
-                    continue
-                key, value = res.groups()
-                intermittent[key] = value
-            if 'start_time' in intermittent:
-                intermittent['timestamp'] = intermittent.pop('start_time')
-            if 'submit_timestamp' in intermittent:
-                intermittent['timestamp'] = \
-                    intermittent.pop('submit_timestamp')
-            if len(intermittent) == 3:
-                # all intermittent info is here
-                intermittent['timestamp'] = \
-                    datetime.datetime.strptime(intermittent['timestamp'],
-                                               '%Y-%m-%dT%H:%M:%S')
-                intermittents.append(intermittent)
-        return intermittents
-
-    def find(self, days_ago=7, date_limit=None):
+    def _analyze(self, bug, previous, comments):
+        intermittents = parse_comments(comments)
+        if previous and previous.get('last_comment_id'):
+            intermittents = list(previous['intermittents']) + intermittents
+        if comments:
+            last_comment = max(comments, key=lambda c: c.id)
+            last_comment_id = last_comment.id
+            last_comment_time = last_comment.creation_time
+            if isinstance(last_comment_time, datetime.datetime):
+                last_comment_time = \
+                    last_comment_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        elif previous:
+            last_comment_id = previous.get('last_comment_id')
+            last_comment_time = previous.get('last_comment_time')
+        else:
+            last_comment_id = last_comment_time = None
+        return intermittents, last_comment_id, last_comment_time
+
+    def _analyze_batch(self, batch):
+        comments = self.comments_fetcher.get_batch_comments(batch)
+        return [self._analyze(bug, previous, bug_comments)
+                for (bug, previous), bug_comments in zip(batch, comments)]
+
+    @staticmethod
+    def _in_window(bug_dict, start_date):
+        # bugs stored without creation time are kept until a full update
+        creation_time = bug_dict.get('creation_time')
+        return not creation_time or creation_time >= str(start_date)
+
+    def find(self, days_ago=7, date_limit=None, changed_since=None):
+        """
+        Find the intermittent bugs created in the *days_ago* days before
+        *date_limit*.
+
+        If *changed_since* is given, only the bugs changed since that time
+        are requested from bugzilla and merged into the previous bugs.
+        Previous bugs created before the time window are dropped.
+        """
         if date_limit is None:
             date_limit = datetime.date.today()
         start_date = date_limit - datetime.timedelta(days=days_ago)
         self.reporter.started()
-        bugs = self.bugzilla.search_for \
-            .keywords("intermittent-failure") \
-            .change_history_fields(['[Bug creation]']) \
-            .timeframe(str(start_date), str(date_limit)) \
-            .include_fields('assigned_to', 'last_change_time') \
+        search = self.bugzilla.search_for.keywords("intermittent-failure")
+        if changed_since is None:
+            search = search.change_history_fields(['[Bug creation]']) \
+                .timeframe(str(start_date), str(date_limit))
+        else:
+            search = search.timeframe(changed_since, 'Now')
+        bugs = search \
+            .include_fields('assigned_to', 'last_change_time',
+                            'creation_time') \
             .search()
 
-        self.reporter.got_bugs(bugs)
         result = {}
-        for bug in bugs:
-            bug_dict = bug.to_dict()
-            self.reporter.bug_analysis_started(bug)
+        if changed_since is not None:
+            # changed bugs may have been created before the time window
+            bugs = [bug for bug in bugs
+                    if self._in_window(bug.to_dict(), start_date)]
+            for bugid, prev_bug in (self.previous_bugs or {}).iteritems():
+                if self._in_window(prev_bug, start_date):
+                    result[int(bugid)] = prev_bug
 
+        self.reporter.got_bugs(bugs)
+        up2date = {}
+        to_analyze = []
+        for bug in bugs:
+            prev_bug = None
             if self.previous_bugs:
                 prev_bug = self.previous_bugs.get(str(bug.id))
-                if prev_bug and (bug_dict['last_change_time'] ==
+                if prev_bug and (bug.to_dict()['last_change_time'] ==
                                  prev_bug['last_change_time']):
+                    up2date[bug.id] = prev_bug
+                    continue
+            to_analyze.append((bug, prev_bug))
+
+        # comments are fetched and parsed in worker threads, but results
+        # are consumed here in the bugs order so the reporter is only
+        # ever called from this thread, in a deterministic order.
+        batch_size = self.comments_fetcher.batch_size
+        batches = [to_analyze[i:i + batch_size]
+                   for i in range(0, len(to_analyze), batch_size)]
+        pool = None
+        if self.jobs > 1 and len(batches) > 1:
+            pool = ThreadPool(min(self.jobs, len(batches)))
+            analyzed = pool.imap(self._analyze_batch, batches)
+        else:
+            analyzed = itertools.imap(self._analyze_batch, batches)
+        analyzed = itertools.chain.from_iterable(analyzed)
+        try:
+            for bug in bugs:
+                bug_dict = bug.to_dict()
+                self.reporter.bug_analysis_started(bug)
+
+                if bug.id in up2date:
                     self.reporter.bug_already_up2date(bug)
-                    result[bug.id] = prev_bug
+                    result[bug.id] = up2date[bug.id]
                     continue
-            intermittents = self._get_intermittents(bug)
-
-            result[bug.id] = {
-                'intermittents': intermittents,
-                'status': bug.status,
-                'product': bug.product,
-                'assigned_to': bug_dict['assigned_to'],
-                'last_change_time': bug_dict['last_change_time'],
-            }
-            self.reporter.bug_analyzed(bug, intermittents)
+                intermittents, last_comment_id, last_comment_time = \
+                    next(analyzed)
+
+                result[bug.id] = {
+                    'intermittents': intermittents,
+                    'status': bug.status,
+                    'product': bug.product,
+                    'assigned_to': bug_dict['assigned_to'],
+                    'last_change_time': bug_dict['last_change_time'],
+                    'creation_time': bug_dict.get('creation_time'),
+                    'last_comment_id': last_comment_id,
+                    'last_comment_time': last_comment_time,
+                }
+                if self.journal is not None:
+                    self.journal.append(bug.id, result[bug.id])
+                self.reporter.bug_analyzed(bug, intermittents)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
         self.reporter.finished(result)
         return result
 
@@ -99,6 +275,7 @@ class BugsyPrintReporter(BugsyReporter):
     def __init__(self, stream=sys.stdout):
         self.stream = stream
         self.nb_bugs = 0
+        self.bug_ids = set()
         self.current_bug = 0
         self.upd2date = set()
 
@@ -113,6 +290,7 @@ class BugsyPrintReporter(BugsyReporter):
 
     def got_bugs(self, bugs):
         self.nb_bugs = len(bugs)
+        self.bug_ids = set(bug.id for bug in bugs)
         self.output("Found %d bugs\n", self.nb_bugs)
 
     def bug_analysis_started(self, bug):
@@ -124,6 +302,10 @@ class BugsyPrintReporter(BugsyReporter):
         self.upd2date.add(bug.id)
 
     def finished(self, result):
+        # only report on the bugs we got from bugzilla, not the ones kept
+        # from a previous update
+        result = dict((k, v) for k, v in result.iteritems()
+                      if k in self.bug_ids)
         # keep only bugs that have intermittents
         res = [k for k, v in result.iteritems() if v['intermittents']]
         # remove the bugs without intermittents from the up2date list
@@ -0,0 +1,300 @@
+"""
+Compact in-memory representation of the intermittents of a bug.
+
+Instead of one dict per intermittent, the intermittents of a bug are kept in
+parallel arrays: timestamps as seconds since epoch, and buildnames and
+revisions as ids in a string table shared by all the bugs of a store.
+"""
+
+import calendar
+import datetime
+from array import array
+from collections import defaultdict
+
+from mozbattue.parser import parse_epoch
+
+
+def to_epoch(timestamp):
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def from_epoch(seconds):
+    return datetime.datetime.utcfromtimestamp(seconds)
+
+
+class StringTable(object):
+    """
+    Map strings to ids, so repeated strings are stored only once.
+    """
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+
+    def intern(self, string):
+        try:
+            return self._ids[string]
+        except KeyError:
+            self._ids[string] = string_id = len(self.strings)
+            self.strings.append(string)
+            return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class Intermittent(object):
+    """
+    A read-only view on one intermittent, usable like the intermittent
+    dicts ('buildname', 'revision' and 'timestamp' keys).
+    """
+    __slots__ = ('intermittents', 'index')
+
+    KEYS = ('buildname', 'revision', 'timestamp')
+
+    def __init__(self, intermittents, index):
+        self.intermittents = intermittents
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'timestamp':
+            return self.intermittents.timestamp(self.index)
+        elif key == 'buildname':
+            return self.intermittents.buildname(self.index)
+        elif key == 'revision':
+            return self.intermittents.revision(self.index)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def copy(self):
+        return dict((key, self[key]) for key in self.KEYS)
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Intermittent)):
+            return all(self[key] == other[key] for key in self.KEYS)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+def accepted_indexes(buildnames, filter_intermittents):
+    """
+    Return the indexes of the *buildnames* accepted by the filter.
+
+    Filters of intermittents only depend on the buildname, so they are
+    called once per distinct buildname.
+    """
+    decisions = {}
+    indexes = []
+    for index, buildname in enumerate(buildnames):
+        accepted = decisions.get(buildname)
+        if accepted is None:
+            accepted = decisions[buildname] = \
+                bool(filter_intermittents({'buildname': buildname}))
+        if accepted:
+            indexes.append(index)
+    return indexes
+
+
+class Intermittents(object):
+    """
+    The intermittents of one bug, as parallel arrays.
+
+    This behaves like a sequence of intermittents (iterating yields
+    Intermittent views) but the accessors (timestamp(), buildname(), ...)
+    and the methods working on all the intermittents do not create any
+    per intermittent object.
+
+    *is_sorted* tells whether the intermittents are known to be ordered by
+    time, in which case they are not sorted again.
+    """
+    __slots__ = ('strings', 'timestamps', 'buildnames', 'revisions',
+                 'is_sorted')
+
+    def __init__(self, strings=None):
+        self.strings = strings if strings is not None else StringTable()
+        self.timestamps = array('l')
+        self.buildnames = array('I')
+        self.revisions = array('I')
+        self.is_sorted = True
+
+    @classmethod
+    def from_dicts(cls, intermittents, strings=None,
+                   filter_intermittents=None):
+        """
+        Create an Intermittents from intermittent dicts, where timestamps
+        are either datetime objects or strings in the json format.
+        """
+        self = cls(strings)
+        for intermittent in intermittents:
+            if filter_intermittents is not None and \
+                    not filter_intermittents(intermittent):
+                continue
+            self.append(intermittent['buildname'], intermittent['revision'],
+                        intermittent['timestamp'])
+        return self
+
+    @classmethod
+    def from_columns(cls, columns, strings=None, filter_intermittents=None):
+        """
+        Create an Intermittents from the json columns representation (see
+        to_columns), keeping only the intermittents accepted by
+        *filter_intermittents* if given.
+        """
+        self = cls(strings)
+        intern = self.strings.intern
+        timestamps = columns['timestamps']
+        buildnames = columns['buildnames']
+        revisions = columns['revisions']
+        if filter_intermittents is not None:
+            indexes = accepted_indexes(buildnames, filter_intermittents)
+            if len(indexes) < len(buildnames):
+                timestamps = [timestamps[i] for i in indexes]
+                buildnames = [buildnames[i] for i in indexes]
+                revisions = [revisions[i] for i in indexes]
+        self.timestamps.extend(timestamps)
+        self.buildnames.extend([intern(b) for b in buildnames])
+        self.revisions.extend([intern(r) for r in revisions])
+        self.is_sorted = columns.get('sorted', False)
+        return self
+
+    def to_columns(self):
+        """
+        Return a json serializable representation.
+        """
+        strings = self.strings
+        return {
+            'timestamps': self.timestamps.tolist(),
+            'buildnames': [strings[i] for i in self.buildnames],
+            'revisions': [strings[i] for i in self.revisions],
+            'sorted': self.is_sorted,
+        }
+
+    def append(self, buildname, revision, timestamp):
+        if isinstance(timestamp, basestring):
+            timestamp = parse_epoch(timestamp)
+        elif isinstance(timestamp, datetime.datetime):
+            timestamp = to_epoch(timestamp)
+        if self.is_sorted and self.timestamps and \
+                timestamp < self.timestamps[-1]:
+            self.is_sorted = False
+        self.timestamps.append(timestamp)
+        self.buildnames.append(self.strings.intern(buildname))
+        self.revisions.append(self.strings.intern(revision))
+
+    def extend(self, intermittents):
+        for intermittent in intermittents:
+            self.append(intermittent['buildname'], intermittent['revision'],
+                        intermittent['timestamp'])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        for i in xrange(len(self.timestamps)):
+            yield Intermittent(self, i)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.timestamps)
+        if not 0 <= index < len(self.timestamps):
+            raise IndexError(index)
+        return Intermittent(self, index)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, Intermittents)):
+            return len(self) == len(other) and \
+                all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return 'Intermittents(%r)' % self.to_dicts()
+
+    def timestamp(self, index):
+        return from_epoch(self.timestamps[index])
+
+    def buildname(self, index):
+        return self.strings[self.buildnames[index]]
+
+    def revision(self, index):
+        return self.strings[self.revisions[index]]
+
+    def to_dicts(self):
+        return [i.copy() for i in self]
+
+    def take(self, indexes):
+        """
+        Return a new Intermittents with the intermittents at *indexes*.
+        """
+        result = Intermittents(self.strings)
+        result.is_sorted = False
+        timestamps, buildnames, revisions = \
+            self.timestamps, self.buildnames, self.revisions
+        result.timestamps.extend(timestamps[i] for i in indexes)
+        result.buildnames.extend(buildnames[i] for i in indexes)
+        result.revisions.extend(revisions[i] for i in indexes)
+        return result
+
+    def filtered(self, filter_intermittents):
+        """
+        Return the intermittents for which filter_intermittents returns True.
+        """
+        strings = self.strings
+        result = self.take(accepted_indexes(
+            (strings[i] for i in self.buildnames), filter_intermittents))
+        result.is_sorted = self.is_sorted
+        return result
+
+    def sorted_by_time(self):
+        if self.is_sorted:
+            return self
+        timestamps = self.timestamps
+        result = self.take(sorted(xrange(len(timestamps)),
+                                  key=timestamps.__getitem__))
+        result.is_sorted = True
+        return result
+
+    def oldest_index(self):
+        """
+        Index of the oldest intermittent (the first one on ties).
+        """
+        if self.is_sorted:
+            return 0
+        timestamps = self.timestamps
+        return min(xrange(len(timestamps)), key=timestamps.__getitem__)
+
+    def newest_index(self):
+        """
+        Index of the newest intermittent (the last one on ties).
+        """
+        timestamps = self.timestamps
+        if self.is_sorted:
+            return len(timestamps) - 1
+        return max(reversed(xrange(len(timestamps))),
+                   key=timestamps.__getitem__)
+
+    def count_by_buildname(self):
+        """
+        Return a dict buildname -> number of intermittents.
+        """
+        counts = defaultdict(int)
+        for buildname_id in self.buildnames:
+            counts[buildname_id] += 1
+        return dict((self.strings[bid], count)
+                    for bid, count in counts.iteritems())
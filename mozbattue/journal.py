@@ -0,0 +1,45 @@
+"""
+On-disk journal of the bugs analyzed during an update.
+
+Each analyzed bug is appended to the journal as one json line as soon as
+it is analyzed, so an interrupted update can be resumed without asking
+bugzilla again for the bugs already done. The journal is removed once its
+content has been written to the main bug store.
+"""
+
+import json
+import os
+
+from mozbattue.utils import json_default, decode_bug, read_json_lines, \
+    open_for_append
+
+
+class Journal(object):
+    def __init__(self, path):
+        self.path = path
+        self._stream = None
+
+    def load(self):
+        """
+        Return the bugs stored in the journal, as a dict bug id -> bug data.
+        """
+        return dict((str(entry['id']), decode_bug(entry['bug']))
+                    for entry in read_json_lines(self.path))
+
+    def append(self, bugid, bug):
+        if self._stream is None:
+            self._stream = open_for_append(self.path)
+        self._stream.write(json.dumps({'id': bugid, 'bug': bug},
+                                      default=json_default))
+        self._stream.write('\n')
+        self._stream.flush()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def remove(self):
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -1,73 +1,227 @@
 import argparse
+import datetime
 import os
+import signal
 import sys
 import logging
 
-from mozbattue.utils import MozBattueError, load_bugs_from_file, dump_bugs, \
+from mozbattue.utils import MozBattueError, \
     intermittents_by_time, Config, LOG, get_default_conf_path, \
     create_filter_intermittents, intermittents_groupedby_bname, \
-    split_build_name
+    split_build_name, parse_sweep
 from mozbattue.bugs_info import BugTable, IntermittentTable, BugTableComment, \
-    IntermittentsGroupedByNameTable
-from mozbattue.find_bugs import BugsyFinder, BugsyPrintReporter
-from mozbattue.trigger import trigger_jobs
+    IntermittentsGroupedByNameTable, TriggerTable, FORMATS, parse_string_sort
+from mozbattue.bisection import Bisection, BisectionStore, TriggerBackend, \
+    estimate_failure_rate
+from mozbattue.journal import Journal
+from mozbattue.store import create_store, JsonBugStore, SqliteBugStore
+from mozbattue.server import StoreDaemon, RemoteBugStore, DaemonClient
+from mozbattue.intermittents import from_epoch
+from mozbattue.summary import with_summary
+from mozbattue.stats import STATS_COLUMNS, compute_stats
+from mozbattue.watch import watch, parse_interval
+from mozbattue.where import Comparison, parse_where, conjuncts, combine, \
+    partition, split_conditions
+
+# mozbattue.find_bugs (bugsy) and mozbattue.trigger (mozci) are only
+# imported by the commands using them, so the others start faster.
+
+# bugzilla time format used to store the last synchronization time
+SYNC_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+SYNC_OVERLAP = datetime.timedelta(minutes=10)
+# maximum number of bug ids given to the store in a condition
+MAX_PUSHED_IDS = 500
+
+
+def store_path(opts):
+    if opts.storage == 'sqlite':
+        return opts.intermittents_db_file
+    return opts.intermittents_json_file
+
+
+def open_store(opts, read_only=False):
+    """
+    Return the store of the bugs. With *read_only*, this is the store held
+    in memory by the serve command if it is running.
+    """
+    if read_only and not opts.no_daemon:
+        store = RemoteBugStore.connect(opts.serve_socket, store_path(opts))
+        if store is not None:
+            return store
+    kwargs = {}
+    if opts.storage == 'log':
+        kwargs['compaction_size'] = opts.log_compaction_size
+    return create_store(opts.storage, store_path(opts), **kwargs)
+
+
+def load_previous_bugs(store):
+    """
+    Return the stored bugs (None if there are none) and their metadata.
+    """
+    try:
+        return store.load(kept_no_intermittents=True), store.metadata()
+    except:
+        return None, {}
+
+
+def update_bugs(opts, store, finder, previous_bugs, metadata,
+                incremental=False):
+    """
+    Find the bugs with *finder*, starting from *previous_bugs*, and save
+    them in the *store*. Return the bugs and their new metadata.
+    """
+    # resume from an interrupted update: bugs found in the journal are
+    # up to date unless they changed again since.
+    journal = Journal(store.path + '.journal')
+    resumed_bugs = journal.load()
+    if resumed_bugs:
+        LOG.info("Resuming a previous update (%d bugs already analyzed)",
+                 len(resumed_bugs))
+        previous_bugs = dict(previous_bugs or {}, **resumed_bugs)
+
+    changed_since = None
+    if incremental:
+        if previous_bugs is not None and metadata.get('last_sync'):
+            # go back a bit in time so we do not miss changes made
+            # while the last update was running
+            last_sync = datetime.datetime.strptime(metadata['last_sync'],
+                                                   SYNC_TIME_FORMAT)
+            changed_since = (last_sync - SYNC_OVERLAP) \
+                .strftime(SYNC_TIME_FORMAT)
+        else:
+            LOG.warning("No previous synchronization found, running a "
+                        "full update.")
+
+    sync_time = datetime.datetime.utcnow()
+    finder.previous_bugs = previous_bugs
+    finder.journal = journal
+    try:
+        bugs = finder.find(days_ago=opts.days_ago,
+                           changed_since=changed_since)
+    finally:
+        journal.close()
+
+    metadata = {'last_sync': sync_time.strftime(SYNC_TIME_FORMAT)}
+    store.save(bugs, metadata=metadata)
+    journal.remove()
+    return bugs, metadata
+
+
+def create_finder(opts, reporter):
+    from mozbattue.find_bugs import BugsyFinder
+
+    return BugsyFinder(reporter=reporter, jobs=opts.jobs,
+                       batch_size=opts.batch_size)
 
 
 def do_update(opts):
+    from mozbattue.find_bugs import BugsyPrintReporter
+
+    store = open_store(opts)
     # load previous bugs if any
-    previous_bugs = None
-    try:
-        previous_bugs = load_bugs_from_file(opts.intermittents_json_file,
-                                            kept_no_intermittents=True)
-    except:
-        pass
+    previous_bugs, metadata = load_previous_bugs(store)
+    update_bugs(opts, store, create_finder(opts, BugsyPrintReporter()),
+                previous_bugs, metadata, incremental=opts.incremental)
 
-    finder = BugsyFinder(reporter=BugsyPrintReporter(),
-                         previous_bugs=previous_bugs)
-    bugs = finder.find(days_ago=opts.days_ago)
 
-    json_dir = os.path.dirname(opts.intermittents_json_file)
-    if not os.path.isdir(json_dir):
-        os.makedirs(json_dir)
+def do_watch(opts):
+    from mozbattue.find_bugs import BugsyReporter
 
-    with open(opts.intermittents_json_file, 'w') as f:
-        dump_bugs(bugs, f)
+    interval = parse_interval(opts.interval)
+    store = open_store(opts)
+    previous_bugs, metadata = load_previous_bugs(store)
+    # the finder is kept so its bugzilla connection is reused
+    finder = create_finder(opts, BugsyReporter())
+    state = {'metadata': metadata}
 
+    def update(bugs):
+        bugs, state['metadata'] = update_bugs(
+            opts, store, finder, bugs, state['metadata'], incremental=True)
+        return bugs
 
-def read_bugs(opts):
-    return load_bugs_from_file(
-        opts.intermittents_json_file,
-        filter_intermittents=create_filter_intermittents(
-            opts.intermittents_filter_buildname
-        )
-    )
+    watch(update, previous_bugs, interval, min_jump=opts.min_jump)
+
+
+def filter_intermittents(opts):
+    return create_filter_intermittents(opts.intermittents_filter_buildname)
+
+
+def read_bug(opts):
+    bug = open_store(opts, read_only=True).get(
+        opts.bugid, filter_intermittents=filter_intermittents(opts))
+    if bug is None:
+        sys.exit("Unable to find bug %s." % opts.bugid)
+    return bug
+
+
+def list_where(opts):
+    """
+    Return the expression selecting the bugs to list, from the display-list
+    options and --where.
+    """
+    nodes = []
+    if opts.filter_products:
+        nodes.append(Comparison('product', 'not in',
+                                tuple(sorted(opts.filter_products))))
+    if not opts.show_assigned_to:
+        nodes.append(Comparison('assigned_to', '=', 'nobody@mozilla.org'))
+    if not opts.show_resolved:
+        nodes.append(Comparison('status', '!=', 'RESOLVED'))
+    if opts.min_intermittents:
+        nodes.append(Comparison('nb', '>=', opts.min_intermittents))
+    if opts.where:
+        nodes.extend(conjuncts(parse_where(opts.where, BugTable.columns)))
+    return combine(nodes)
 
 
 def do_list(opts):
-    raw_bugs = read_bugs(opts)
-
-    def filter(bug):
-        if bug['product'] in opts.filter_products:
-            return False
-        if not opts.show_assigned_to:
-            if bug['assigned_to'] != 'nobody@mozilla.org':
-                return False
-        if not opts.show_resolved:
-            if bug['status'] == 'RESOLVED':
-                return False
-        return bug['nb'] >= opts.min_intermittents
-
-    table = BugTable(raw_bugs, opts.visible_columns)
-    table.raw_filter(filter)
+    store = open_store(opts, read_only=True)
+    filter = filter_intermittents(opts)
+    # the conditions on the bug fields are checked by the store, before
+    # reading the summaries
+    conditions, where = split_conditions(list_where(opts))
+    # the total number of bugs is counted while reading the summaries
+    totals = {} if opts.format == 'text' else None
+    raw_bugs = store.load_summaries(filter_intermittents=filter,
+                                    conditions=conditions, totals=totals)
+
+    # the statistics columns need the intermittents, so these are only
+    # loaded when the statistics are displayed or used, and only for the
+    # bugs selected by the conditions that do not need them
+    used_columns = set(opts.visible_columns) | \
+        set(k for k, _ in parse_string_sort(opts.sort_by))
+    if where is not None:
+        used_columns |= where.columns()
+    stats = None
+    if used_columns.intersection(STATS_COLUMNS):
+        before_stats, where = partition(
+            where, lambda node: not node.columns() & set(STATS_COLUMNS))
+        if before_stats is not None:
+            predicate = before_stats.compile()
+            raw_bugs = dict((row['id'], raw_bugs[row['id']])
+                            for row in BugTable(raw_bugs).data
+                            if predicate(row))
+        if len(raw_bugs) <= MAX_PUSHED_IDS:
+            conditions = conditions + [('id', 'in',
+                                        [int(bugid) for bugid in raw_bugs])]
+        bugs = store.load(filter_intermittents=filter,
+                          conditions=conditions) if raw_bugs else {}
+        stats = compute_stats(dict((bugid, bugs[bugid]['intermittents'])
+                                   for bugid in raw_bugs if bugid in bugs))
+
+    table = BugTable(raw_bugs, opts.visible_columns, stats=stats)
+    if where is not None:
+        table.raw_filter(where.compile())
     table.string_sort(opts.sort_by)
     if opts.limit > 0:
-        table.data = table.data[:opts.limit]
+        table.set_limit(opts.limit)
 
-    table.render()
+    nb_rendered = table.render(format=opts.format)
 
-    print
-    print ("Listing %d/%d intermittent bugs."
-           % (len(table.data), len(raw_bugs)))
+    if opts.format == 'text':
+        print
+        print "Listing %d/%d intermittent bugs." % (nb_rendered,
+                                                    totals['nb_bugs'])
 
 
 def do_list_colums(opts):
@@ -77,37 +231,45 @@ def do_list_colums(opts):
 
 
 def do_show(opts):
-    raw_bugs = read_bugs(opts)
-    if opts.bugid not in raw_bugs:
-        sys.exit("Unable to find bug %s." % opts.bugid)
-    intermittents = \
-        intermittents_by_time(raw_bugs[opts.bugid]['intermittents'])
-    oldest = intermittents[0]
-
-    print "Oldest intermittent on %r: %s (%s)" % (oldest['buildname'],
-                                                  oldest['timestamp'],
-                                                  oldest['revision'])
+    bug = read_bug(opts)
+    summary = with_summary(bug)['summary']
+
+    def grouped_table():
+        table = IntermittentsGroupedByNameTable()
+        for bname, entry in sorted(summary['buildnames'].iteritems(),
+                                   key=lambda item: (-item[1][0], item[0])):
+            table.add_row({'buildname': bname, 'occurences': entry[0]})
+        return table
+
+    def intermittents_table():
+        return IntermittentTable(intermittents_by_time(bug['intermittents']))
+
+    if opts.format != 'text':
+        # only one table in the machine readable formats
+        table = intermittents_table() if opts.full else grouped_table()
+        table.render(format=opts.format)
+        return
+
+    print "Oldest intermittent on %r: %s (%s)" % (
+        summary['oldest_buildname'], from_epoch(summary['oldest']),
+        summary['oldest_revision'])
     print
 
     print "buildnames by number of occurrences:"
-    table = IntermittentsGroupedByNameTable()
-    for data in intermittents_groupedby_bname(intermittents):
-        table.add_row(data)
-    table.render()
+    grouped_table().render()
 
     print
 
     if opts.full:
         print "List of intermittents:"
-        IntermittentTable(intermittents).render()
+        intermittents_table().render()
 
 
-def do_trigger(opts):
-    raw_bugs = read_bugs(opts)
-    if opts.bugid not in raw_bugs:
-        sys.exit("Unable to find bug %s." % opts.bugid)
-    intermittents = \
-        intermittents_by_time(raw_bugs[opts.bugid]['intermittents'])
+def find_trigger_target(opts, bug):
+    """
+    Return the intermittent of the bug to trigger builds from.
+    """
+    intermittents = intermittents_by_time(bug['intermittents'])
     oldest = intermittents[0]
 
     if opts.buildname:
@@ -132,11 +294,20 @@ def do_trigger(opts):
         else:
             oldest = oldest.copy()
             oldest['buildname'] = '%s test %s' % (platform_branch, test_name)
+    return oldest
+
+
+def do_trigger(opts):
+    from mozbattue.trigger import trigger_jobs, create_pushlog_cache
+
+    oldest = find_trigger_target(opts, read_bug(opts))
 
     url = trigger_jobs(oldest['buildname'],
                        oldest['revision'],
                        back_revisions=abs(opts.back_revisions),
-                       times=opts.times, dry_run=opts.dry_run)
+                       times=opts.times, dry_run=opts.dry_run,
+                       builders=open_builder_index(opts),
+                       pushlog=create_pushlog_cache(opts.pushlog_cache_file))
 
     print "Use the following treeherder url to keep track of the builds:"
     print
@@ -145,6 +316,151 @@ def do_trigger(opts):
     print 'Note that the builds on treeherder will appear in a few minutes.'
 
 
+def do_trigger_sweep(opts):
+    from mozbattue.trigger import trigger_sweep, create_pushlog_cache
+
+    oldest = find_trigger_target(opts, read_bug(opts))
+
+    results = trigger_sweep(
+        oldest['buildname'],
+        oldest['revision'],
+        back_revisions=parse_sweep(opts.sweep) if opts.sweep else (),
+        revisions=opts.revisions or (),
+        times=opts.times, dry_run=opts.dry_run,
+        builders=open_builder_index(opts),
+        pushlog=create_pushlog_cache(opts.pushlog_cache_file),
+        jobs=opts.jobs)
+    TriggerTable(results).render()
+    print
+    print 'Note that the builds on treeherder will appear in a few minutes.'
+
+
+def parse_record(value):
+    """
+    Parse the FAILURES[/RUNS] results given to the bisect command.
+    """
+    try:
+        values = [int(v) for v in value.split('/')]
+        if len(values) > 2:
+            raise ValueError
+    except ValueError:
+        raise argparse.ArgumentTypeError("should be FAILURES[/RUNS]")
+    return values[0], values[1] if len(values) == 2 else None
+
+
+def start_bisection(opts):
+    from mozbattue.trigger import resolve_buildername, find_back_revisions, \
+        create_pushlog_cache
+
+    bug = with_summary(read_bug(opts))
+    oldest = find_trigger_target(opts, bug)
+    buildname, repo_url, repo_name = resolve_buildername(
+        oldest['buildname'], builders=open_builder_index(opts))
+    revisions = find_back_revisions(
+        repo_url, oldest['revision'],
+        range(opts.max_back_revisions, -1, -1),
+        pushlog=create_pushlog_cache(opts.pushlog_cache_file))
+    failure_rate = opts.failure_rate or estimate_failure_rate(
+        bug['summary'].get('average_day'), opts.runs_per_day)
+    bisection = Bisection.start(revisions, failure_rate,
+                                confidence=opts.confidence,
+                                rounds=opts.rounds, buildname=buildname)
+    print ("Bisecting %d revisions of %s: %d runs without failure are "
+           "needed to consider a revision good (failure rate %.3f, "
+           "confidence %.2f)." % (len(revisions), buildname,
+                                  bisection.retries, failure_rate,
+                                  opts.confidence))
+    return bisection
+
+
+def do_bisect(opts):
+    bisections = BisectionStore(opts.bisect_state_file)
+    bisection = None if opts.reset else bisections.get(opts.bugid)
+    if bisection is None:
+        if opts.record:
+            raise MozBattueError("No bisection of bug %s to record results "
+                                 "for" % opts.bugid)
+        bisection = start_bisection(opts)
+    elif opts.record:
+        bisection.record(*opts.record)
+    if bisection.state['triggered'] and not bisection.finished:
+        # the runs are not triggered again while their results are missing
+        print ("Waiting for the results of the %d runs of revision %s. Give "
+               "them with --record FAILURES[/RUNS]."
+               % (bisection.state['triggered'], bisection.state['revisions'][
+                   bisection.state['current']]))
+        bisections.save(opts.bugid, bisection)
+        return
+
+    for entry in bisection.state['history']:
+        print "%(revision)s: %(failures)d failures in %(runs)d runs" % entry
+    if bisection.status == 'found':
+        print "The failure was introduced by revision %s (%d runs)." % (
+            bisection.culprit, bisection.total_runs())
+    elif bisection.status == 'out of range':
+        print ("The failure happens on the oldest revision too, bisect "
+               "with more --max-back-revisions.")
+    else:
+        from mozbattue.trigger import trigger_jobs
+
+        revision, times = bisection.next_step()
+        backend = TriggerBackend(trigger_jobs, bisection.state['buildname'],
+                                 dry_run=opts.dry_run,
+                                 builders=open_builder_index(opts))
+        url = backend.trigger(revision, times)
+        print "Triggered %d runs of revision %s:" % (times, revision)
+        print
+        print url
+        print
+        print ("When they are finished, give the number of failures with "
+               "--record FAILURES[/RUNS].")
+    bisections.save(opts.bugid, bisection)
+
+
+def open_builder_index(opts):
+    from mozbattue.trigger import create_builder_index
+
+    return create_builder_index(opts.builders_index_file,
+                                ttl=opts.builders_index_ttl)
+
+
+def do_refresh_builders(opts):
+    builders = open_builder_index(opts)
+    builders.refresh()
+    print "%d builders stored in %r." % (len(builders), builders.path)
+
+
+def do_serve(opts):
+    if opts.info:
+        client = DaemonClient.connect(opts.serve_socket)
+        if client is None:
+            raise MozBattueError("No daemon is listening on %r"
+                                 % opts.serve_socket)
+        info = client.call('info')
+        print "Daemon %d serving %d bugs from %s, loaded %d times, last " \
+            "on %s." % (info['pid'], info['nb_bugs'], info['path'],
+                        info['loads'], from_epoch(int(info['loaded'])))
+        return
+    daemon = StoreDaemon(lambda: open_store(opts), opts.serve_socket,
+                         poll_interval=opts.poll_interval)
+    daemon.bind()
+    # stop cleanly, removing the socket, when killed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    LOG.info("Listening on %r", opts.serve_socket)
+    daemon.serve_forever()
+
+
+def do_migrate(opts):
+    source = JsonBugStore(opts.json_file or opts.intermittents_json_file)
+    if not source.exists():
+        raise MozBattueError("No json data found in %r" % source.path)
+    metadata = source.metadata()
+    bugs = source.load(kept_no_intermittents=True)
+    SqliteBugStore(opts.intermittents_db_file).save(bugs, metadata=metadata)
+    print "%d bugs imported into %r." % (len(bugs),
+                                         opts.intermittents_db_file)
+
+
 def do_generate_conf(opts):
     with open(opts.conf_file, 'w') as fw:
         with open(get_default_conf_path()) as fr:
@@ -159,6 +475,9 @@ def parse_args(argv=None):
     parser.add_argument('--conf-file', default="mozbattue.ini",
                         help="path of the configuration file. (default: "
                              "%(default)r)")
+    parser.add_argument('--no-daemon', action='store_true',
+                        help="Do not read the bugs from the serve command "
+                             "even if it is running")
 
     subparsers = parser.add_subparsers()
 
@@ -174,8 +493,43 @@ def parse_args(argv=None):
                         type=int,
                         help="Number of days from now to search bugs for "
                              "(default: %(default)r)")
+    update.add_argument('-j', '--jobs',
+                        type=int,
+                        help="Number of bugs to analyze in parallel "
+                             "(default: taken from the configuration)")
+    update.add_argument('--batch-size',
+                        type=int,
+                        help="Number of bugs for which comments are "
+                             "requested in one bugzilla query "
+                             "(default: taken from the configuration)")
+    update.add_argument('-i', '--incremental', action='store_true',
+                        help="Only query bugs changed since the last "
+                             "update, and merge them into the stored ones")
     update.set_defaults(func=do_update)
 
+    watch = subparsers.add_parser(
+        'watch',
+        help="update the bugs regularly and report the changes",
+        description="Run an incremental update of the stored bugs at "
+                    "regular intervals, and write the changes after each "
+                    "update as json lines: new bugs, bugs with a jump of "
+                    "their number of intermittents, and newly resolved "
+                    "bugs."
+    )
+    watch.add_argument('--interval', default='15m',
+                       help="Time between two updates, like 90s, 15m or 2h "
+                            "(default: %(default)r)")
+    watch.add_argument('--min-jump', type=int, default=5,
+                       help="Minimum number of new intermittents of a bug "
+                            "between two updates to report it "
+                            "(default: %(default)r)")
+    watch.add_argument('-d', '--days-ago',
+                       default=27,
+                       type=int,
+                       help="Number of days from now to search bugs for "
+                            "(default: %(default)r)")
+    watch.set_defaults(func=do_watch)
+
     list = subparsers.add_parser(
         'list',
         help="list stored bugs",
@@ -188,6 +542,15 @@ def parse_args(argv=None):
                       type=int,
                       help="Limit the number of bugs shown "
                            "(default: %(default)r - no limit)")
+    list.add_argument('-w', '--where',
+                      help="Only list the bugs matching this expression, "
+                           "for example \"nb >= 10 and product != "
+                           "'Testing' and average_day > 2\". The columns "
+                           "are given by the list-columns command. This "
+                           "is combined with the display-list options "
+                           "of the configuration")
+    list.add_argument('--format', choices=FORMATS, default='text',
+                      help="Output format (default: %(default)r)")
     list.set_defaults(func=do_list)
 
     list_columns = subparsers.add_parser(
@@ -203,6 +566,11 @@ def parse_args(argv=None):
     )
     show.add_argument("-f", '--full', action='store_true',
                       help="Show all details")
+    show.add_argument('--format', choices=FORMATS, default='text',
+                      help="Output format (default: %(default)r). The "
+                           "machine readable formats only give the "
+                           "buildnames by number of occurrences, or the "
+                           "intermittents with --full")
     show.add_argument("bugid")
     show.set_defaults(func=do_show)
 
@@ -228,6 +596,122 @@ def parse_args(argv=None):
                          help="flag to test without actual push")
     trigger.set_defaults(func=do_trigger)
 
+    trigger_sweep = subparsers.add_parser(
+        'trigger-sweep',
+        help="trigger builds for several revisions",
+        description="Trigger builds for several revisions around the "
+                    "oldest one found in the intermittent bug, submitting "
+                    "them concurrently. For example, "
+                    "'%(prog)s 12345 --sweep=-30:0:5' would trigger "
+                    "builds for every 5th revision from the 30th before "
+                    "the oldest one in bug 12345 to the oldest one."
+    )
+    trigger_sweep.add_argument("bugid")
+    sweep_targets = trigger_sweep.add_mutually_exclusive_group(required=True)
+    sweep_targets.add_argument("-s", "--sweep",
+                               help="Numbers of revisions to go back, given "
+                                    "as start:stop[:step] (stop included). "
+                                    "Use the --sweep=-30:0:5 form for "
+                                    "negative numbers")
+    sweep_targets.add_argument("-r", "--revisions",
+                               type=lambda v: v.split(','),
+                               help="Comma separated list of revisions")
+    trigger_sweep.add_argument("-j", "--jobs", type=int, default=4,
+                               help="Number of builds submitted "
+                                    "concurrently (default: %(default)r)")
+    trigger_sweep.add_argument("-t", "--times", type=int,
+                               default=30,
+                               help="Number of build for each revision "
+                                    "(default: %(default)r)")
+    trigger_sweep.add_argument("-b", "--buildname",
+                               help="Specify a buildname to trigger")
+    trigger_sweep.add_argument("--dry-run", action="store_true",
+                               help="flag to test without actual push")
+    trigger_sweep.set_defaults(func=do_trigger_sweep)
+
+    bisect = subparsers.add_parser(
+        'bisect',
+        help="find the revision introducing an intermittent",
+        description="Bisect the revisions before the oldest one found in "
+                    "the intermittent bug, triggering builds until the "
+                    "revision introducing the failure is found. Each run "
+                    "of the command records the results of the previous "
+                    "builds given with --record and triggers the next "
+                    "ones; the state of the bisection is kept between "
+                    "runs. The number of builds needed to consider a "
+                    "revision good is computed from the failure rate, "
+                    "estimated from the average number of intermittents "
+                    "per day of the bug."
+    )
+    bisect.add_argument("bugid")
+    bisect.add_argument("-n", "--max-back-revisions", type=int,
+                        help="Number of revisions to bisect before the "
+                             "oldest one (default from the configuration)")
+    bisect.add_argument("-r", "--record", type=parse_record,
+                        metavar="FAILURES[/RUNS]",
+                        help="Number of failed builds of the last triggered "
+                             "revision, and optionally the number of "
+                             "finished builds (by default all of them)")
+    bisect.add_argument("--failure-rate", type=float,
+                        help="Probability of failure of one build")
+    bisect.add_argument("--runs-per-day", type=int,
+                        help="Number of builds per day, used to estimate "
+                             "the failure rate")
+    bisect.add_argument("--confidence", type=float,
+                        help="Confidence that the failure is absent from "
+                             "a revision considered good")
+    bisect.add_argument("--rounds", type=int,
+                        help="Number of steps used to trigger the builds "
+                             "of a revision, as a revision is bad as soon "
+                             "as a build fails")
+    bisect.add_argument("-b", "--buildname",
+                        help="Specify a buildname to trigger")
+    bisect.add_argument("--reset", action="store_true",
+                        help="Start the bisection again")
+    bisect.add_argument("--dry-run", action="store_true",
+                        help="flag to test without actual push")
+    bisect.set_defaults(func=do_bisect)
+
+    serve = subparsers.add_parser(
+        'serve',
+        help="keep the bugs in memory for the other commands",
+        description="Load the stored bugs once and keep them in memory, "
+                    "loading them again when the storage files change. "
+                    "While it runs, the list, show, trigger, "
+                    "trigger-sweep and bisect commands read the bugs from "
+                    "it through the serve_socket Unix socket instead of "
+                    "reading the storage files."
+    )
+    serve.add_argument('--poll-interval', type=float, default=5,
+                       help="Seconds between two checks of the storage "
+                            "files (default: %(default)r)")
+    serve.add_argument('--info', action='store_true',
+                       help="Show the state of the running daemon")
+    serve.set_defaults(func=do_serve)
+
+    refresh_builders = subparsers.add_parser(
+        'refresh-builders',
+        help="download the list of builders used by the trigger command",
+        description="The list of builders is stored locally, and only "
+                    "downloaded again when it is older than the "
+                    "builders_index_ttl configuration value. This "
+                    "downloads it now."
+    )
+    refresh_builders.set_defaults(func=do_refresh_builders)
+
+    migrate = subparsers.add_parser(
+        'migrate',
+        help="import the json data into the sqlite storage",
+        description="Import the bugs stored in the json file into the "
+                    "sqlite database. Use 'storage = sqlite' in the [data] "
+                    "section of the configuration file to use it then."
+    )
+    migrate.add_argument('--json-file',
+                         help="path of the json file to import (default: "
+                              "the intermittents_json_file configuration "
+                              "value)")
+    migrate.set_defaults(func=do_migrate)
+
     generate_conf = subparsers.add_parser(
         'generate-conf',
         help="generate the default configuration file so you can customize it",
@@ -240,7 +724,7 @@ def parse_args(argv=None):
 
 
 def main(argv=None):
-    opts = parse_args()
+    opts = parse_args(argv)
 
     logging.basicConfig(level=logging.INFO)
     logging.getLogger('requests').setLevel(logging.WARNING)
@@ -251,9 +735,22 @@ def main(argv=None):
     if os.path.isfile(opts.conf_file):
         LOG.info("Reading conf file %r", opts.conf_file)
         conf.read(opts.conf_file)
-    opts.__dict__.update(conf.as_dict())
+    # command line options take precedence over the configuration
+    for key, value in conf.as_dict().iteritems():
+        if getattr(opts, key, None) is None:
+            setattr(opts, key, value)
     opts.intermittents_json_file = \
         os.path.realpath(os.path.expanduser(opts.intermittents_json_file))
+    opts.intermittents_db_file = \
+        os.path.realpath(os.path.expanduser(opts.intermittents_db_file))
+    opts.builders_index_file = \
+        os.path.realpath(os.path.expanduser(opts.builders_index_file))
+    opts.pushlog_cache_file = \
+        os.path.realpath(os.path.expanduser(opts.pushlog_cache_file))
+    opts.bisect_state_file = \
+        os.path.realpath(os.path.expanduser(opts.bisect_state_file))
+    opts.serve_socket = \
+        os.path.realpath(os.path.expanduser(opts.serve_socket))
     try:
         opts.func(opts)
     except KeyboardInterrupt:
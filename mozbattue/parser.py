@@ -0,0 +1,105 @@
+"""
+Extraction of the intermittent data posted in bug comments.
+
+Intermittent failures are reported in bugzilla with comments like::
+
+  buildname: Ubuntu VM 12.04 mozilla-central opt test mochitest-1
+  revision: 0a5de6ad0e4e
+  start_time: 2015-04-15T03:16:25
+  submit_timestamp: 2015-04-15T03:16:32
+
+Most comments on an intermittent bug are either such reports or human
+discussion, so comments are first checked for the marker fields with cheap
+substring tests before being scanned.
+"""
+
+import calendar
+import datetime
+import re
+
+RE_INTERMITTENT_FIELD = re.compile(
+    r"^(buildname|revision|start_time|submit_timestamp): (.+?)\r?$",
+    re.MULTILINE
+)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def has_markers(text):
+    """
+    Return True if the text may contain intermittent data.
+    """
+    return ('buildname: ' in text and 'revision: ' in text and
+            ('start_time: ' in text or 'submit_timestamp: ' in text))
+
+
+def parse_timestamp(value):
+    """
+    Decode a timestamp like '2015-04-15T03:16:25'.
+
+    This is a lot faster than datetime.strptime for the expected format,
+    which is still used as a fallback for anything else.
+    """
+    if (len(value) == 19 and value[4] == '-' and value[7] == '-' and
+            value[10] == 'T' and value[13] == ':' and value[16] == ':'):
+        try:
+            return datetime.datetime(int(value[0:4]), int(value[5:7]),
+                                     int(value[8:10]), int(value[11:13]),
+                                     int(value[14:16]), int(value[17:19]))
+        except ValueError:
+            pass
+    return datetime.datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def parse_epoch(value):
+    """
+    Decode a timestamp like '2015-04-15T03:16:25' to seconds since epoch,
+    the timestamp being considered as UTC.
+    """
+    if (len(value) == 19 and value[4] == '-' and value[7] == '-' and
+            value[10] == 'T' and value[13] == ':' and value[16] == ':'):
+        try:
+            fields = (int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                      int(value[11:13]), int(value[14:16]),
+                      int(value[17:19]))
+        except ValueError:
+            pass
+        else:
+            if 1 <= fields[1] <= 12 and 1 <= fields[2] and \
+                    fields[3] < 24 and fields[4] < 60 and fields[5] < 60 \
+                    and (fields[2] <= 28 or fields[2] <= calendar.monthrange(
+                        fields[0], fields[1])[1]):
+                return calendar.timegm(fields)
+    return calendar.timegm(
+        datetime.datetime.strptime(value, TIMESTAMP_FORMAT).timetuple())
+
+
+def parse_comment(text):
+    """
+    Return the intermittent dict (buildname, revision and timestamp) found
+    in a comment text, or None.
+    """
+    if not has_markers(text):
+        return None
+    fields = dict(RE_INTERMITTENT_FIELD.findall(text))
+    timestamp = fields.get('submit_timestamp') or fields.get('start_time')
+    if timestamp is None or 'buildname' not in fields \
+            or 'revision' not in fields:
+        return None
+    return {
+        'buildname': fields['buildname'],
+        'revision': fields['revision'],
+        'timestamp': parse_timestamp(timestamp),
+    }
+
+
+def parse_comments(comments):
+    """
+    Return the list of intermittents found in the given bugsy comments.
+    """
+    intermittents = []
+    for comment in comments:
+        intermittent = parse_comment(comment.text)
+        if intermittent is not None:
+            intermittents.append(intermittent)
+    return intermittents
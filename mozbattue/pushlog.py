@@ -0,0 +1,138 @@
+"""
+Local cache of the pushlog of the repositories.
+
+Pushes never change once pushed, so the revision of each push id, and the
+push id of each revision, are kept in a json file and only asked to the
+pushlog server when unknown. Missing push ids of a range are fetched in one
+query per contiguous range.
+"""
+
+import json
+import os
+import threading
+
+from mozbattue.utils import LOG, MozBattueError, atomic_write
+
+# length of the short form of the revisions
+SHORT_REVISION = 12
+
+
+class PushlogCache(object):
+    """
+    Cache of the pushlog, stored in the json file *path* (only kept in
+    memory if *path* is None).
+
+    *query_revision_info* and *query_pushid_range* are the functions used
+    to query the pushlog server, with the signatures of the mozci ones:
+    query_revision_info(repo_url, revision) returns a dict with a 'pushid'
+    key and query_pushid_range(repo_url, start_id, end_id) returns the tip
+    revisions of the pushes, newest first.
+    """
+    def __init__(self, path, query_revision_info, query_pushid_range):
+        self.path = path
+        self.query_revision_info = query_revision_info
+        self.query_pushid_range = query_pushid_range
+        self._repos = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._repos is None:
+            self._repos = {}
+            if self.path is not None and os.path.isfile(self.path):
+                try:
+                    with open(self.path) as f:
+                        self._repos = json.load(f)['repos']
+                except (IOError, ValueError, KeyError), exc:
+                    LOG.warning("Ignoring the pushlog cache %r: %s",
+                                self.path, exc)
+        return self._repos
+
+    def _save(self):
+        if self.path is None:
+            return
+        with atomic_write(self.path) as f:
+            json.dump({'repos': self._repos}, f, separators=(',', ':'))
+
+    def _repo(self, repo_url):
+        return self._load().setdefault(repo_url,
+                                       {'pushes': {}, 'revisions': {}})
+
+    @staticmethod
+    def _add_revision(repo, revision, pushid):
+        repo['revisions'][revision] = pushid
+        repo['revisions'][revision[:SHORT_REVISION]] = pushid
+
+    def pushid(self, repo_url, revision):
+        """
+        Return the push id (an int) of a revision.
+        """
+        with self._lock:
+            repo = self._repo(repo_url)
+            pushid = repo['revisions'].get(revision)
+            if pushid is None:
+                pushid = int(self.query_revision_info(repo_url,
+                                                      revision)['pushid'])
+                self._add_revision(repo, revision, pushid)
+                self._save()
+            return pushid
+
+    def revisions(self, repo_url, start_id, end_id):
+        """
+        Return the tip revisions of the pushes from *start_id* to *end_id*
+        (included), newest first, like query_pushid_range.
+        """
+        with self._lock:
+            repo = self._repo(repo_url)
+            pushes = repo['pushes']
+            missing = [i for i in xrange(start_id, end_id + 1)
+                       if str(i) not in pushes]
+            fetched = False
+            for first, last in contiguous_ranges(missing):
+                revisions = self.query_pushid_range(repo_url=repo_url,
+                                                    start_id=first,
+                                                    end_id=last)
+                if len(revisions) != last - first + 1:
+                    # some push ids do not exist, we can not tell which
+                    LOG.debug("Not caching the pushes %d to %d of %s",
+                              first, last, repo_url)
+                    return self.query_pushid_range(repo_url=repo_url,
+                                                   start_id=start_id,
+                                                   end_id=end_id)
+                for pushid, revision in zip(xrange(last, first - 1, -1),
+                                            revisions):
+                    pushes[str(pushid)] = revision
+                    self._add_revision(repo, revision, pushid)
+                fetched = True
+            if fetched:
+                self._save()
+            return [pushes[str(i)] for i in xrange(end_id, start_id - 1, -1)]
+
+    def back_revisions(self, repo_url, revision, back_revisions):
+        """
+        Return the revisions pushed the numbers of *back_revisions* (a list
+        of positive int) before *revision*, with a single push range query.
+        """
+        end_id = self.pushid(repo_url, revision)  # newest revision
+        start_id = end_id - max(back_revisions)
+        revlist = self.revisions(repo_url, start_id, end_id)  # newest first
+        missing = [back for back in back_revisions if back >= len(revlist)]
+        if missing:
+            raise MozBattueError(
+                "Unable to find the revisions %d to %d before %s: the "
+                "pushlog of %s only has %d of them"
+                % (min(missing), max(missing), revision, repo_url,
+                   len(revlist) - 1))
+        return [revlist[back] for back in back_revisions]
+
+
+def contiguous_ranges(ids):
+    """
+    Return the list of (first, last) ranges of the sorted *ids*.
+    """
+    ranges = []
+    for i in ids:
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return [tuple(r) for r in ranges]
@@ -0,0 +1,320 @@
+"""
+Resident daemon keeping the bugs store in memory.
+
+The serve command loads the store once and answers the queries of the
+read only commands (list, show, ...) on a Unix socket, so they do not read
+the store files again. The store files are watched, and the store is
+loaded again when they change.
+
+The protocol is one json object per line: a request
+{"method": ..., "params": {...}} is answered with {"result": ...} or
+{"error": "message"}. The methods are the read methods of the stores
+(load, load_summaries, get, count and metadata) and info.
+"""
+
+import json
+import os
+import socket
+import SocketServer
+import threading
+import time
+
+from mozbattue.store import MemoryBugStore
+from mozbattue.utils import LOG, MozBattueError, IntermittentFilter, \
+    encode_bug, decode_bug, json_default
+
+PROTOCOL_VERSION = 2
+
+
+def encode_filter(filter_intermittents):
+    if filter_intermittents is None:
+        return None
+    return [regex.pattern for regex in filter_intermittents.regexes]
+
+
+def decode_filter(patterns):
+    if patterns is None:
+        return None
+    filter_intermittents = IntermittentFilter()
+    for pattern in patterns:
+        filter_intermittents.add_filter_regex(pattern)
+    return filter_intermittents
+
+
+def files_signature(store):
+    """
+    Return the size and modification time of the files of a store.
+    """
+    signature = []
+    for path in (store.path, getattr(store, 'log_path', None)):
+        if path is not None and os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((path, stat.st_size, stat.st_mtime))
+    return signature
+
+
+class StoreWatcher(object):
+    """
+    Keep a MemoryBugStore of the store returned by *open_store*, loaded
+    again when the files of the store change.
+    """
+    def __init__(self, open_store):
+        self.open_store = open_store
+        self.loaded = None
+        self.loads = 0
+        self._memory = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        with self._lock:
+            store = self.open_store()
+            if not store.exists():
+                raise MozBattueError("No bugs stored in %r, run the update "
+                                     "command first" % store.path)
+            signature = files_signature(store)
+            if self._memory is None or signature != self._signature:
+                LOG.info("Loading the bugs from %r", store.path)
+                # a change while loading is seen at the next call
+                self._memory = MemoryBugStore(store)
+                self._signature = signature
+                self.loaded = time.time()
+                self.loads += 1
+            return self._memory
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            try:
+                request = json.loads(line)
+                response = {'result': self.server.daemon.call(
+                    request['method'], request.get('params') or {})}
+            except MozBattueError, exc:
+                response = {'error': str(exc)}
+            except Exception, exc:
+                LOG.exception("Error while answering %r", line)
+                response = {'error': "Internal error: %s" % exc}
+            self.wfile.write(json.dumps(response, separators=(',', ':'),
+                                        default=json_default))
+            self.wfile.write('\n')
+            self.wfile.flush()
+
+
+class UnixServer(SocketServer.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class StoreDaemon(object):
+    """
+    Answer the queries on the store returned by *open_store* on the Unix
+    socket *socket_path*. The store files are checked for changes before
+    each query, and every *poll_interval* seconds.
+    """
+    def __init__(self, open_store, socket_path, poll_interval=5):
+        self.watcher = StoreWatcher(open_store)
+        self.socket_path = socket_path
+        self.poll_interval = poll_interval
+        self.server = None
+        self._filters = {}
+        self._stopped = threading.Event()
+
+    def _filter(self, patterns):
+        if patterns is None:
+            return None
+        key = tuple(patterns)
+        if key not in self._filters:
+            # filters are kept as they memoize the accepted buildnames
+            self._filters[key] = decode_filter(patterns)
+        return self._filters[key]
+
+    def call(self, method, params):
+        store = self.watcher.current()
+        conditions = [tuple(c) for c in params.get('conditions', ())]
+        filter_intermittents = self._filter(params.get('filter'))
+        if method == 'info':
+            return {
+                'version': PROTOCOL_VERSION,
+                'pid': os.getpid(),
+                'path': store.path,
+                'nb_bugs': len(store),
+                'loaded': self.watcher.loaded,
+                'loads': self.watcher.loads,
+            }
+        elif method == 'load':
+            bugs = store.load(
+                kept_no_intermittents=params.get('kept_no_intermittents',
+                                                 False),
+                filter_intermittents=filter_intermittents,
+                conditions=conditions)
+            return dict((bugid, encode_bug(bug))
+                        for bugid, bug in bugs.iteritems())
+        elif method == 'load_summaries':
+            totals = {} if params.get('totals') else None
+            summaries = store.load_summaries(
+                filter_intermittents=filter_intermittents,
+                conditions=conditions, totals=totals)
+            return {'summaries': summaries, 'totals': totals}
+        elif method == 'get':
+            bug = store.get(params['bugid'],
+                            filter_intermittents=filter_intermittents)
+            return None if bug is None else encode_bug(bug)
+        elif method == 'count':
+            return store.count(filter_intermittents=filter_intermittents)
+        elif method == 'metadata':
+            return store.metadata()
+        raise MozBattueError("Unknown method %r" % method)
+
+    def bind(self):
+        """
+        Load the store and listen on the socket.
+        """
+        if os.path.exists(self.socket_path):
+            client = DaemonClient.connect(self.socket_path)
+            if client is not None:
+                client.close()
+                raise MozBattueError("A daemon is already listening on %r"
+                                     % self.socket_path)
+            # left by a daemon that did not stop cleanly
+            os.remove(self.socket_path)
+        dirname = os.path.dirname(self.socket_path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.watcher.current()
+        self.server = UnixServer(self.socket_path, RequestHandler)
+        self.server.daemon = self
+        os.chmod(self.socket_path, 0600)
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.watcher.current()
+            except Exception:
+                LOG.exception("Unable to load the bugs")
+
+    def serve_forever(self):
+        if self.server is None:
+            self.bind()
+        poller = threading.Thread(target=self._poll)
+        poller.daemon = True
+        poller.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self._stopped.set()
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class DaemonClient(object):
+    """
+    Connection to a StoreDaemon.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self._file = sock.makefile('rw')
+
+    @classmethod
+    def connect(cls, socket_path):
+        """
+        Return a client connected to the daemon listening on
+        *socket_path*, or None if there is none.
+        """
+        if not os.path.exists(socket_path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except socket.error:
+            sock.close()
+            return None
+        return cls(sock)
+
+    def call(self, method, **params):
+        self._file.write(json.dumps({'method': method, 'params': params},
+                                    separators=(',', ':')))
+        self._file.write('\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise MozBattueError("The daemon closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise MozBattueError(response['error'])
+        return response['result']
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+
+class RemoteBugStore(object):
+    """
+    Read only store asking its bugs to a StoreDaemon.
+    """
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+
+    @classmethod
+    def connect(cls, socket_path, path):
+        """
+        Return a RemoteBugStore if a daemon listening on *socket_path*
+        serves the store of *path*, else None.
+        """
+        client = DaemonClient.connect(socket_path)
+        if client is None:
+            return None
+        try:
+            info = client.call('info')
+        except (MozBattueError, socket.error, ValueError), exc:
+            LOG.debug("Not using the daemon on %r: %s", socket_path, exc)
+            client.close()
+            return None
+        if info.get('version') != PROTOCOL_VERSION or info['path'] != path:
+            LOG.debug("The daemon on %r does not serve %r", socket_path, path)
+            client.close()
+            return None
+        return cls(client, path)
+
+    def exists(self):
+        return True
+
+    def metadata(self):
+        return self.client.call('metadata')
+
+    def load(self, kept_no_intermittents=False, filter_intermittents=None,
+             conditions=()):
+        bugs = self.client.call('load',
+                                kept_no_intermittents=kept_no_intermittents,
+                                filter=encode_filter(filter_intermittents),
+                                conditions=list(conditions))
+        for bug in bugs.itervalues():
+            decode_bug(bug)
+        return bugs
+
+    def get(self, bugid, filter_intermittents=None):
+        bug = self.client.call('get', bugid=str(bugid),
+                               filter=encode_filter(filter_intermittents))
+        return None if bug is None else decode_bug(bug)
+
+    def load_summaries(self, filter_intermittents=None, conditions=(),
+                       totals=None):
+        result = self.client.call('load_summaries',
+                                  filter=encode_filter(filter_intermittents),
+                                  conditions=list(conditions),
+                                  totals=totals is not None)
+        if totals is not None:
+            totals.update(result['totals'])
+        return result['summaries']
+
+    def count(self, filter_intermittents=None):
+        return self.client.call('count',
+                                filter=encode_filter(filter_intermittents))
+
+    def save(self, bugs, metadata=None):
+        raise MozBattueError("The bugs can not be saved through the daemon")
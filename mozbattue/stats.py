@@ -0,0 +1,131 @@
+"""
+Statistics on the intermittents occurrences of the bugs.
+
+The statistics of all the bugs are computed at once with numpy, over the
+timestamps of all the intermittents. numpy is optional: without it, the
+same statistics are computed in pure python, one bug at a time. It is only
+imported when the statistics are computed, as it is slow to import.
+"""
+
+import time
+from array import array
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+
+STATS_COLUMNS = ('last_24h', 'last_7d', 'median_gap', 'wow_growth')
+
+
+def import_numpy():
+    """
+    Return the numpy module, or None if it is not installed.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def compute_stats(intermittents_by_bug, now=None):
+    """
+    Return a dict bug id -> statistics from a dict bug id -> Intermittents.
+
+    The statistics are a dict with the STATS_COLUMNS keys:
+
+     - 'last_24h' and 'last_7d': numbers of occurrences since *now* (epoch
+       seconds, defaults to the current time) minus one day / one week
+     - 'median_gap': median time between two successive occurrences, in
+       hours, or None if there are less than two occurrences
+     - 'wow_growth': relative growth of the number of occurrences in the
+       last week compared to the week before, or None if there was none
+       the week before
+    """
+    if now is None:
+        now = time.time()
+    bugids = list(intermittents_by_bug)
+    timestamps = [intermittents_by_bug[bugid].timestamps for bugid in bugids]
+    if import_numpy() is None:
+        stats = [python_stats(ts, now) for ts in timestamps]
+    else:
+        stats = numpy_stats(timestamps, now)
+    return dict(zip(bugids, stats))
+
+
+def make_stats(last_24h, last_7d, previous_week, median_gap):
+    return {
+        'last_24h': last_24h,
+        'last_7d': last_7d,
+        'median_gap': median_gap,
+        'wow_growth': (float(last_7d - previous_week) / previous_week
+                       if previous_week else None),
+    }
+
+
+def python_stats(timestamps, now):
+    """
+    Return the statistics of one bug, from its timestamps.
+    """
+    timestamps = sorted(timestamps)
+    last_24h = sum(1 for t in timestamps if t >= now - DAY)
+    last_7d = sum(1 for t in timestamps if t >= now - WEEK)
+    previous_week = sum(1 for t in timestamps
+                        if now - 2 * WEEK <= t < now - WEEK)
+    gaps = sorted(b - a for a, b in zip(timestamps, timestamps[1:]))
+    median_gap = None
+    if gaps:
+        median_gap = (gaps[(len(gaps) - 1) // 2] +
+                      gaps[len(gaps) // 2]) / 2.0 / 3600
+    return make_stats(last_24h, last_7d, previous_week, median_gap)
+
+
+def numpy_stats(timestamps_by_bug, now):
+    """
+    Return the list of statistics of the bugs, from the list of their
+    timestamps arrays, in one vectorized pass.
+    """
+    import numpy
+
+    nb_bugs = len(timestamps_by_bug)
+    if not nb_bugs:
+        return []
+    lengths = numpy.array([len(ts) for ts in timestamps_by_bug],
+                          dtype=numpy.int64)
+    all_timestamps = array('l')
+    for ts in timestamps_by_bug:
+        all_timestamps.extend(ts)
+    if all_timestamps:
+        # use the array buffer, without converting each item
+        timestamps = numpy.frombuffer(all_timestamps, dtype=numpy.int_)
+    else:
+        timestamps = numpy.zeros(0, dtype=numpy.int_)
+    timestamps = timestamps.astype(numpy.int64)
+    bug_index = numpy.repeat(numpy.arange(nb_bugs), lengths)
+    # sort by time in each bug, bugs stay grouped
+    timestamps = timestamps[numpy.lexsort((timestamps, bug_index))]
+
+    def count(mask):
+        return numpy.bincount(bug_index[mask], minlength=nb_bugs)
+
+    last_24h = count(timestamps >= now - DAY)
+    last_7d = count(timestamps >= now - WEEK)
+    previous_week = count((timestamps >= now - 2 * WEEK) &
+                          (timestamps < now - WEEK))
+
+    # gaps between successive occurrences of the same bug
+    same_bug = bug_index[1:] == bug_index[:-1]
+    gaps = numpy.diff(timestamps)[same_bug]
+    gap_bug_index = bug_index[1:][same_bug]
+    gaps = gaps[numpy.lexsort((gaps, gap_bug_index))]
+    nb_gaps = numpy.bincount(gap_bug_index, minlength=nb_bugs)
+    starts = numpy.cumsum(nb_gaps) - nb_gaps
+    has_gaps = nb_gaps > 0
+    median_gaps = numpy.zeros(nb_bugs)
+    median_gaps[has_gaps] = (
+        gaps[(starts + (nb_gaps - 1) // 2)[has_gaps]] +
+        gaps[(starts + nb_gaps // 2)[has_gaps]]) / 2.0 / 3600
+
+    return [make_stats(int(last_24h[i]), int(last_7d[i]),
+                       int(previous_week[i]),
+                       float(median_gaps[i]) if has_gaps[i] else None)
+            for i in xrange(nb_bugs)]
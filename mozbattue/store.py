@@ -0,0 +1,628 @@
+"""
+Storage backends for the bugs data.
+
+A store keeps the bugs found by the update command, as a dict of
+bug id (a string) -> bug data, where the bug data is a dict with the
+'status', 'product', 'assigned_to', ... keys and the 'intermittents' list.
+
+The stores also keep a summary of the intermittents of each bug (see
+mozbattue.summary), computed when a new or changed bug is saved.
+load_summaries() returns the bugs with their summary but without their
+intermittents, which is all that listing the bugs needs.
+
+Three backends are available:
+
+ - JsonBugStore, one json file (the default)
+ - LogBugStore, a json snapshot plus an append-only log of changes
+ - SqliteBugStore, an sqlite database with indexed bugs and intermittents
+
+MemoryBugStore keeps a copy of another store in memory, for the serve
+command.
+"""
+
+import json
+import os
+import sqlite3
+
+from mozbattue.utils import MozBattueError, load_bugs_from_file, \
+    dump_bugs, decode_bug, encode_bug, DATETIME_FORMAT, JSON_FORMAT_VERSION, \
+    LOG, atomic_write, read_json_lines, open_for_append
+from mozbattue.intermittents import Intermittents, StringTable
+from mozbattue.summary import filter_summary, summary_record, with_summary
+
+# bug fields that can be used in conditions
+CONDITION_COLUMNS = ('id', 'status', 'product', 'assigned_to')
+
+CONDITION_OPERATORS = {
+    '=': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+    'not in': lambda a, b: a not in b,
+}
+
+
+def check_conditions(conditions):
+    for column, op, value in conditions:
+        if column not in CONDITION_COLUMNS:
+            raise MozBattueError("Unable to filter bugs on %r" % column)
+        if op not in CONDITION_OPERATORS:
+            raise MozBattueError("Unknown operator %r" % op)
+
+
+def match_conditions(bugid, bug, conditions):
+    """
+    Return True if the bug matches all the conditions, a list of
+    (column, operator, value) tuples.
+    """
+    for column, op, value in conditions:
+        bug_value = int(bugid) if column == 'id' else bug[column]
+        if not CONDITION_OPERATORS[op](bug_value, value):
+            return False
+    return True
+
+
+def filtered_bug(bug, filter_intermittents):
+    if filter_intermittents is None:
+        return bug
+    bug = dict(bug, intermittents=bug['intermittents'].filtered(
+        filter_intermittents))
+    if 'summary' in bug:
+        bug['summary'] = filter_summary(bug['summary'], filter_intermittents)
+    return bug
+
+
+def filtered_summaries(records, filter_intermittents, conditions,
+                       totals=None):
+    """
+    Return the summary records (see summary_record) matching the
+    *conditions*, with their summary filtered by *filter_intermittents*.
+    Bugs without intermittents are dropped.
+
+    If *totals* is given, it is updated with 'nb_bugs', the number of bugs
+    with intermittents whether they match the conditions or not.
+    """
+    check_conditions(conditions)
+    bugs = {}
+    nb_bugs = 0
+    for bugid, record in records:
+        matched = not conditions or match_conditions(bugid, record,
+                                                     conditions)
+        if not matched and totals is None:
+            continue
+        summary = filter_summary(record['summary'], filter_intermittents)
+        if summary['nb']:
+            nb_bugs += 1
+            if matched:
+                bugs[bugid] = dict(record, summary=summary)
+    if totals is not None:
+        totals['nb_bugs'] = nb_bugs
+    return bugs
+
+
+class JsonBugStore(object):
+    """
+    Store the bugs in a json file.
+
+    The file is parsed once, on first access. Two files are kept next to
+    it: an index giving the position of each bug in the json file, so a
+    single bug can be read without parsing the whole file, and the summary
+    records of the bugs, so they can be listed without reading their
+    intermittents.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.summary_path = path + '.summary'
+        self._bugs = None
+        self._metadata = {}
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime]
+
+    def _read_sidecar(self, path):
+        """
+        Return the bugs data of a file written by _write_sidecar, or None
+        if it does not exist or is not up to date with the json file.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data['version'] == JSON_FORMAT_VERSION and \
+                    data['signature'] == self._file_signature():
+                return data['bugs']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _write_sidecar(self, path, bugs_data):
+        with atomic_write(path) as f:
+            json.dump({'version': JSON_FORMAT_VERSION,
+                       'signature': self._file_signature(),
+                       'bugs': bugs_data}, f, separators=(',', ':'))
+
+    def _read_index(self):
+        """
+        Return the dict bug id -> (offset, length), or None if there is no
+        up to date index.
+        """
+        return self._read_sidecar(self.index_path)
+
+    def _write_index(self, bugs_index):
+        self._write_sidecar(self.index_path, bugs_index)
+
+    def _summary_records(self):
+        """
+        Return the dict bug id -> summary record.
+        """
+        if self._bugs is None:
+            records = self._read_sidecar(self.summary_path)
+            if records is not None:
+                return records
+        return dict((bugid, summary_record(bug))
+                    for bugid, bug in self._load().iteritems())
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _load(self):
+        if self._bugs is None:
+            metadata = {}
+            bugs = load_bugs_from_file(self.path, kept_no_intermittents=True,
+                                       metadata=metadata)
+            version = metadata.pop('version')
+            if version != JSON_FORMAT_VERSION:
+                self._migrate(bugs, metadata, version)
+            self._bugs, self._metadata = bugs, metadata
+        return self._bugs
+
+    def _migrate(self, bugs, metadata, version):
+        LOG.info("Migrating %r from format %s to %s", self.path, version,
+                 JSON_FORMAT_VERSION)
+        try:
+            self._write_snapshot(bugs, metadata)
+        except (IOError, OSError), exc:
+            LOG.warning("Unable to migrate %r: %s", self.path, exc)
+
+    def metadata(self):
+        self._load()
+        return dict(self._metadata)
+
+    def load(self, kept_no_intermittents=False, filter_intermittents=None,
+             conditions=()):
+        """
+        Return the bugs matching the *conditions*, with their intermittents
+        filtered by *filter_intermittents*.
+
+        Bugs without intermittents are dropped unless
+        *kept_no_intermittents* is True.
+        """
+        check_conditions(conditions)
+        bugs = {}
+        for bugid, bug in self._load().iteritems():
+            if conditions and not match_conditions(bugid, bug, conditions):
+                continue
+            bug = filtered_bug(bug, filter_intermittents)
+            if bug['intermittents'] or kept_no_intermittents:
+                bugs[bugid] = bug
+        return bugs
+
+    def _get_indexed(self, bugid):
+        index = self._read_index()
+        if index is None:
+            return self._load().get(bugid)
+        if bugid not in index:
+            return None
+        offset, length = index[bugid]
+        with open(self.path) as f:
+            f.seek(offset)
+            return decode_bug(json.loads(f.read(length)))
+
+    def get(self, bugid, filter_intermittents=None):
+        """
+        Return one bug, or None if it is unknown or has no intermittents.
+        """
+        if self._bugs is not None:
+            bug = self._bugs.get(str(bugid))
+        else:
+            bug = self._get_indexed(str(bugid))
+        if bug is None:
+            return None
+        bug = filtered_bug(bug, filter_intermittents)
+        return bug if bug['intermittents'] else None
+
+    def load_summaries(self, filter_intermittents=None, conditions=(),
+                       totals=None):
+        """
+        Return the bugs with intermittents matching the *conditions*, with
+        the summary of their intermittents filtered by
+        *filter_intermittents*, but without the intermittents themselves.
+
+        If *totals* is given, it is updated with 'nb_bugs', the number of
+        bugs with intermittents (the count() result), computed in the same
+        pass.
+        """
+        return filtered_summaries(self._summary_records().iteritems(),
+                                  filter_intermittents, conditions, totals)
+
+    def count(self, filter_intermittents=None):
+        """
+        Return the number of bugs with intermittents.
+        """
+        return len(self.load_summaries(
+            filter_intermittents=filter_intermittents))
+
+    def save(self, bugs, metadata=None):
+        """
+        Replace the stored bugs. This is atomic: a crash while writing
+        leaves the previous data untouched.
+        """
+        self._write_snapshot(bugs, metadata)
+
+    def _write_snapshot(self, bugs, metadata):
+        bugs = dict((str(bugid), with_summary(bug))
+                    for bugid, bug in bugs.iteritems())
+        with atomic_write(self.path) as f:
+            bugs_index = dump_bugs(bugs, f, metadata=metadata)
+        self._write_index(bugs_index)
+        self._write_sidecar(self.summary_path, dict(
+            (bugid, summary_record(bug)) for bugid, bug in bugs.iteritems()))
+        self._bugs = None
+        self._metadata = {}
+
+
+class LogBugStore(JsonBugStore):
+    """
+    Store the bugs in a json snapshot plus an append-only change log.
+
+    Saving only appends the bugs that changed (and the removed ones) to the
+    log, instead of rewriting everything. Readers replay the log on top of
+    the snapshot. Once the log is bigger than *compaction_size* bytes, it
+    is folded into a new snapshot, which atomically replaces the previous
+    one before the log is removed. Log records hold the full state of a
+    bug, so replaying a log over a snapshot it was already folded into
+    (after a crash) is harmless.
+    """
+    def __init__(self, path, compaction_size=1024 * 1024):
+        JsonBugStore.__init__(self, path)
+        self.log_path = path + '.log'
+        self.compaction_size = compaction_size
+
+    def exists(self):
+        return os.path.isfile(self.path) or os.path.isfile(self.log_path)
+
+    def _load(self):
+        if self._bugs is None:
+            if os.path.isfile(self.path):
+                JsonBugStore._load(self)
+            elif os.path.isfile(self.log_path):
+                self._bugs, self._metadata = {}, {}
+            else:
+                raise MozBattueError("Unable to load bug data from %r: no "
+                                     "snapshot nor log found" % self.path)
+            strings = StringTable()
+            for record in read_json_lines(self.log_path):
+                if 'metadata' in record:
+                    self._metadata = record['metadata']
+                elif record.get('deleted'):
+                    self._bugs.pop(record['id'], None)
+                else:
+                    self._bugs[record['id']] = decode_bug(record['bug'],
+                                                          strings)
+        return self._bugs
+
+    def get(self, bugid, filter_intermittents=None):
+        if self._bugs is None and os.path.isfile(self.log_path):
+            # the last record about this bug in the log wins
+            record = None
+            for rec in read_json_lines(self.log_path):
+                if rec.get('id') == str(bugid):
+                    record = rec
+            if record is not None:
+                if record.get('deleted'):
+                    return None
+                bug = filtered_bug(decode_bug(record['bug']),
+                                   filter_intermittents)
+                return bug if bug['intermittents'] else None
+        return JsonBugStore.get(self, bugid,
+                                filter_intermittents=filter_intermittents)
+
+    def _summary_records(self):
+        if self._bugs is not None or not os.path.isfile(self.path):
+            return JsonBugStore._summary_records(self)
+        records = JsonBugStore._summary_records(self)
+        for record in read_json_lines(self.log_path):
+            if 'metadata' in record:
+                continue
+            elif record.get('deleted'):
+                records.pop(record['id'], None)
+            else:
+                records[record['id']] = summary_record(record['bug'])
+        return records
+
+    def save(self, bugs, metadata=None):
+        """
+        Append the changes between the stored bugs and *bugs* to the log.
+        """
+        current, current_metadata = {}, {}
+        if self.exists():
+            current, current_metadata = self._load(), self._metadata
+        records = []
+        bugs = dict((str(bugid), bug) for bugid, bug in bugs.iteritems())
+        for bugid, bug in bugs.iteritems():
+            encoded = encode_bug(bug)
+            if bugid not in current or \
+                    encode_bug(current[bugid]) != encoded:
+                records.append({'id': bugid, 'bug': encoded})
+        for bugid in current:
+            if bugid not in bugs:
+                records.append({'id': bugid, 'deleted': True})
+        if (metadata or {}) != current_metadata:
+            records.append({'metadata': metadata or {}})
+
+        if records:
+            with open_for_append(self.log_path) as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(',', ':')))
+                    f.write('\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._bugs = None
+            self._metadata = {}
+
+        if os.path.isfile(self.log_path) and \
+                os.path.getsize(self.log_path) > self.compaction_size:
+            self.compact()
+
+    def compact(self):
+        """
+        Fold the log into a new snapshot.
+        """
+        bugs = self._load()
+        self._write_snapshot(bugs, self._metadata)
+        if os.path.isfile(self.log_path):
+            os.remove(self.log_path)
+
+
+class SqliteBugStore(object):
+    """
+    Store the bugs in an sqlite database.
+
+    Intermittents are indexed by bug id, buildname, revision and timestamp,
+    so that one bug can be read without loading the others.
+    """
+    BUG_FIELDS = ('status', 'product', 'assigned_to', 'last_change_time',
+                  'creation_time', 'last_comment_id', 'last_comment_time')
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS metadata (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS bugs (
+        id INTEGER PRIMARY KEY,
+        status TEXT,
+        product TEXT,
+        assigned_to TEXT,
+        last_change_time TEXT,
+        creation_time TEXT,
+        last_comment_id INTEGER,
+        last_comment_time TEXT,
+        summary TEXT
+    );
+    CREATE TABLE IF NOT EXISTS intermittents (
+        bug_id INTEGER NOT NULL REFERENCES bugs(id),
+        buildname TEXT NOT NULL,
+        revision TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS intermittents_bug_id_idx
+        ON intermittents(bug_id);
+    CREATE INDEX IF NOT EXISTS intermittents_buildname_idx
+        ON intermittents(buildname);
+    CREATE INDEX IF NOT EXISTS intermittents_revision_idx
+        ON intermittents(revision);
+    CREATE INDEX IF NOT EXISTS intermittents_timestamp_idx
+        ON intermittents(timestamp);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(self.SCHEMA)
+            columns = [row[1] for row in
+                       self._conn.execute("PRAGMA table_info(bugs)")]
+            if 'summary' not in columns:
+                # database created before the summaries were stored
+                self._conn.execute("ALTER TABLE bugs ADD COLUMN summary TEXT")
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def metadata(self):
+        return dict(self.conn.execute("SELECT key, value FROM metadata"))
+
+    def _where(self, conditions):
+        check_conditions(conditions)
+        clauses, params = [], []
+        for column, op, value in conditions:
+            if op in ('in', 'not in'):
+                value = list(value)
+                clauses.append('%s %s (%s)' % (column, op.upper(),
+                                               ', '.join('?' * len(value))))
+                params.extend(value)
+            else:
+                clauses.append('%s %s ?' % (column, op))
+                params.append(value)
+        if not clauses:
+            return '', []
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def _select_bugs(self, where, params):
+        return self.conn.execute(
+            "SELECT id, %s, summary FROM bugs%s"
+            % (', '.join(self.BUG_FIELDS), where), params)
+
+    def _bug_from_row(self, row):
+        bug = dict(zip(self.BUG_FIELDS, row[1:-1]))
+        if row[-1] is not None:
+            bug['summary'] = json.loads(row[-1])
+        return str(row[0]), bug
+
+    def load(self, kept_no_intermittents=False, filter_intermittents=None,
+             conditions=()):
+        """
+        Same as JsonBugStore.load. The conditions are evaluated by sqlite.
+        """
+        where, params = self._where(conditions)
+        strings = StringTable()
+        bugs = dict(self._bug_from_row(row)
+                    for row in self._select_bugs(where, params))
+        for bug in bugs.itervalues():
+            bug['intermittents'] = Intermittents(strings)
+        query = ("SELECT bug_id, buildname, revision, timestamp "
+                 "FROM intermittents")
+        if conditions:
+            query += (" WHERE bug_id IN (SELECT id FROM bugs%s)" % where)
+        for bugid, buildname, revision, timestamp in \
+                self.conn.execute(query + " ORDER BY rowid", params):
+            bugs[str(bugid)]['intermittents'].append(buildname, revision,
+                                                     timestamp)
+        for bugid, bug in bugs.iteritems():
+            if filter_intermittents:
+                bugs[bugid] = filtered_bug(bug, filter_intermittents)
+        if not kept_no_intermittents:
+            for bugid, bug in bugs.items():
+                if not bug['intermittents']:
+                    del bugs[bugid]
+        return bugs
+
+    def get(self, bugid, filter_intermittents=None):
+        try:
+            bugid = int(bugid)
+        except ValueError:
+            return None
+        bugs = self.load(filter_intermittents=filter_intermittents,
+                         conditions=[('id', '=', bugid)])
+        return bugs.get(str(bugid))
+
+    def load_summaries(self, filter_intermittents=None, conditions=(),
+                       totals=None):
+        """
+        Same as JsonBugStore.load_summaries. The conditions are evaluated
+        by sqlite, unless *totals* is given: all the bugs are needed to
+        count them then.
+        """
+        if totals is None:
+            sql_conditions, conditions = conditions, ()
+        else:
+            sql_conditions = ()
+        where, params = self._where(sql_conditions)
+        records = dict(self._bug_from_row(row)
+                       for row in self._select_bugs(where, params))
+        if any('summary' not in record for record in records.itervalues()):
+            # saved before the summaries were stored
+            for bugid, bug in self.load(
+                    kept_no_intermittents=True,
+                    conditions=sql_conditions).iteritems():
+                records[bugid] = summary_record(bug)
+        return filtered_summaries(records.iteritems(), filter_intermittents,
+                                  conditions, totals)
+
+    def count(self, filter_intermittents=None):
+        if filter_intermittents is None:
+            query = "SELECT COUNT(DISTINCT bug_id) FROM intermittents"
+        else:
+            self.conn.create_function(
+                'keep_buildname', 1,
+                lambda bname: filter_intermittents({'buildname': bname})
+            )
+            query = ("SELECT COUNT(DISTINCT bug_id) FROM intermittents "
+                     "WHERE keep_buildname(buildname)")
+        return self.conn.execute(query).fetchone()[0]
+
+    def save(self, bugs, metadata=None):
+        """
+        Replace the stored bugs, in one transaction.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM intermittents")
+            self.conn.execute("DELETE FROM bugs")
+            self.conn.execute("DELETE FROM metadata")
+            self.conn.executemany(
+                "INSERT INTO metadata (key, value) VALUES (?, ?)",
+                (metadata or {}).iteritems())
+            self.conn.executemany(
+                "INSERT INTO bugs (id, %s, summary) VALUES (?, %s, ?)"
+                % (', '.join(self.BUG_FIELDS),
+                   ', '.join('?' * len(self.BUG_FIELDS))),
+                ((int(bugid),) + tuple(bug.get(f) for f in self.BUG_FIELDS) +
+                 (json.dumps(with_summary(bug)['summary']),)
+                 for bugid, bug in bugs.iteritems()))
+            self.conn.executemany(
+                "INSERT INTO intermittents "
+                "(bug_id, buildname, revision, timestamp) "
+                "VALUES (?, ?, ?, ?)",
+                ((int(bugid), i['buildname'], i['revision'],
+                  i['timestamp'].strftime(DATETIME_FORMAT))
+                 for bugid, bug in bugs.iteritems()
+                 for i in bug['intermittents']))
+
+
+class MemoryBugStore(JsonBugStore):
+    """
+    Read only copy of the bugs of another store, held in memory with their
+    summary records, as kept by the serve command.
+    """
+    def __init__(self, store):
+        JsonBugStore.__init__(self, store.path)
+        self._bugs = store.load(kept_no_intermittents=True)
+        self._metadata = store.metadata()
+        self._records = dict((bugid, summary_record(with_summary(bug)))
+                             for bugid, bug in self._bugs.iteritems())
+
+    def __len__(self):
+        return len(self._bugs)
+
+    def exists(self):
+        return True
+
+    def _summary_records(self):
+        return self._records
+
+    def save(self, bugs, metadata=None):
+        raise MozBattueError("The bugs held in memory can not be saved")
+
+
+STORAGES = {
+    'json': JsonBugStore,
+    'log': LogBugStore,
+    'sqlite': SqliteBugStore,
+}
+
+
+def create_store(storage, path, **kwargs):
+    try:
+        klass = STORAGES[storage]
+    except KeyError:
+        raise MozBattueError("Unknown storage %r (should be one of %s)"
+                             % (storage, ', '.join(sorted(STORAGES))))
+    return klass(path, **kwargs)
@@ -0,0 +1,96 @@
+"""
+Per-bug summaries of the intermittents.
+
+A summary is computed when the bugs are stored, so that listing bugs does
+not need to read their intermittents. It is a json serializable dict:
+
+ - 'buildnames': buildname -> [count, oldest timestamp, oldest revision,
+   newest timestamp, position of the oldest intermittent]
+ - 'nb', 'oldest', 'oldest_revision', 'oldest_buildname', 'newest' and
+   'average_day', derived from the buildnames.
+
+Timestamps are epoch seconds. As intermittents are filtered by buildname
+only, the summary of the filtered intermittents of a bug can be derived
+from the buildnames entries of its summary.
+"""
+
+from itertools import izip
+
+from mozbattue.intermittents import Intermittents
+
+
+def make_summary(buildnames):
+    """
+    Create a summary from its buildnames entries.
+    """
+    if not buildnames:
+        return {'nb': 0, 'buildnames': {}}
+    nb = sum(entry[0] for entry in buildnames.itervalues())
+    oldest_bname, oldest = min(buildnames.iteritems(),
+                               key=lambda item: (item[1][1], item[1][4]))
+    newest = max(entry[3] for entry in buildnames.itervalues())
+    days = (newest - oldest[1]) // 86400
+    return {
+        'nb': nb,
+        'oldest': oldest[1],
+        'oldest_revision': oldest[2],
+        'oldest_buildname': oldest_bname,
+        'newest': newest,
+        'average_day': nb / float(days or 1),
+        'buildnames': buildnames,
+    }
+
+
+def compute_summary(intermittents):
+    """
+    Compute the summary of a list of intermittents or an Intermittents.
+    """
+    if not isinstance(intermittents, Intermittents):
+        intermittents = Intermittents.from_dicts(intermittents)
+    intermittents = intermittents.sorted_by_time()
+    strings = intermittents.strings
+    by_id = {}
+    for pos, (timestamp, bname_id, rev_id) in enumerate(izip(
+            intermittents.timestamps, intermittents.buildnames,
+            intermittents.revisions)):
+        entry = by_id.get(bname_id)
+        if entry is None:
+            by_id[bname_id] = [1, timestamp, strings[rev_id], timestamp, pos]
+        else:
+            entry[0] += 1
+            entry[3] = timestamp
+    return make_summary(dict((strings[bname_id], entry)
+                             for bname_id, entry in by_id.iteritems()))
+
+
+def filter_summary(summary, filter_intermittents):
+    """
+    Return the summary of the intermittents accepted by the buildname
+    filter *filter_intermittents*.
+    """
+    if filter_intermittents is None:
+        return summary
+    return make_summary(dict(
+        (bname, entry) for bname, entry in summary['buildnames'].iteritems()
+        if filter_intermittents({'buildname': bname})
+    ))
+
+
+def with_summary(bug):
+    """
+    Return the bug with a summary, computing it only if it has none.
+    """
+    if 'summary' in bug:
+        return bug
+    return dict(bug, summary=compute_summary(bug['intermittents']))
+
+
+def summary_record(bug):
+    """
+    Return the bug data without its intermittents, but with their summary.
+    """
+    record = dict((key, value) for key, value in bug.iteritems()
+                  if key != 'intermittents')
+    if 'summary' not in record:
+        record['summary'] = compute_summary(bug['intermittents'])
+    return record
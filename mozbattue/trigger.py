@@ -1,45 +1,137 @@
 # mainly stolen from mozci trigger.py file
 
 import urllib
+from multiprocessing.pool import ThreadPool
 from mozci.mozci import query_builders, query_repo_url_from_buildername, \
     query_repo_name_from_buildername, trigger_job
 from mozci.sources.pushlog import query_revision_info, query_pushid_range
 from mozbattue.utils import LOG
+from mozbattue.builders import BuilderIndex
+from mozbattue.pushlog import PushlogCache
 
 
-def sanitize_buildername(buildername):
-    buildername = buildername.strip()
-    builders = query_builders()
-    for builder in builders:
-        if buildername.lower() == builder.lower():
-            buildername = builder
+# index and cache used when none is given, so the builders and pushes are
+# only downloaded once in a session
+_default_builder_index = None
+_default_pushlog_cache = None
 
-    return buildername
+
+def create_builder_index(path=None, ttl=24 * 3600):
+    """
+    Return the index of the builders, stored in *path* if given.
+    """
+    return BuilderIndex(path, query_builders, ttl=ttl)
+
+
+def sanitize_buildername(buildername, builders=None):
+    """
+    Return the canonical buildername, using the *builders* BuilderIndex.
+    """
+    global _default_builder_index
+    if builders is None:
+        if _default_builder_index is None:
+            _default_builder_index = create_builder_index()
+        builders = _default_builder_index
+    return builders.sanitize(buildername)
+
+
+def create_pushlog_cache(path=None):
+    """
+    Return the pushlog cache, stored in *path* if given.
+    """
+    return PushlogCache(path, query_revision_info, query_pushid_range)
+
+
+def resolve_buildername(buildername, builders=None):
+    """
+    Return the canonical buildername, with the url and the name of its
+    repository.
+    """
+    buildername = sanitize_buildername(buildername, builders=builders)
+    return (buildername,
+            query_repo_url_from_buildername(buildername),
+            query_repo_name_from_buildername(buildername))
+
+
+def find_back_revisions(repo_url, revision, back_revisions, pushlog=None):
+    """
+    Return the revisions pushed the numbers of *back_revisions* (a list of
+    positive int) before *revision*, with a single push range query.
+    """
+    global _default_pushlog_cache
+    if pushlog is None:
+        if _default_pushlog_cache is None:
+            _default_pushlog_cache = create_pushlog_cache()
+        pushlog = _default_pushlog_cache
+    return pushlog.back_revisions(repo_url, revision, back_revisions)
+
+
+def treeherder_url(repo_name, revision, buildername):
+    return ('https://treeherder.mozilla.org/#/jobs?%s' % urllib.urlencode({
+        'repo': repo_name,
+        'revision': revision,
+        'filter-searchStr': buildername
+    }))
 
 
 def trigger_jobs(buildername, revision, back_revisions=30, times=30,
-                 dry_run=False):
-    buildername = sanitize_buildername(buildername)
-    repo_url = query_repo_url_from_buildername(buildername)
-    repo_name = query_repo_name_from_buildername(buildername)
+                 dry_run=False, builders=None, pushlog=None):
+    buildername, repo_url, repo_name = \
+        resolve_buildername(buildername, builders=builders)
 
     if back_revisions >= 0:
         # find the revision *back_revisions* before the one we got
-        push_info = query_revision_info(repo_url, revision)
-        end_id = int(push_info["pushid"])  # newest revision
-        start_id = end_id - back_revisions
-        revlist = query_pushid_range(repo_url=repo_url,
-                                     start_id=start_id,
-                                     end_id=end_id)
-        revision = revlist[-1]
+        revision, = find_back_revisions(repo_url, revision,
+                                        [back_revisions], pushlog=pushlog)
 
     requests = \
         trigger_job(revision, buildername, times=times, dry_run=dry_run)
     if any(req.status_code != 202 for req in requests):
         LOG.warn('WARNING: not all requests succeded')
 
-    return ('https://treeherder.mozilla.org/#/jobs?%s' % urllib.urlencode({
-        'repo': repo_name,
-        'revision': revision,
-        'filter-searchStr': buildername
-    }))
+    return treeherder_url(repo_name, revision, buildername)
+
+
+def trigger_sweep(buildername, revision, back_revisions=(), revisions=(),
+                  times=30, dry_run=False, builders=None, pushlog=None,
+                  jobs=4):
+    """
+    Trigger the builds of *buildername* for several revisions: the
+    revisions pushed the numbers of *back_revisions* before *revision*,
+    and the given *revisions*. The buildername and the revisions are
+    resolved once, then the jobs are submitted by a pool of *jobs* threads.
+
+    Return a list of dicts, one per revision in order, with the keys
+    'back_revisions' (None for the given *revisions*), 'revision',
+    'status' and 'url'.
+    """
+    buildername, repo_url, repo_name = \
+        resolve_buildername(buildername, builders=builders)
+
+    targets = []
+    if back_revisions:
+        targets.extend(zip(back_revisions, find_back_revisions(
+            repo_url, revision, back_revisions, pushlog=pushlog)))
+    targets.extend((None, rev) for rev in revisions)
+
+    def submit(target):
+        back, rev = target
+        try:
+            requests = trigger_job(rev, buildername, times=times,
+                                   dry_run=dry_run)
+        except Exception, exc:
+            LOG.debug("Triggering %s failed", rev, exc_info=True)
+            status = 'error: %s' % exc
+        else:
+            accepted = sum(1 for req in requests
+                           if getattr(req, 'status_code', None) == 202)
+            status = '%d/%d accepted' % (accepted, len(requests))
+        return {'back_revisions': back, 'revision': rev, 'status': status,
+                'url': treeherder_url(repo_name, rev, buildername)}
+
+    pool = ThreadPool(max(1, min(jobs, len(targets))))
+    try:
+        return pool.map(submit, targets)
+    finally:
+        pool.close()
+        pool.join()
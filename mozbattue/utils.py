@@ -1,3 +1,4 @@
+import contextlib
 import json
 import datetime
 import logging
@@ -6,8 +7,16 @@ import os
 import ConfigParser
 import itertools
 
+from mozbattue.intermittents import Intermittents, Intermittent, \
+    StringTable
+from mozbattue.summary import compute_summary, filter_summary
+
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
-JSON_FORMAT_VERSION = '1.2'
+# 1.3: intermittents stored as columns sorted by time, with epoch
+# timestamps, and compact json. Bugs may also have a precomputed summary.
+JSON_FORMAT_VERSION = '1.3'
+# older versions that are still read, and migrated to the current one
+MIGRATED_JSON_FORMAT_VERSIONS = ('1.2',)
 
 LOG = logging.getLogger('mozbattue')
 
@@ -23,29 +32,29 @@ class MozBattueError(Exception):
     pass
 
 
-def load_bugs(stream, kept_no_intermittents=False, filter_intermittents=None):
+def load_bugs(stream, kept_no_intermittents=False, filter_intermittents=None,
+              metadata=None):
+    """
+    Load the bugs from a json stream. If *metadata* is a dict, it is
+    updated with the metadata stored alongside the bugs.
+    """
     data = json.load(stream)
 
     # check version
     version_ok = False
     if 'metadata' in data:
-        version_ok = data['metadata'].get('version') == JSON_FORMAT_VERSION
+        version_ok = data['metadata'].get('version') in \
+            (JSON_FORMAT_VERSION,) + MIGRATED_JSON_FORMAT_VERSIONS
     if not version_ok:
         raise MozBattueError("The json data is no more compatible with this "
                              "version - you should update the data.")
     bugs = data['bugs']
+    if metadata is not None:
+        metadata.update(data['metadata'])
 
+    strings = StringTable()
     for bug in bugs.itervalues():
-        for intermittent in bug['intermittents']:
-            intermittent['timestamp'] = \
-                datetime.datetime.strptime(intermittent['timestamp'],
-                                           DATETIME_FORMAT)
-
-    if filter_intermittents:
-        for bugid, bug in bugs.items():
-            intermittents = [i for i in bug['intermittents']
-                             if filter_intermittents(i)]
-            bug['intermittents'] = intermittents
+        decode_bug(bug, strings, filter_intermittents)
 
     if not kept_no_intermittents:
         for bugid, bug in bugs.items():
@@ -55,36 +64,183 @@ def load_bugs(stream, kept_no_intermittents=False, filter_intermittents=None):
     return bugs
 
 
-def dump_bugs(bugs, stream):
-    def default(obj):
-        if isinstance(obj, datetime.datetime):
-            return obj.strftime(DATETIME_FORMAT)
-        return obj
-
-    data = {
-        'metadata': {'version': JSON_FORMAT_VERSION},
-        'bugs': bugs,
-    }
-    json.dump(data, stream, sort_keys=True, indent=4,
-              separators=(',', ': '), default=default)
+def decode_bug(bug, strings=None, filter_intermittents=None):
+    """
+    Decode the intermittents of a bug loaded from json into the compact
+    Intermittents representation, using the *strings* table if given.
+    Only the intermittents accepted by *filter_intermittents* are kept.
+
+    The intermittents can be stored as columns (current format) or as a
+    list of dicts (format 1.2, and journal entries).
+    """
+    intermittents = bug['intermittents']
+    if isinstance(intermittents, dict):
+        bug['intermittents'] = Intermittents.from_columns(
+            intermittents, strings, filter_intermittents)
+    else:
+        bug['intermittents'] = Intermittents.from_dicts(
+            intermittents, strings, filter_intermittents)
+    if filter_intermittents is not None and 'summary' in bug:
+        bug['summary'] = filter_summary(bug['summary'], filter_intermittents)
+    return bug
+
+
+def encode_bug(bug):
+    """
+    Return the json representation of a bug, in the current format.
+
+    The summary of the intermittents is computed if the bug has none, that
+    is if it is new or changed since it was loaded.
+    """
+    intermittents = bug['intermittents']
+    if not isinstance(intermittents, Intermittents):
+        intermittents = Intermittents.from_dicts(intermittents)
+    intermittents = intermittents.sorted_by_time()
+    summary = bug.get('summary')
+    if summary is None:
+        summary = compute_summary(intermittents)
+    return dict(bug, intermittents=intermittents.to_columns(),
+                summary=summary)
+
+
+def json_default(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.strftime(DATETIME_FORMAT)
+    if isinstance(obj, Intermittents):
+        return obj.to_dicts()
+    if isinstance(obj, Intermittent):
+        return obj.copy()
+    return obj
+
+
+def dump_bugs(bugs, stream, metadata=None):
+    """
+    Write the bugs as json in the stream.
+
+    Return a dict bug id -> (offset, length) giving the position of each
+    bug data in the stream, so it can be read without parsing the rest.
+    """
+    def dumps(obj):
+        return json.dumps(obj, sort_keys=True, separators=(',', ':'),
+                          default=json_default)
+
+    index = {}
+    written = [0]
+
+    def write(data):
+        stream.write(data)
+        written[0] += len(data)
+
+    write('{"bugs":{')
+    for i, bugid in enumerate(sorted(bugs, key=str)):
+        write('%s%s:' % (',' if i else '', json.dumps(str(bugid))))
+        data = dumps(encode_bug(bugs[bugid]))
+        index[str(bugid)] = (written[0], len(data))
+        write(data)
+    write('},"metadata":%s}\n'
+          % dumps(dict(metadata or {}, version=JSON_FORMAT_VERSION)))
+    return index
 
 
 def load_bugs_from_file(fname, kept_no_intermittents=False,
-                        filter_intermittents=None):
+                        filter_intermittents=None, metadata=None):
     try:
         with open(fname) as f:
             return load_bugs(f, kept_no_intermittents=kept_no_intermittents,
-                             filter_intermittents=filter_intermittents)
+                             filter_intermittents=filter_intermittents,
+                             metadata=metadata)
     except IOError, exc:
         raise MozBattueError("Unable to load bug data from %r: %s"
                              % (fname, exc))
 
 
+def read_json_lines(path):
+    """
+    Yield the objects of a file holding one json object per line, nothing
+    if the file does not exist. Lines that are not valid json are skipped:
+    these are lines truncated when the writer was interrupted.
+    """
+    if not os.path.isfile(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                LOG.debug("Ignoring a truncated line in %r", path)
+
+
+def open_for_append(path, chunk_size=64 * 1024):
+    """
+    Return a file opened to append json lines to *path*, created with its
+    directory if needed. A last line truncated when the previous writer
+    was interrupted is removed first, else the first appended line would
+    be written at its end and be lost with it.
+    """
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    f = open(path, 'a+')
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    if end:
+        f.seek(end - 1)
+        if f.read(1) != '\n':
+            # look for the end of the last complete line, backwards
+            pos = end
+            while pos > 0:
+                start = max(0, pos - chunk_size)
+                f.seek(start)
+                newline = f.read(pos - start).rfind('\n')
+                if newline != -1:
+                    pos = start + newline + 1
+                    break
+                pos = start
+            LOG.debug("Removing a truncated line at the end of %r", path)
+            f.truncate(pos)
+    f.seek(0, os.SEEK_END)
+    return f
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """
+    Return a context manager giving a file to write *path* in. The file is
+    written next to *path*, synced to the disk and replaces it at the end
+    of the block, so a crash while writing leaves the previous data
+    untouched. It is removed if the block raises. The directory of *path*
+    is created if needed.
+    """
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    tmp_file = path + '.tmp'
+    try:
+        with open(tmp_file, 'w') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_file, path)
+    except:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
 def intermittents_by_time(intermittents):
+    if isinstance(intermittents, Intermittents):
+        return intermittents.sorted_by_time()
     return sorted(intermittents, key=lambda i: i['timestamp'])
 
 
 def intermittents_groupedby_bname(intermittents):
+    if isinstance(intermittents, Intermittents):
+        grouped = [{'buildname': bname, 'occurences': count}
+                   for bname, count in
+                   intermittents.count_by_buildname().iteritems()]
+        return sorted(grouped,
+                      key=lambda k: (-k['occurences'], k['buildname']))
+
     def by_bname(intermittent):
         return intermittent['buildname']
 
@@ -107,20 +263,94 @@ def split_build_name(buildname):
     return data
 
 
+def parse_sweep(sweep):
+    """
+    Parse a 'start:stop[:step]' sweep of back revisions, where *stop* is
+    included, into the list of the numbers of revisions to go back.
+    '-30:0:5' gives [30, 25, 20, 15, 10, 5, 0].
+    """
+    try:
+        values = [int(v) for v in sweep.split(':')]
+        if len(values) not in (2, 3):
+            raise ValueError
+    except ValueError:
+        raise MozBattueError("Invalid sweep %r, should be start:stop[:step]"
+                             % sweep)
+    start, stop = values[:2]
+    step = values[2] if len(values) == 3 else 1
+    if step <= 0:
+        raise MozBattueError("The step of the sweep %r must be positive"
+                             % sweep)
+    if start > stop:
+        start, stop = stop, start
+    return sorted(set(abs(v) for v in xrange(start, stop + 1, step)),
+                  reverse=True)
+
+
+# patterns that can not be combined with others in one regex: back
+# references would refer to other groups, and inline flags would apply to
+# the whole regex
+RE_NOT_COMBINABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[iLmsux]+\)')
+
+
 class IntermittentFilter(object):
+    """
+    Reject the intermittents whose buildname matches one of the regexes.
+
+    The regexes are combined in one alternation, and the decision is
+    memoized per buildname in a cache of at most *max_cache_size* entries,
+    as a few hundred distinct buildnames are shared by all the
+    intermittents.
+    """
+    max_cache_size = 10000
+
     def __init__(self):
         self.regexes = []
+        self._match = None
+        self._cache = {}
 
     def add_filter_regex(self, regex):
         if isinstance(regex, basestring):
             regex = re.compile(regex)
         self.regexes.append(regex)
+        self._match = None
+        self._cache = {}
+
+    def _compile(self):
+        """
+        Return a function telling if a buildname matches one of the regexes.
+        """
+        if not self.regexes:
+            return lambda buildname: False
+        flags = set(regex.flags for regex in self.regexes)
+        patterns = [regex.pattern for regex in self.regexes]
+        if len(flags) == 1 and \
+                not any(RE_NOT_COMBINABLE.search(p) for p in patterns):
+            try:
+                regex = re.compile('|'.join('(?:%s)' % p for p in patterns),
+                                   flags.pop())
+            except re.error:
+                pass
+            else:
+                return lambda buildname: regex.match(buildname) is not None
+        regexes = list(self.regexes)
+        return lambda buildname: any(r.match(buildname) for r in regexes)
+
+    def accepts(self, buildname):
+        try:
+            return self._cache[buildname]
+        except KeyError:
+            pass
+        if self._match is None:
+            self._match = self._compile()
+        accepted = not self._match(buildname)
+        if len(self._cache) >= self.max_cache_size:
+            self._cache = {}
+        self._cache[buildname] = accepted
+        return accepted
 
     def __call__(self, intermittent):
-        for regex in self.regexes:
-            if regex.match(intermittent['buildname']):
-                return False
-        return True
+        return self.accepts(intermittent['buildname'])
 
 
 def create_filter_intermittents(regexes_str):
@@ -146,13 +376,27 @@ def comma_list(conf, section, option):
 
 class Config(ConfigParser.ConfigParser):
     opts_conv = {
+        'data': {
+            'log_compaction_size': ConfigParser.ConfigParser.getint,
+            'builders_index_ttl': ConfigParser.ConfigParser.getint,
+        },
+        'update': {
+            'jobs': ConfigParser.ConfigParser.getint,
+            'batch_size': ConfigParser.ConfigParser.getint,
+        },
         'display-list': {
             'min_intermittents': ConfigParser.ConfigParser.getint,
             'show_resolved': ConfigParser.ConfigParser.getboolean,
             'show_assigned_to': ConfigParser.ConfigParser.getboolean,
             'filter_products': comma_set,
             'visible_columns': comma_list,
-        }
+        },
+        'bisect': {
+            'max_back_revisions': ConfigParser.ConfigParser.getint,
+            'runs_per_day': ConfigParser.ConfigParser.getint,
+            'confidence': ConfigParser.ConfigParser.getfloat,
+            'rounds': ConfigParser.ConfigParser.getint,
+        },
     }
 
     def convert(self, section, option):
@@ -174,6 +418,7 @@ class Config(ConfigParser.ConfigParser):
 
     def as_dict(self):
         data = {}
-        for section in ('data', 'display', 'display-list'):
+        for section in ('data', 'update', 'display', 'display-list',
+                        'bisect'):
             data.update(self.get_defaults(section))
         return data
@@ -0,0 +1,140 @@
+"""
+Repeated updates of the bugs, reporting what changed.
+
+The watch command runs the update in a loop, keeping the bugs of the last
+update in memory for the next one. After each update, the differences
+with the previous bugs are written as json lines, one event per line:
+
+ - {"event": "new", ...} for a bug that was not known before
+ - {"event": "jump", ...} for a bug with at least *min_jump* new
+   intermittents
+ - {"event": "resolved", ...} for a bug that was resolved since
+
+Only a small state (number of intermittents and status) of the previous
+bugs is kept to compute the differences, and the bugs are compacted after
+each update, so the memory used does not grow with the number of updates.
+"""
+
+import datetime
+import json
+import re
+import sys
+import time
+
+from mozbattue.intermittents import Intermittents, StringTable
+from mozbattue.utils import MozBattueError, LOG
+
+RESOLVED_STATUSES = ('RESOLVED', 'VERIFIED', 'CLOSED')
+
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 24 * 3600}
+
+
+def parse_interval(interval):
+    """
+    Parse a duration like '90s', '15m', '2h' or '1d' (seconds without
+    unit), and return it in seconds.
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d*)?)\s*([smhd]?)\s*$', interval)
+    if match is None:
+        raise MozBattueError("Invalid interval %r, should be like 15m"
+                             % interval)
+    value = float(match.group(1)) * INTERVAL_UNITS[match.group(2) or 's']
+    if value <= 0:
+        raise MozBattueError("The interval must be positive")
+    return value
+
+
+def bugs_state(bugs):
+    """
+    Return the state of the bugs compared between two updates: a dict
+    bug id -> (number of intermittents, status), for the bugs with
+    intermittents.
+    """
+    return dict((str(bugid), (len(bug['intermittents']), bug.get('status')))
+                for bugid, bug in bugs.iteritems() if bug['intermittents'])
+
+
+def is_resolved(status):
+    return status in RESOLVED_STATUSES
+
+
+def diff_states(previous, current, min_jump=5):
+    """
+    Return the list of events (dicts) between two states of the bugs given
+    by bugs_state, ordered by bug id.
+    """
+    events = []
+    for bugid in sorted(current, key=int):
+        nb, status = current[bugid]
+        if bugid not in previous:
+            events.append({'event': 'new', 'id': bugid, 'nb': nb,
+                           'status': status})
+            continue
+        previous_nb, previous_status = previous[bugid]
+        if nb - previous_nb >= min_jump:
+            events.append({'event': 'jump', 'id': bugid, 'nb': nb,
+                           'previous_nb': previous_nb,
+                           'increase': nb - previous_nb})
+        if is_resolved(status) and not is_resolved(previous_status):
+            events.append({'event': 'resolved', 'id': bugid,
+                           'status': status,
+                           'previous_status': previous_status})
+    return events
+
+
+def compact_bugs(bugs):
+    """
+    Return the bugs by bug id string, with their intermittents stored as
+    Intermittents with a new strings table, so nothing is kept from the
+    previous updates.
+    """
+    strings = StringTable()
+    compacted = {}
+    for bugid, bug in bugs.iteritems():
+        compacted[str(bugid)] = dict(bug, intermittents=Intermittents
+                                     .from_dicts(bug['intermittents'],
+                                                 strings))
+    return compacted
+
+
+def write_events(events, stream, sync_time):
+    for event in events:
+        event = dict(event, time=sync_time.strftime('%Y-%m-%dT%H:%M:%S'))
+        stream.write(json.dumps(event, sort_keys=True))
+        stream.write('\n')
+    stream.flush()
+
+
+def watch(update, bugs, interval, stream=sys.stdout, min_jump=5,
+          iterations=None, sleep=time.sleep):
+    """
+    Call ``update(bugs)`` every *interval* seconds, starting now, with the
+    bugs returned by the previous call (*bugs* for the first one, None if
+    unknown), and write the events between two updates in *stream*.
+
+    Stop after *iterations* updates if given.
+    """
+    state = None if bugs is None else bugs_state(bugs)
+    done = 0
+    while iterations is None or done < iterations:
+        started = time.time()
+        sync_time = datetime.datetime.utcnow()
+        try:
+            bugs = compact_bugs(update(bugs))
+        except MozBattueError:
+            raise
+        except Exception:
+            # a network error should not stop the watch
+            LOG.exception("The update failed, retrying at the next one")
+        else:
+            new_state = bugs_state(bugs)
+            if state is None:
+                LOG.info("First update, %d bugs known", len(new_state))
+            else:
+                write_events(diff_states(state, new_state, min_jump),
+                             stream, sync_time)
+            state = new_state
+        done += 1
+        if iterations is None or done < iterations:
+            sleep(max(0, interval - (time.time() - started)))
+    return bugs
@@ -0,0 +1,361 @@
+"""
+Filter expressions on the columns of the bugs table.
+
+An expression like::
+
+  nb >= 10 and product != 'Testing' and (average_day > 2 or status = 'NEW')
+
+is parsed once into a tree of Comparison, And, Or and Not nodes, which
+compiles into a predicate on the BugTable rows. Conditions are evaluated
+cheapest and most selective first, and the conditions on the bug fields
+can be extracted to be checked by the store (see split_conditions).
+
+Supported operators are =, ==, !=, <, <=, >, >=, in and not in (with a
+parenthesized list of values), combined with and, or, not and
+parentheses. Values are numbers or quoted strings; dates are strings like
+'2015-04-20' or '2015-04-20T10:00:00'.
+"""
+
+import datetime
+import operator
+import re
+
+from mozbattue.utils import MozBattueError, DATETIME_FORMAT
+from mozbattue.store import CONDITION_COLUMNS, CONDITION_OPERATORS
+from mozbattue.stats import STATS_COLUMNS
+
+TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d*)?)
+      | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<op>==|!=|<=|>=|=|<|>|\(|\)|,)
+      | (?P<name>[A-Za-z_]\w*)
+    )""", re.VERBOSE)
+
+KEYWORDS = ('and', 'or', 'not', 'in')
+
+COMPARISON_OPERATORS = ('=', '!=', '<', '<=', '>', '>=')
+
+OPERATOR_ALIASES = {'==': '='}
+
+# operators false for a missing value (None), as None sorts before numbers
+ORDERING_OPERATORS = ('<', '<=', '>', '>=')
+
+
+def parse_date(value):
+    for fmt in (DATETIME_FORMAT, '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError("invalid date %r" % value)
+
+
+def parse_int(value):
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError("%r is not an integer" % value)
+    return int(value)
+
+
+def parse_text(value):
+    if not isinstance(value, basestring):
+        raise ValueError("%r is not a string" % value)
+    return value
+
+
+# conversion of the values compared to the columns, text by default
+COLUMN_TYPES = {
+    'id': parse_int,
+    'nb': parse_int,
+    'nb_buildnames': parse_int,
+    'last_24h': parse_int,
+    'last_7d': parse_int,
+    'average_day': float,
+    'median_gap': float,
+    'wow_growth': float,
+    'date': parse_date,
+}
+
+# ids are strings in the rows
+COLUMN_GETTERS = {
+    'id': lambda row: int(row['id']),
+}
+
+# operators from the most to the least selective
+OPERATORS_SELECTIVITY = ('=', 'in', '<', '<=', '>', '>=', '!=', 'not in')
+
+
+def column_cost(column):
+    """
+    Relative cost of evaluating a condition on a column: the bug fields are
+    directly available, the summary columns are precomputed, and the
+    statistics columns require the intermittents.
+    """
+    if column in CONDITION_COLUMNS:
+        return 0
+    if column in STATS_COLUMNS:
+        return 2
+    return 1
+
+
+class Comparison(object):
+    def __init__(self, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def columns(self):
+        return set([self.column])
+
+    def cost(self):
+        return (column_cost(self.column),
+                OPERATORS_SELECTIVITY.index(self.op))
+
+    def compile(self):
+        getter = COLUMN_GETTERS.get(self.column, operator.itemgetter(
+            self.column))
+        op, value = CONDITION_OPERATORS[self.op], self.value
+        if self.op in ORDERING_OPERATORS:
+            def predicate(row):
+                row_value = getter(row)
+                return row_value is not None and op(row_value, value)
+            return predicate
+        return lambda row: op(getter(row), value)
+
+    def __eq__(self, other):
+        return isinstance(other, Comparison) and \
+            (self.column, self.op, self.value) == \
+            (other.column, other.op, other.value)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Comparison(%r, %r, %r)' % (self.column, self.op, self.value)
+
+
+class BoolOp(object):
+    def __init__(self, children):
+        self.children = children
+
+    def columns(self):
+        return set().union(*[c.columns() for c in self.children])
+
+    def cost(self):
+        return max(c.cost() for c in self.children)
+
+    def ordered_predicates(self):
+        return [c.compile() for c in sorted(self.children,
+                                            key=lambda c: c.cost())]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.children == other.children
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.children)
+
+
+class And(BoolOp):
+    def compile(self):
+        predicates = self.ordered_predicates()
+        return lambda row: all(p(row) for p in predicates)
+
+
+class Or(BoolOp):
+    def compile(self):
+        predicates = self.ordered_predicates()
+        return lambda row: any(p(row) for p in predicates)
+
+
+class Not(object):
+    def __init__(self, child):
+        self.child = child
+
+    def columns(self):
+        return self.child.columns()
+
+    def cost(self):
+        return self.child.cost()
+
+    def compile(self):
+        predicate = self.child.compile()
+        return lambda row: not predicate(row)
+
+    def __eq__(self, other):
+        return isinstance(other, Not) and self.child == other.child
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Not(%r)' % self.child
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None:
+            raise MozBattueError("Invalid expression %r: unexpected %r"
+                                 % (text, text[pos:].strip()[:10]))
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name' and value.lower() in KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        elif kind == 'number':
+            value = float(value) if '.' in value else int(value)
+        elif kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+class Parser(object):
+    def __init__(self, text, columns):
+        self.text = text
+        self.columns = columns
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def error(self, message):
+        return MozBattueError("Invalid expression %r: %s"
+                              % (self.text, message))
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise self.error("unexpected end")
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value):
+        if self.peek() == (kind, value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind, value):
+        if not self.accept(kind, value):
+            raise self.error("expected %r" % value)
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek()[0] is not None:
+            raise self.error("unexpected %r" % (self.peek()[1],))
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.accept('keyword', 'or'):
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.accept('keyword', 'and'):
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.accept('keyword', 'not'):
+            return Not(self.parse_not())
+        if self.accept('op', '('):
+            node = self.parse_or()
+            self.expect('op', ')')
+            return node
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        kind, column = self.next()
+        if kind != 'name':
+            raise self.error("expected a column name, got %r" % (column,))
+        if column not in self.columns:
+            raise self.error("unknown column %r (should be one of %s)"
+                             % (column, ', '.join(sorted(self.columns))))
+        kind, op = self.next()
+        if (kind, op) == ('keyword', 'not'):
+            self.expect('keyword', 'in')
+            return Comparison(column, 'not in', self.parse_values(column))
+        if (kind, op) == ('keyword', 'in'):
+            return Comparison(column, 'in', self.parse_values(column))
+        op = OPERATOR_ALIASES.get(op, op)
+        if kind != 'op' or op not in COMPARISON_OPERATORS:
+            raise self.error("expected an operator after %r" % column)
+        return Comparison(column, op, self.parse_value(column))
+
+    def parse_values(self, column):
+        self.expect('op', '(')
+        values = [self.parse_value(column)]
+        while self.accept('op', ','):
+            values.append(self.parse_value(column))
+        self.expect('op', ')')
+        return tuple(values)
+
+    def parse_value(self, column):
+        kind, value = self.next()
+        if kind not in ('number', 'string'):
+            raise self.error("expected a value, got %r" % (value,))
+        try:
+            return COLUMN_TYPES.get(column, parse_text)(value)
+        except ValueError, exc:
+            raise self.error("bad value for %r: %s" % (column, exc))
+
+
+def parse_where(text, columns):
+    """
+    Parse an expression on the given column names.
+    """
+    return Parser(text, columns).parse()
+
+
+def conjuncts(node):
+    """
+    Return the list of the nodes that must all be true for *node* to be.
+    """
+    if node is None:
+        return []
+    if isinstance(node, And):
+        return [n for child in node.children for n in conjuncts(child)]
+    return [node]
+
+
+def combine(nodes):
+    """
+    Return a node true when all the *nodes* are, or None if there are none.
+    """
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else And(nodes)
+
+
+def partition(node, accept):
+    """
+    Split the expression in two expressions (or None), for the conjuncts of
+    *node* for which *accept* returns True and for the others.
+    """
+    accepted, others = [], []
+    for n in conjuncts(node):
+        (accepted if accept(n) else others).append(n)
+    return combine(accepted), combine(others)
+
+
+def split_conditions(node, columns=CONDITION_COLUMNS):
+    """
+    Split the expression in a list of (column, operator, value) store
+    conditions, for the comparisons on *columns* that must be true for
+    *node* to be, and an expression (or None) for the rest.
+    """
+    pushed, others = partition(
+        node, lambda n: isinstance(n, Comparison) and n.column in columns)
+    return [(n.column, n.op, n.value) for n in conjuncts(pushed)], others
@@ -28,6 +28,9 @@ setup(
     """,
     platforms=['Any'],
     install_requires=['bugsy', 'mozci'],
+    extras_require={
+        'stats': ['numpy'],
+    },
     tests_require=['mock'],
     test_suite='tests',
 )
@@ -0,0 +1,88 @@
+"""
+A minimal bugzilla REST server, running in a thread, for tests.
+"""
+
+import json
+import threading
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+
+class FakeBugzillaHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, code=200):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        path = url.path.split('/')[2:]  # strip the /rest prefix
+        self.server.requests.append((url.path, query))
+        if path == ['bug']:
+            self.send_json({'bugs': self.server.search_bugs(query)})
+        elif len(path) == 3 and path[0] == 'bug' and path[2] == 'comment':
+            ids = [path[1]] + query.get('ids', [])
+            if len(ids) > self.server.max_ids:
+                self.send_response(500)
+                self.end_headers()
+                self.wfile.write('too many ids')
+                return
+            since = query.get('new_since', [''])[0]
+            self.send_json({'bugs': dict(
+                (bugid, {'comments': [
+                    c for c in self.server.comments.get(bugid, [])
+                    if c['creation_time'] >= since
+                ]})
+                for bugid in ids
+            )})
+        else:
+            self.send_json({'error': True, 'message': 'unknown path'}, 404)
+
+
+class FakeBugzilla(HTTPServer):
+    """
+    Serve the *bugs* list for searches and the *comments* dict
+    (bug id as a string -> list of comment dicts) for comment requests.
+
+    Comment requests for more than *max_ids* bugs fail with an error 500.
+    Every request is recorded in the *requests* list.
+    """
+    def __init__(self, bugs=(), comments=None, max_ids=1000):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeBugzillaHandler)
+        self.bugs = list(bugs)
+        self.comments = comments or {}
+        self.max_ids = max_ids
+        self.requests = []
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d/rest' % self.server_address
+
+    def search_bugs(self, query):
+        return self.bugs
+
+    def comment_requests(self):
+        return [r for r in self.requests if r[0].endswith('/comment')]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+def make_comment(bugid, comment_id, text, creation_time):
+    return {'id': comment_id, 'bug_id': bugid, 'text': text,
+            'time': creation_time, 'creation_time': creation_time}
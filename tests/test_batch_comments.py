@@ -0,0 +1,106 @@
+import datetime
+import unittest
+
+from mozbattue import find_bugs
+from tests.fake_bugzilla import FakeBugzilla, make_comment
+
+INTERMITTENT = """
+buildname: mybuildname
+revision: myrevision
+start_time: 2015-04-15T03:16:25
+"""
+
+
+def create_bugzilla(nb_bugs, **kwargs):
+    bugs = [{'id': i, 'assigned_to': 'nobody', 'status': 'NEW',
+             'product': 'core', 'last_change_time': 'any'}
+            for i in range(1, nb_bugs + 1)]
+    comments = dict(
+        (str(i), [make_comment(i, i * 10, INTERMITTENT,
+                               '2015-04-15T03:20:00Z')])
+        for i in range(1, nb_bugs + 1)
+    )
+    return FakeBugzilla(bugs, comments, **kwargs)
+
+
+class TestBatchComments(unittest.TestCase):
+    def start_bugzilla(self, nb_bugs, **kwargs):
+        self.server = create_bugzilla(nb_bugs, **kwargs)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def find(self, **kwargs):
+        finder = find_bugs.BugsyFinder(bugzilla_url=self.server.url,
+                                       **kwargs)
+        return finder.find()
+
+    def assert_all_bugs_analyzed(self, result, nb_bugs):
+        self.assertEquals(sorted(result), range(1, nb_bugs + 1))
+        for bugid, bug in result.iteritems():
+            self.assertEquals(bug['intermittents'], [{
+                'buildname': 'mybuildname',
+                'revision': 'myrevision',
+                'timestamp': datetime.datetime(2015, 4, 15, 3, 16, 25),
+            }])
+            self.assertEquals(bug['last_comment_id'], bugid * 10)
+
+    def test_one_request_per_bug(self):
+        self.start_bugzilla(20)
+
+        result = self.find()
+
+        self.assert_all_bugs_analyzed(result, 20)
+        self.assertEquals(len(self.server.comment_requests()), 20)
+
+    def test_batched_update(self):
+        self.start_bugzilla(1000)
+
+        result = self.find(batch_size=100, jobs=4)
+
+        self.assert_all_bugs_analyzed(result, 1000)
+        self.assertEquals(len(self.server.comment_requests()), 10)
+        # one search plus the comment requests
+        self.assertEquals(len(self.server.requests), 11)
+
+    def test_oversized_batches_are_split(self):
+        self.start_bugzilla(1000, max_ids=50)
+
+        result = self.find(batch_size=100)
+
+        self.assert_all_bugs_analyzed(result, 1000)
+        # each batch fails once, then is sent as two halves
+        self.assertEquals(len(self.server.comment_requests()), 30)
+
+    def test_fallback_to_per_bug_requests(self):
+        self.start_bugzilla(4, max_ids=1)
+
+        result = self.find(batch_size=4)
+
+        self.assert_all_bugs_analyzed(result, 4)
+        # 4 bugs -> 2 * 2 bugs -> 4 * 1 bug
+        self.assertEquals(len(self.server.comment_requests()), 1 + 2 + 4)
+
+    def test_batched_new_comments_only(self):
+        self.start_bugzilla(3)
+        previous = {}
+        for i in (1, 2):
+            previous[str(i)] = {
+                'intermittents': [], 'status': 'NEW', 'product': 'core',
+                'assigned_to': 'nobody', 'last_change_time': 'old',
+                'last_comment_id': i * 10,
+                'last_comment_time': '2015-04-15T03:20:00Z',
+            }
+        self.server.comments['2'].append(
+            make_comment(2, 21, INTERMITTENT, '2015-04-15T04:00:00Z'))
+
+        result = self.find(batch_size=10, previous_bugs=previous)
+
+        self.assertEquals(len(result[1]['intermittents']), 0)
+        self.assertEquals(len(result[2]['intermittents']), 1)
+        self.assertEquals(result[2]['last_comment_id'], 21)
+        self.assertEquals(len(result[3]['intermittents']), 1)
+        # one request for the new bug, one for the already known ones
+        requests = self.server.comment_requests()
+        self.assertEquals(len(requests), 2)
+        self.assertEquals(requests[1][1]['new_since'],
+                          ['2015-04-15T03:20:00Z'])
@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from mock import Mock
+
+from mozbattue.bisection import Bisection, BisectionStore, SimulatedBackend, \
+    TriggerBackend, retries_for_confidence, estimate_failure_rate, \
+    round_sizes, expected_bad_runs, best_splits, run
+from mozbattue.utils import MozBattueError
+
+REVISIONS = ['rev%d' % i for i in range(31)]
+
+
+class TestRetries(unittest.TestCase):
+    def test_retries_for_confidence(self):
+        # 0.9 ** 28 = 0.052, 0.9 ** 29 = 0.047
+        self.assertEquals(retries_for_confidence(0.1, 0.95), 29)
+        self.assertEquals(retries_for_confidence(0.5, 0.99), 7)
+        self.assertEquals(retries_for_confidence(1, 0.99), 1)
+        for rate, confidence in ((0, 0.9), (1.5, 0.9), (0.1, 1)):
+            self.assertRaises(MozBattueError, retries_for_confidence,
+                              rate, confidence)
+
+    def test_estimate_failure_rate(self):
+        self.assertEquals(estimate_failure_rate(5, 50), 0.1)
+        self.assertEquals(estimate_failure_rate(80, 50), 1)
+        self.assertRaises(MozBattueError, estimate_failure_rate, None, 50)
+
+    def test_round_sizes(self):
+        self.assertEquals(round_sizes(29, 2), [15, 14])
+        self.assertEquals(round_sizes(2, 3), [1, 1])
+        self.assertEquals(round_sizes(5, 1), [5])
+
+    def test_expected_bad_runs(self):
+        self.assertEquals(expected_bad_runs(0.5, [2, 2]), 2 + 2 * 0.25)
+        self.assertEquals(expected_bad_runs(0.5, [4]), 4)
+
+
+class TestBestSplits(unittest.TestCase):
+    def test_same_costs_split_in_the_middle(self):
+        splits = best_splits(33, 10, 10)
+        self.assertEquals(splits[2], 1)
+        self.assertEquals(splits[32], 16)
+
+    def test_cheap_bad_revisions_split_early(self):
+        self.assertTrue(best_splits(33, 10, 2)[32] > 16)
+
+
+class TestBisection(unittest.TestCase):
+    def test_steps(self):
+        bisection = Bisection.start(REVISIONS[:5], 0.5, confidence=0.9,
+                                    rounds=1, buildname='b')
+        self.assertEquals(bisection.retries, 4)
+        self.assertEquals(bisection.next_step(), ('rev0', 4))
+        bisection.record(0)
+        self.assertEquals(bisection.next_step(), ('rev2', 4))
+        bisection.record(2)
+        self.assertEquals(bisection.next_step(), ('rev1', 4))
+        bisection.record(0, 4)
+        self.assertTrue(bisection.finished)
+        self.assertEquals(bisection.status, 'found')
+        self.assertEquals(bisection.culprit, 'rev2')
+        self.assertEquals(bisection.total_runs(), 12)
+        self.assertIsNone(bisection.next_step())
+
+    def test_rounds(self):
+        bisection = Bisection.start(REVISIONS[:5], 0.5, confidence=0.9,
+                                    rounds=2)
+        self.assertEquals(bisection.next_step(), ('rev0', 2))
+        bisection.record(0)
+        self.assertEquals(bisection.next_step(), ('rev0', 2))
+        bisection.record(0)
+        self.assertEquals(bisection.state['good'], 0)
+
+    def test_bad_at_first_round(self):
+        bisection = Bisection.start(REVISIONS[:5], 0.5, confidence=0.9,
+                                    rounds=2)
+        bisection.next_step()
+        bisection.record(1)
+        self.assertEquals(bisection.status, 'out of range')
+        self.assertIsNone(bisection.culprit)
+
+    def test_partial_record(self):
+        bisection = Bisection.start(REVISIONS[:5], 0.1, confidence=0.95,
+                                    rounds=2)
+        self.assertEquals(bisection.next_step(), ('rev0', 15))
+        bisection.record(0, 3)
+        # the 12 other runs of the round are still pending
+        self.assertEquals(bisection.next_step(), ('rev0', 0))
+        self.assertRaises(MozBattueError, bisection.record, 0, 13)
+        bisection.record(0)
+        self.assertEquals(bisection.next_step(), ('rev0', 14))
+        bisection.record(1, 2)
+        self.assertEquals(bisection.status, 'out of range')
+        self.assertEquals(bisection.state['triggered'], None)
+
+    def test_invalid_record(self):
+        bisection = Bisection.start(REVISIONS[:5], 0.5)
+        self.assertRaises(MozBattueError, bisection.record, 0)
+        bisection.next_step()
+        self.assertRaises(MozBattueError, bisection.record, 5, 2)
+
+    def test_simulated(self):
+        found = 0
+        for seed in range(20):
+            bisection = run(
+                Bisection.start(REVISIONS, 0.2, confidence=0.99),
+                SimulatedBackend(REVISIONS, 'rev17', 0.2, seed=seed))
+            found += bisection.culprit == 'rev17'
+        self.assertTrue(found >= 18)
+
+    def test_state_is_json(self):
+        bisection = Bisection.start(REVISIONS, 0.2, buildname='b')
+        bisection.next_step()
+        bisection.record(0)
+        bisection.next_step()
+        resumed = Bisection(json.loads(json.dumps(bisection.state)))
+        self.assertEquals(resumed.next_step(), bisection.next_step())
+        self.assertEquals(resumed.state['buildname'], 'b')
+
+
+class TestBackends(unittest.TestCase):
+    def test_simulated(self):
+        backend = SimulatedBackend(REVISIONS, 'rev5', 1)
+        backend.trigger('rev4', 3)
+        backend.trigger('rev5', 3)
+        self.assertEquals(backend.results('rev4'), (3, 0))
+        self.assertEquals(backend.results('rev5'), (3, 3))
+
+    def test_trigger(self):
+        trigger = Mock(return_value='url')
+        backend = TriggerBackend(trigger, 'b', dry_run=True)
+        self.assertEquals(backend.trigger('rev1', 4), 'url')
+        trigger.assert_called_once_with('b', 'rev1', back_revisions=-1,
+                                        times=4, dry_run=True)
+
+
+class TestBisectionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.store = BisectionStore(os.path.join(self.tmpdir, 'bisect.json'))
+
+    def test_persistent(self):
+        self.assertIsNone(self.store.get('12'))
+        bisection = Bisection.start(REVISIONS, 0.2)
+        bisection.next_step()
+        self.store.save('12', bisection)
+        self.assertEquals(self.store.get(12).state, bisection.state)
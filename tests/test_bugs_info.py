@@ -1,7 +1,12 @@
+import datetime
+import os
+import random
 import unittest
 from StringIO import StringIO
 
 from mozbattue import bugs_info
+from mozbattue.intermittents import Intermittents
+from mozbattue.utils import MozBattueError
 
 
 class MyTable(bugs_info.Table):
@@ -49,3 +54,167 @@ one  two
 11   55
 11   22
 """)
+
+    def test_filter_sort_limit(self):
+        for one, two in [(3, 'a'), (1, 'b'), (2, 'a'), (4, 'b'), (1, 'a')]:
+            self.table.add_row({'one': one, 'two': two})
+
+        self.table.raw_filter(lambda row: row['one'] != 4)
+        self.table.string_sort(">two, one")
+        self.table.set_limit(3)
+
+        self.assert_table_output("""\
+one  two
+
+1    b
+1    a
+2    a
+""")
+
+    def test_limit_without_sort(self):
+        for i in range(5):
+            self.table.add_row({'one': i, 'two': i})
+        self.table.set_limit(2)
+        self.assertEquals(self.table.render(stream=StringIO()), 2)
+
+    def render_format(self, format):
+        self.table.add_row({'one': 11, 'two': u'd\xe9j\xe0, vu'})
+        self.table.add_row({'one': 1,
+                            'two': datetime.datetime(2015, 4, 1, 3, 16, 25)})
+        self.table.string_sort('one')
+        io = StringIO()
+        self.assertEquals(self.table.render(stream=io, format=format), 2)
+        return io.getvalue()
+
+    def test_json_lines_format(self):
+        self.assertEquals(self.render_format('json-lines'), """\
+{"one": 1, "two": "2015-04-01T03:16:25"}
+{"one": 11, "two": "d\\u00e9j\\u00e0, vu"}
+""")
+
+    def test_csv_format(self):
+        self.assertEquals(self.render_format('csv'), """\
+one,two
+1,2015-04-01T03:16:25
+11,"d\xc3\xa9j\xc3\xa0, vu"
+""")
+
+    def test_tsv_format(self):
+        self.assertEquals(self.render_format('tsv'), """\
+one\ttwo
+1\t2015-04-01T03:16:25
+11\td\xc3\xa9j\xc3\xa0, vu
+""")
+
+    def test_unknown_format(self):
+        self.assertRaises(MozBattueError, self.render_format, 'xml')
+
+
+def multi_pass_sort(data, sort_by):
+    # the sort algorithm Table used before the single pass sort
+    for key, reverse in reversed(sort_by):
+        data = sorted(data, key=lambda b: b[key], reverse=reverse)
+    return data
+
+
+class TestTableSort(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(42)
+        self.data = [{'one': rand.randint(0, 5), 'two': rand.choice('abc'),
+                      'three': i} for i in range(200)]
+
+    def sorted_rows(self, sort_by, limit=None):
+        table = MyTable()
+        table.data = list(self.data)
+        table.sort(sort_by)
+        table.set_limit(limit)
+        return list(table.rows())
+
+    def test_same_as_multi_pass_sort(self):
+        for sort_by in ([('one', False), ('two', False)],
+                        [('one', True), ('two', True)],
+                        [('one', False), ('two', True)],
+                        [('two', True), ('one', False)]):
+            expected = multi_pass_sort(self.data, sort_by)
+            self.assertEquals(self.sorted_rows(sort_by), expected)
+            for limit in (0, 1, 10, 500):
+                self.assertEquals(self.sorted_rows(sort_by, limit),
+                                  expected[:limit])
+
+    def test_successive_sorts(self):
+        table = MyTable()
+        table.data = list(self.data)
+        table.sort([('two', False)])
+        table.sort([('one', True)])
+        self.assertEquals(
+            list(table.rows()),
+            multi_pass_sort(multi_pass_sort(self.data, [('two', False)]),
+                            [('one', True)]))
+
+
+class TestTableRenderer(unittest.TestCase):
+    def render(self, rows, **kwargs):
+        stream = StringIO()
+        renderer = bugs_info.TableRenderer(('a', 'b'), **kwargs)
+        nb_rows = renderer.render(rows, stream=stream)
+        return nb_rows, stream.getvalue()
+
+    def test_sample_window(self):
+        nb_rows, output = self.render(
+            iter([('1', 'x'), ('22', 'x'), ('4444', 'x')]), sample_size=2)
+        self.assertEquals(nb_rows, 3)
+        self.assertEquals(output, "a   b\n\n1   x\n22  x\n4444  x\n")
+
+    def test_known_widths(self):
+        nb_rows, output = self.render([('1', 'x')], widths=[3, None])
+        self.assertEquals(output, "a    b\n\n1    x\n")
+
+    def test_no_alignment_in_pipes(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd) as reader:
+            with os.fdopen(write_fd, 'w') as writer:
+                bugs_info.TableRenderer(('a', 'b')).render(
+                    [('1', 'x'), ('22', 'x')], stream=writer)
+            self.assertEquals(reader.read(), "a  b\n\n1  x\n22  x\n")
+
+    def test_is_pipe(self):
+        self.assertFalse(bugs_info.is_pipe(StringIO()))
+        read_fd, write_fd = os.pipe()
+        os.close(read_fd)
+        with os.fdopen(write_fd, 'w') as writer:
+            self.assertTrue(bugs_info.is_pipe(writer))
+
+
+class TestIntermittentTable(unittest.TestCase):
+    def test_render(self):
+        intermittents = Intermittents.from_dicts([{
+            'buildname': 'linux test %d' % i,
+            'revision': 'rev%d' % i,
+            'timestamp': datetime.datetime(2015, 4, i, 3, 16, 25),
+        } for i in (1, 2)])
+        table = bugs_info.IntermittentTable(intermittents)
+        stream = StringIO()
+        self.assertEquals(table.render(stream=stream), 2)
+        self.assertEquals(stream.getvalue().splitlines()[2:], [
+            "2015-04-01 03:16:25  rev1      'linux test 1'",
+            "2015-04-02 03:16:25  rev2      'linux test 2'",
+        ])
+
+
+class TestTriggerTable(unittest.TestCase):
+    def test_render(self):
+        table = bugs_info.TriggerTable([
+            {'back_revisions': 5, 'revision': 'rev1', 'status': '2/2 accepted',
+             'url': 'url1'},
+            {'back_revisions': 0, 'revision': 'rev2', 'status': 'error: x',
+             'url': 'url2'},
+            {'back_revisions': None, 'revision': 'rev3',
+             'status': '0/2 accepted', 'url': 'url3'},
+        ])
+        stream = StringIO()
+        self.assertEquals(table.render(stream=stream), 3)
+        self.assertEquals(stream.getvalue().splitlines()[2:], [
+            "-5    rev1      2/2 accepted  url1",
+            "0     rev2      error: x      url2",
+            "      rev3      0/2 accepted  url3",
+        ])
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from mock import Mock, patch
+
+from mozbattue.builders import BuilderIndex
+from mozbattue.utils import MozBattueError
+
+BUILDERS = [
+    'Ubuntu VM 12.04 mozilla-central opt test mochitest-1',
+    'Ubuntu VM 12.04 mozilla-central opt test mochitest-2',
+    'Windows 7 32-bit mozilla-central opt test mochitest-1',
+]
+
+
+class TestBuilderIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'builders.json')
+        self.query = Mock(return_value=BUILDERS)
+
+    def create_index(self, **kwargs):
+        return BuilderIndex(self.path, self.query, **kwargs)
+
+    def test_get(self):
+        index = self.create_index()
+        self.assertEquals(index.get(' ubuntu vm 12.04 MOZILLA-CENTRAL opt '
+                                    'test mochitest-1\n'), BUILDERS[0])
+        self.assertIsNone(index.get('ubuntu'))
+        self.assertEquals(len(index), 3)
+        self.assertEquals(self.query.call_count, 1)
+
+    def test_persistent(self):
+        self.create_index().get('x')
+        self.assertEquals(self.create_index().get(BUILDERS[1]), BUILDERS[1])
+        self.assertEquals(self.query.call_count, 1)
+
+    def test_ttl(self):
+        self.create_index().get('x')
+        with patch('time.time', return_value=time.time() + 3600):
+            self.create_index(ttl=3601).get('x')
+            self.assertEquals(self.query.call_count, 1)
+            self.create_index(ttl=3599).get('x')
+            self.assertEquals(self.query.call_count, 2)
+
+    def test_refresh(self):
+        index = self.create_index()
+        index.get('x')
+        self.query.return_value = ['Foo']
+        index.refresh()
+        self.assertEquals(index.get('foo'), 'Foo')
+        with open(self.path) as f:
+            self.assertEquals(json.load(f)['builders'], {'foo': 'Foo'})
+
+    def test_corrupted_file(self):
+        with open(self.path, 'w') as f:
+            f.write('{"updat')
+        self.assertEquals(self.create_index().get(BUILDERS[2]), BUILDERS[2])
+
+    def test_in_memory(self):
+        index = BuilderIndex(None, self.query)
+        self.assertEquals(index.get(BUILDERS[2]), BUILDERS[2])
+        self.assertFalse(os.listdir(self.tmpdir))
+
+    def test_sanitize(self):
+        index = self.create_index()
+        self.assertEquals(index.sanitize(BUILDERS[0].upper()), BUILDERS[0])
+        with self.assertRaises(MozBattueError) as cm:
+            index.sanitize('Ubuntu VM 12.04 mozilla-central opt test '
+                           'mochitest-3')
+        self.assertIn(BUILDERS[0], str(cm.exception))
+        self.assertEquals(index.suggest('nothing like it'), [])
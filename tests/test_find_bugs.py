@@ -12,9 +12,15 @@ def create_time_frame(now=None, days_ago=7):
     return str(start_date), str(date_limit)
 
 
+def comment_time(comment_id):
+    return '2015-04-15T00:00:%02dZ' % comment_id
+
+
 class FakeComment(object):
-    def __init__(self, text):
+    def __init__(self, text, id=1):
         self.text = text
+        self.id = id
+        self.creation_time = comment_time(id)
 
 
 class FakeBug(Bug):
@@ -27,7 +33,7 @@ class FakeBug(Bug):
         self._comments = comments
 
     def get_comments(self):
-        return [FakeComment(t) for t in self._comments]
+        return [FakeComment(t, i + 1) for i, t in enumerate(self._comments)]
 
 
 def expected_bug_result(bugs):
@@ -37,6 +43,10 @@ def expected_bug_result(bugs):
             'assigned_to': 'nobody',
             'intermittents': [],
             'last_change_time': 'any',
+            'creation_time': None,
+            'last_comment_id': len(bug._comments) or None,
+            'last_comment_time': (comment_time(len(bug._comments))
+                                  if bug._comments else None),
             'product': 'core',
             'status': 'NEW'
         }
@@ -71,7 +81,8 @@ class TestBugsyFinder(unittest.TestCase):
         search.change_history_fields.assert_called_with(['[Bug creation]'])
         search.timeframe.assert_called_with(*create_time_frame(days_ago=7))
         search.include_fields.assert_called_with('assigned_to',
-                                                 'last_change_time')
+                                                 'last_change_time',
+                                                 'creation_time')
 
         search.search.assert_called_with()
 
@@ -133,3 +144,118 @@ start_time: 2015-04-15T03:16:25
             expected[1]['intermittents']
         )
         self.reporter.finished.assert_called_with(expected)
+
+    def test_find_with_jobs(self):
+        self.finder.jobs = 4
+        bugs = [FakeBug(id=i, comments=["""
+buildname: mybuildname%d
+revision: myrevision
+start_time: 2015-04-15T03:16:25
+""" % i]) for i in range(1, 20)]
+        self.bugsy.search_for.search.return_value = bugs
+
+        result = self.finder.find()
+
+        self.assertEquals(sorted(result), range(1, 20))
+        for bugid, bug in result.iteritems():
+            self.assertEquals(bug['intermittents'][0]['buildname'],
+                              'mybuildname%d' % bugid)
+        # reporter calls are still done in the bugs order
+        analyzed = [c[0][0] for c in
+                    self.reporter.bug_analyzed.call_args_list]
+        self.assertEquals(analyzed, bugs)
+
+    def test_find_only_new_comments(self):
+        bugs = [FakeBug(id=1, last_change_time='new')]
+        previous = {
+            'intermittents': [{
+                'buildname': 'oldbuildname',
+                'revision': 'oldrevision',
+                'timestamp': datetime.datetime(2015, 4, 14, 3, 16, 25)
+            }],
+            'status': 'NEW',
+            'product': 'core',
+            'assigned_to': 'nobody',
+            'last_change_time': 'old',
+            'last_comment_id': 2,
+            'last_comment_time': comment_time(2),
+        }
+        self.finder.previous_bugs = {'1': previous}
+        self.bugsy.search_for.search.return_value = bugs
+        self.bugsy.request.return_value = {'bugs': {'1': {'comments': [
+            # new_since is inclusive, so the last known comment is sent back
+            {'id': 2, 'text': 'already seen', 'time': comment_time(2),
+             'creation_time': comment_time(2)},
+            {'id': 3, 'time': comment_time(3),
+             'creation_time': comment_time(3), 'text': """
+buildname: mybuildname
+revision: myrevision
+start_time: 2015-04-15T03:16:25
+"""},
+        ]}}}
+
+        result = self.finder.find()
+
+        self.bugsy.request.assert_called_once_with(
+            'bug/1/comment', params={'new_since': comment_time(2)})
+        self.assertEquals(result[1]['intermittents'], [
+            previous['intermittents'][0],
+            {
+                'buildname': 'mybuildname',
+                'revision': 'myrevision',
+                'timestamp': datetime.datetime(2015, 4, 15, 3, 16, 25)
+            },
+        ])
+        self.assertEquals(result[1]['last_comment_id'], 3)
+        self.assertEquals(result[1]['last_comment_time'],
+                          '2015-04-15T00:00:03Z')
+
+    def test_find_incremental(self):
+        def stored_bug(creation_time):
+            return {
+                'intermittents': [], 'status': 'NEW', 'product': 'core',
+                'assigned_to': 'nobody', 'last_change_time': 'old',
+                'creation_time': creation_time,
+            }
+        self.finder.previous_bugs = {
+            # kept as is
+            '1': stored_bug('2015-05-09T10:00:00Z'),
+            # changed
+            '2': stored_bug('2015-05-09T10:00:00Z'),
+            # too old
+            '3': stored_bug('2015-05-01T10:00:00Z'),
+            # unknown creation time, kept until the next full update
+            '4': stored_bug(None),
+        }
+        bugs = [
+            FakeBug(id=2, creation_time='2015-05-09T10:00:00Z'),
+            FakeBug(id=5, creation_time='2015-05-11T10:00:00Z'),
+            # changed, but created before the time window
+            FakeBug(id=6, creation_time='2015-04-11T10:00:00Z'),
+        ]
+        self.bugsy.search_for.search.return_value = bugs
+
+        result = self.finder.find(days_ago=5,
+                                  date_limit=datetime.date(2015, 5, 12),
+                                  changed_since='2015-05-11 08:00:00')
+
+        search = self.bugsy.search_for
+        search.timeframe.assert_called_with('2015-05-11 08:00:00', 'Now')
+        self.assertFalse(search.change_history_fields.called)
+        self.assertEquals(sorted(result), [1, 2, 4, 5])
+        self.assertEquals(result[1], self.finder.previous_bugs['1'])
+        self.assertEquals(result[2]['last_change_time'], 'any')
+        self.assertEquals(result[5]['creation_time'], '2015-05-11T10:00:00Z')
+        self.reporter.got_bugs.assert_called_with(bugs[:2])
+
+    def test_find_with_journal(self):
+        journal = Mock()
+        self.finder.journal = journal
+        bugs = [FakeBug(id=1), FakeBug(id=2)]
+        self.finder.previous_bugs = {'2': expected_bug_result(bugs)[2]}
+        self.bugsy.search_for.search.return_value = bugs
+
+        result = self.finder.find()
+
+        # only the analyzed bugs are journaled
+        journal.append.assert_called_once_with(1, result[1])
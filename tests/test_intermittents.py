@@ -0,0 +1,147 @@
+import datetime
+import json
+import unittest
+from StringIO import StringIO
+from mock import patch
+
+from mozbattue.intermittents import Intermittents, StringTable
+from mozbattue import utils
+
+
+def intermittent(buildname, day, revision='rev'):
+    return {
+        'buildname': buildname,
+        'revision': revision,
+        'timestamp': datetime.datetime(2015, 4, day, 3, 16, 25),
+    }
+
+
+class TestIntermittents(unittest.TestCase):
+    def setUp(self):
+        self.dicts = [
+            intermittent('b', 3, 'rev1'),
+            intermittent('a', 1, 'rev2'),
+            intermittent('b', 1, 'rev3'),
+            intermittent('c', 3, 'rev4'),
+        ]
+        self.intermittents = Intermittents.from_dicts(self.dicts)
+
+    def test_sequence(self):
+        self.assertEquals(len(self.intermittents), 4)
+        self.assertEquals(self.intermittents, self.dicts)
+        self.assertEquals(self.intermittents[-1]['revision'], 'rev4')
+        self.assertEquals(self.intermittents[1].copy(), self.dicts[1])
+
+    def test_shared_strings(self):
+        strings = StringTable()
+        Intermittents.from_dicts(self.dicts, strings)
+        Intermittents.from_dicts(self.dicts, strings)
+        self.assertEquals(len(strings), 3 + 4)
+
+    def test_json_timestamps(self):
+        intermittents = Intermittents.from_dicts([{
+            'buildname': 'a', 'revision': 'rev',
+            'timestamp': '2015-04-15T03:16:25',
+        }])
+        self.assertEquals(intermittents.timestamp(0),
+                          datetime.datetime(2015, 4, 15, 3, 16, 25))
+
+    def test_sorted_by_time(self):
+        self.assertEquals(utils.intermittents_by_time(self.intermittents),
+                          utils.intermittents_by_time(self.dicts))
+
+    def test_oldest_newest(self):
+        self.assertEquals(self.intermittents.oldest_index(), 1)
+        self.assertEquals(self.intermittents.newest_index(), 3)
+
+    def test_groupedby_bname(self):
+        self.assertEquals(
+            utils.intermittents_groupedby_bname(self.intermittents),
+            utils.intermittents_groupedby_bname(self.dicts))
+
+    def test_filtered(self):
+        filtered = self.intermittents.filtered(
+            utils.create_filter_intermittents('b'))
+        self.assertEquals(filtered, [self.dicts[1], self.dicts[3]])
+
+    def test_dump(self):
+        stream = StringIO()
+        utils.dump_bugs({'1': {'intermittents': self.intermittents}}, stream)
+        data = json.loads(stream.getvalue())
+        self.assertEquals(data['metadata']['version'], '1.3')
+        # stored as columns, sorted by time
+        self.assertEquals(data['bugs']['1']['intermittents'], {
+            'timestamps': [1427858185, 1427858185, 1428030985, 1428030985],
+            'buildnames': ['a', 'b', 'b', 'c'],
+            'revisions': ['rev2', 'rev3', 'rev1', 'rev4'],
+            'sorted': True,
+        })
+        # and read back
+        stream.seek(0)
+        bugs = utils.load_bugs(stream)
+        self.assertTrue(bugs['1']['intermittents'].is_sorted)
+        self.assertEquals(bugs['1']['intermittents'],
+                          utils.intermittents_by_time(self.dicts))
+
+    def test_load_format_1_2(self):
+        stream = StringIO(json.dumps({
+            'metadata': {'version': '1.2'},
+            'bugs': {'1': {'intermittents': [{
+                'buildname': 'b',
+                'revision': 'rev1',
+                'timestamp': '2015-04-03T03:16:25',
+            }]}},
+        }))
+        bugs = utils.load_bugs(stream)
+        self.assertEquals(bugs['1']['intermittents'], [self.dicts[0]])
+
+    def test_load_filters_while_decoding(self):
+        stream = StringIO()
+        utils.dump_bugs({'1': {'intermittents': self.intermittents}}, stream)
+        stream.seek(0)
+        with patch.object(Intermittents, 'filtered') as filtered:
+            bugs = utils.load_bugs(
+                stream, filter_intermittents=utils.create_filter_intermittents(
+                    'b'))
+            self.assertFalse(filtered.called)
+        self.assertEquals(bugs['1']['intermittents'],
+                          [self.dicts[1], self.dicts[3]])
+        self.assertEquals(bugs['1']['summary']['nb'], 2)
+
+
+class TestIntermittentFilter(unittest.TestCase):
+    BUILDNAMES = ['linux mozilla-central test a', 'linux comm-central test b',
+                  'Windows comm-aurora test c', 'mac try test d']
+
+    def assert_rejected(self, filter, expected):
+        self.assertEquals([b for b in self.BUILDNAMES
+                           if not filter({'buildname': b})], expected)
+
+    def test_combined_regexes(self):
+        filter = utils.create_filter_intermittents(
+            '.*comm-central.*\n.*comm-aurora.*\nmac')
+        self.assert_rejected(filter, self.BUILDNAMES[1:])
+
+    def test_not_combinable_regexes(self):
+        filter = utils.create_filter_intermittents(
+            '(linux) comm-.*\n(?i)windows\n(.)ac \\1?')
+        self.assert_rejected(filter, self.BUILDNAMES[1:])
+
+    def test_no_regexes(self):
+        self.assert_rejected(utils.IntermittentFilter(), [])
+
+    def test_memoized(self):
+        filter = utils.create_filter_intermittents('.*comm-central.*')
+        self.assertFalse(filter({'buildname': self.BUILDNAMES[1]}))
+        filter._match = None
+        filter.regexes = []
+        self.assertFalse(filter({'buildname': self.BUILDNAMES[1]}))
+
+    def test_bounded_cache(self):
+        filter = utils.create_filter_intermittents('.*comm-central.*')
+        filter.max_cache_size = 2
+        self.assert_rejected(filter, self.BUILDNAMES[1:2])
+        self.assertTrue(len(filter._cache) <= 2)
+        filter.add_filter_regex('mac')
+        self.assertEquals(filter._cache, {})
+        self.assert_rejected(filter, [self.BUILDNAMES[1], self.BUILDNAMES[3]])
@@ -0,0 +1,69 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozbattue.journal import Journal
+
+
+def create_bug(revision):
+    return {
+        'intermittents': [{
+            'buildname': 'mybuildname',
+            'revision': revision,
+            'timestamp': datetime.datetime(2015, 4, 15, 3, 16, 25),
+        }],
+        'status': 'NEW',
+        'product': 'core',
+        'assigned_to': 'nobody',
+        'last_change_time': 'any',
+    }
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.journal = Journal(os.path.join(self.tmpdir, 'journal'))
+
+    def test_empty(self):
+        self.assertEquals(self.journal.load(), {})
+
+    def test_append_and_load(self):
+        self.journal.append(1, create_bug('rev1'))
+        self.journal.append(2, create_bug('rev2'))
+        self.journal.close()
+
+        self.assertEquals(self.journal.load(), {
+            '1': create_bug('rev1'),
+            '2': create_bug('rev2'),
+        })
+
+    def test_interrupted_write(self):
+        self.journal.append(1, create_bug('rev1'))
+        self.journal.close()
+        with open(self.journal.path, 'a') as f:
+            f.write('{"id": 2, "bug": {"intermitt')
+
+        self.assertEquals(self.journal.load(), {'1': create_bug('rev1')})
+
+    def test_resume_after_interrupted_write(self):
+        self.journal.append(1, create_bug('rev1'))
+        self.journal.close()
+        with open(self.journal.path, 'a') as f:
+            f.write('{"id": 2, "bug": {"intermitt')
+
+        self.journal.append(5, create_bug('rev5'))
+        self.journal.close()
+
+        self.assertEquals(self.journal.load(), {
+            '1': create_bug('rev1'),
+            '5': create_bug('rev5'),
+        })
+
+    def test_remove(self):
+        self.journal.append(1, create_bug('rev1'))
+        self.journal.remove()
+
+        self.assertFalse(os.path.exists(self.journal.path))
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from mozbattue.main import parse_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run a command in a new interpreter, and print the imported modules
+LIST_MODULES = """
+import sys
+from mozbattue.main import main
+try:
+    main(sys.argv[1:])
+except SystemExit:
+    pass
+print '\\n'.join(sys.modules)
+"""
+
+
+class TestLazyImports(unittest.TestCase):
+    def imported_modules(self, *argv):
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(
+                [sys.executable, '-c', LIST_MODULES] + list(argv),
+                cwd=ROOT, stderr=devnull)
+        return set(output.splitlines())
+
+    def test_list_help_imports_no_network_backend(self):
+        modules = self.imported_modules('list', '--help')
+        self.assertIn('mozbattue.main', modules)
+        for module in ('bugsy', 'mozci', 'mozbattue.find_bugs',
+                       'mozbattue.trigger', 'numpy'):
+            self.assertNotIn(module, modules)
+
+
+class TestParseArgs(unittest.TestCase):
+    def test_trigger_back_revisions(self):
+        for argv in (['trigger', '1001', '-15'],
+                     ['trigger', '1001', '--dry-run', '-15'],
+                     ['trigger', '1001', '-t', '5', '-15'],
+                     ['trigger', '-t', '5', '--dry-run', '1001', '-15']):
+            opts = parse_args(argv)
+            self.assertEqual(opts.bugid, '1001')
+            self.assertEqual(opts.back_revisions, -15)
+        opts = parse_args(['trigger', '1001', '-t', '5', '--dry-run', '-15'])
+        self.assertEqual(opts.times, 5)
+        self.assertTrue(opts.dry_run)
+
+    def test_trigger_sweep(self):
+        opts = parse_args(['trigger-sweep', '1001', '--sweep=-30:0:5',
+                           '-t', '5'])
+        self.assertEqual((opts.bugid, opts.sweep, opts.revisions),
+                         ('1001', '-30:0:5', None))
+        self.assertEqual(opts.times, 5)
+        opts = parse_args(['trigger-sweep', '1001', '-r', 'abc,def'])
+        self.assertEqual(opts.revisions, ['abc', 'def'])
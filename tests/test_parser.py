@@ -0,0 +1,52 @@
+import datetime
+import unittest
+
+from mozbattue import parser
+
+
+class TestParseComment(unittest.TestCase):
+    def test_intermittent(self):
+        self.assertEquals(parser.parse_comment("""\
+buildname: mybuildname
+revision: myrevision
+useless: justtobesure
+start_time: 2015-04-15T03:16:25
+"""), {
+            'buildname': 'mybuildname',
+            'revision': 'myrevision',
+            'timestamp': datetime.datetime(2015, 4, 15, 3, 16, 25),
+        })
+
+    def test_submit_timestamp_wins(self):
+        intermittent = parser.parse_comment(
+            "submit_timestamp: 2015-04-15T03:16:30\r\n"
+            "buildname: mybuildname\r\n"
+            "revision: myrevision\r\n"
+            "start_time: 2015-04-15T03:16:25\r\n"
+        )
+        self.assertEquals(intermittent['timestamp'],
+                          datetime.datetime(2015, 4, 15, 3, 16, 30))
+        self.assertEquals(intermittent['revision'], 'myrevision')
+
+    def test_incomplete(self):
+        self.assertIsNone(parser.parse_comment("""\
+buildname: mybuildname
+start_time: 2015-04-15T03:16:25
+"""))
+        # markers must start a line
+        self.assertIsNone(parser.parse_comment("""\
+the buildname: mybuildname
+revision: myrevision
+start_time: 2015-04-15T03:16:25
+"""))
+
+    def test_discussion(self):
+        self.assertIsNone(parser.parse_comment("I can't reproduce this."))
+
+    def test_parse_timestamp(self):
+        self.assertEquals(parser.parse_timestamp('2015-04-15T03:16:25'),
+                          datetime.datetime(2015, 4, 15, 3, 16, 25))
+        self.assertRaises(ValueError, parser.parse_timestamp,
+                          '2015-04-15T03:16:25 ')
+        self.assertRaises(ValueError, parser.parse_timestamp,
+                          '2015-13-15T03:16:25')
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from mock import Mock
+
+from mozbattue.pushlog import PushlogCache, contiguous_ranges
+from mozbattue.utils import MozBattueError
+
+REPO = 'https://hg.mozilla.org/mozilla-central'
+
+
+def revision(pushid):
+    return hashlib.sha1(str(pushid)).hexdigest()
+
+
+def query_pushid_range(repo_url, start_id, end_id):
+    return [revision(i) for i in xrange(end_id, start_id - 1, -1)]
+
+
+class TestPushlogCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'pushlog.json')
+        self.query_revision_info = Mock(return_value={'pushid': '100'})
+        self.query_pushid_range = Mock(side_effect=query_pushid_range)
+
+    def create_cache(self, path=True):
+        return PushlogCache(self.path if path else None,
+                            self.query_revision_info,
+                            self.query_pushid_range)
+
+    def test_pushid(self):
+        cache = self.create_cache()
+        self.assertEquals(cache.pushid(REPO, 'abc'), 100)
+        self.assertEquals(cache.pushid(REPO, 'abc'), 100)
+        self.assertEquals(self.query_revision_info.call_count, 1)
+
+    def test_revisions(self):
+        cache = self.create_cache()
+        self.assertEquals(cache.revisions(REPO, 90, 100),
+                          query_pushid_range(REPO, 90, 100))
+        self.assertEquals(cache.revisions(REPO, 95, 100),
+                          query_pushid_range(REPO, 95, 100))
+        self.assertEquals(self.query_pushid_range.call_count, 1)
+
+    def test_revisions_fetch_missing_ranges(self):
+        cache = self.create_cache()
+        cache.revisions(REPO, 95, 100)
+        cache.revisions(REPO, 80, 84)
+        self.query_pushid_range.reset_mock()
+        self.assertEquals(cache.revisions(REPO, 70, 110),
+                          query_pushid_range(REPO, 70, 110))
+        self.assertEquals(
+            [c[1] for c in self.query_pushid_range.call_args_list],
+            [{'repo_url': REPO, 'start_id': 70, 'end_id': 79},
+             {'repo_url': REPO, 'start_id': 85, 'end_id': 94},
+             {'repo_url': REPO, 'start_id': 101, 'end_id': 110}])
+
+    def test_known_revisions_have_pushids(self):
+        cache = self.create_cache()
+        cache.revisions(REPO, 90, 100)
+        self.assertEquals(cache.pushid(REPO, revision(93)), 93)
+        self.assertEquals(cache.pushid(REPO, revision(93)[:12]), 93)
+        self.assertFalse(self.query_revision_info.called)
+
+    def test_persistent(self):
+        self.create_cache().revisions(REPO, 90, 100)
+        self.create_cache().pushid(REPO, 'abc')
+        cache = self.create_cache()
+        self.assertEquals(cache.revisions(REPO, 90, 100),
+                          query_pushid_range(REPO, 90, 100))
+        self.assertEquals(cache.pushid(REPO, 'abc'), 100)
+        self.assertEquals(self.query_pushid_range.call_count, 1)
+        self.assertEquals(self.query_revision_info.call_count, 1)
+
+    def test_repos_are_separated(self):
+        cache = self.create_cache()
+        cache.revisions(REPO, 90, 100)
+        cache.revisions(REPO + '-inbound', 90, 100)
+        self.assertEquals(self.query_pushid_range.call_count, 2)
+
+    def test_in_memory(self):
+        cache = self.create_cache(path=False)
+        cache.revisions(REPO, 90, 100)
+        cache.revisions(REPO, 90, 100)
+        self.assertEquals(self.query_pushid_range.call_count, 1)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_missing_pushes_not_cached(self):
+        self.query_pushid_range.side_effect = \
+            lambda repo_url, start_id, end_id: ['a', 'b']
+        cache = self.create_cache()
+        self.assertEquals(cache.revisions(REPO, 90, 100), ['a', 'b'])
+        self.assertEquals(cache.revisions(REPO, 90, 100), ['a', 'b'])
+        self.assertEquals(self.query_pushid_range.call_count, 4)
+
+    def test_back_revisions(self):
+        cache = self.create_cache()
+        self.assertEquals(cache.back_revisions(REPO, 'abc', [10, 0, 5]),
+                          [revision(90), revision(100), revision(95)])
+
+    def test_back_revisions_missing(self):
+        self.query_pushid_range.side_effect = \
+            lambda repo_url, start_id, end_id: ['a', 'b']
+        cache = self.create_cache()
+        self.assertEquals(cache.back_revisions(REPO, 'abc', [1, 0]),
+                          ['b', 'a'])
+        with self.assertRaisesRegexp(MozBattueError, 'revisions 2 to 10 '):
+            cache.back_revisions(REPO, 'abc', [10, 2, 0])
+
+    def test_invalid_file(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        self.assertEquals(self.create_cache().pushid(REPO, 'abc'), 100)
+
+
+class TestContiguousRanges(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEquals(contiguous_ranges([1, 2, 3, 5, 7, 8]),
+                          [(1, 3), (5, 5), (7, 8)])
+        self.assertEquals(contiguous_ranges([]), [])
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mozbattue import store
+from mozbattue.server import StoreDaemon, RemoteBugStore, DaemonClient
+from mozbattue.utils import MozBattueError, create_filter_intermittents
+from tests.test_store import create_bugs
+
+
+class TestStoreDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'bugs.json')
+        self.socket_path = os.path.join(self.tmpdir, 'serve.sock')
+        self.store = store.JsonBugStore(self.path)
+        self.store.save(create_bugs(), metadata={'last_sync': 'now'})
+        self.filter = create_filter_intermittents('.*comm-central.*')
+        self.start_daemon()
+
+    def start_daemon(self):
+        self.daemon = StoreDaemon(lambda: store.JsonBugStore(self.path),
+                                  self.socket_path, poll_interval=60)
+        self.daemon.bind()
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+        self.addCleanup(self.stop_daemon, self.daemon, self.thread)
+
+    def stop_daemon(self, daemon, thread):
+        daemon.shutdown()
+        thread.join()
+
+    def remote(self):
+        remote = RemoteBugStore.connect(self.socket_path, self.path)
+        self.addCleanup(remote.client.close)
+        return remote
+
+    def test_queries(self):
+        remote, direct = self.remote(), store.JsonBugStore(self.path)
+        for kwargs in ({}, {'filter_intermittents': self.filter},
+                       {'conditions': [('product', '=', 'core')]}):
+            self.assertEquals(remote.load_summaries(**kwargs),
+                              direct.load_summaries(**kwargs))
+            self.assertEquals(remote.load(**kwargs), direct.load(**kwargs))
+        self.assertEquals(remote.load(kept_no_intermittents=True),
+                          direct.load(kept_no_intermittents=True))
+        self.assertEquals(remote.get(1, filter_intermittents=self.filter),
+                          direct.get(1, filter_intermittents=self.filter))
+        self.assertIsNone(remote.get(4))
+        self.assertEquals(remote.count(filter_intermittents=self.filter), 2)
+        totals = {}
+        remote.load_summaries(conditions=[('id', '=', 1)], totals=totals)
+        self.assertEquals(totals, {'nb_bugs': 3})
+        self.assertEquals(remote.metadata()['last_sync'], 'now')
+
+    def test_reload_on_change(self):
+        remote = self.remote()
+        self.assertEquals(remote.count(), 3)
+        bugs = create_bugs()
+        del bugs['1']
+        self.store.save(bugs)
+        # a different size is seen even within the mtime resolution
+        self.assertEquals(remote.count(), 2)
+        self.assertEquals(remote.client.call('info')['loads'], 2)
+
+    def test_errors(self):
+        client = self.remote().client
+        self.assertRaises(MozBattueError, client.call, 'foo')
+        self.assertRaises(MozBattueError, client.call, 'load',
+                          conditions=[('foo', '=', 1)])
+        self.assertEquals(client.call('count'), 3)
+        self.assertRaises(MozBattueError, self.remote().save, {})
+
+    def test_connect_other_store(self):
+        self.assertIsNone(RemoteBugStore.connect(self.socket_path,
+                                                 self.path + '2'))
+        self.assertIsNone(RemoteBugStore.connect(self.socket_path + '2',
+                                                 self.path))
+
+    def test_already_running(self):
+        daemon = StoreDaemon(lambda: self.store, self.socket_path)
+        self.assertRaises(MozBattueError, daemon.bind)
+
+    def test_missing_store(self):
+        daemon = StoreDaemon(
+            lambda: store.JsonBugStore(os.path.join(self.tmpdir, 'none')),
+            os.path.join(self.tmpdir, 'other.sock'))
+        self.assertRaises(MozBattueError, daemon.bind)
+
+    def test_stale_socket(self):
+        self.stop_daemon(self.daemon, self.thread)
+        with open(self.socket_path, 'w'):
+            pass
+        self.assertIsNone(DaemonClient.connect(self.socket_path))
+        self.start_daemon()
+        self.assertEquals(self.remote().count(), 3)
+
+
+class TestMemoryBugStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        path = os.path.join(self.tmpdir, 'bugs.sqlite')
+        store.SqliteBugStore(path).save(create_bugs())
+        self.direct = store.SqliteBugStore(path)
+        self.memory = store.MemoryBugStore(self.direct)
+
+    def test_same_results(self):
+        self.assertEquals(len(self.memory), 4)
+        self.assertEquals(self.memory.load_summaries(),
+                          self.direct.load_summaries())
+        self.assertEquals(self.memory.get('2'), self.direct.get('2'))
+        self.assertRaises(MozBattueError, self.memory.save, {})
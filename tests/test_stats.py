@@ -0,0 +1,72 @@
+import datetime
+import unittest
+from mock import patch
+
+from mozbattue import stats
+from mozbattue.intermittents import Intermittents, to_epoch
+from mozbattue.bugs_info import BugTable
+
+NOW = to_epoch(datetime.datetime(2015, 4, 30))
+HOUR = 3600
+
+
+def intermittents(*hours_ago):
+    return Intermittents.from_dicts([{
+        'buildname': 'linux test %d' % (i % 2),
+        'revision': 'rev',
+        'timestamp': NOW - hours * HOUR,
+    } for i, hours in enumerate(hours_ago)])
+
+
+def create_bugs():
+    return {
+        # 1 in the last day, 3 in the last week, 2 the week before
+        '1': intermittents(2, 30, 100, 200, 300),
+        '2': intermittents(250),
+        '3': intermittents(),
+        # unsorted, with 4 gaps (of 1, 5, 4 and 10 hours)
+        '4': intermittents(10, 0, 20, 1, 6),
+    }
+
+
+class TestStats(unittest.TestCase):
+    def compute_stats(self):
+        return stats.compute_stats(create_bugs(), now=NOW)
+
+    def test_counts(self):
+        result = self.compute_stats()
+        self.assertEquals(result['1']['last_24h'], 1)
+        self.assertEquals(result['1']['last_7d'], 3)
+        self.assertEquals(result['1']['wow_growth'], 0.5)
+        self.assertEquals(result['2']['last_7d'], 0)
+        self.assertEquals(result['2']['wow_growth'], -1.0)
+        self.assertEquals(result['3'], {'last_24h': 0, 'last_7d': 0,
+                                        'median_gap': None,
+                                        'wow_growth': None})
+        self.assertEquals(result['4']['last_24h'], 5)
+
+    def test_median_gap(self):
+        result = self.compute_stats()
+        self.assertEquals(result['1']['median_gap'], 85.0)
+        self.assertIsNone(result['2']['median_gap'])
+        self.assertEquals(result['4']['median_gap'], 4.5)
+
+    def test_python_stats(self):
+        expected = self.compute_stats()
+        with patch.object(stats, 'import_numpy', lambda: None):
+            self.assertEquals(self.compute_stats(), expected)
+
+    def test_no_bugs(self):
+        self.assertEquals(stats.compute_stats({}, now=NOW), {})
+
+    def test_bug_table(self):
+        bugs = dict((bugid, {'intermittents': i, 'status': 'NEW',
+                             'assigned_to': 'nobody', 'product': 'core'})
+                    for bugid, i in create_bugs().iteritems() if i)
+        table = BugTable(bugs, stats=stats.compute_stats(
+            dict((bugid, bug['intermittents'])
+                 for bugid, bug in bugs.iteritems()), now=NOW))
+        table.string_sort('>wow_growth, id')
+        self.assertEquals([(row['id'], row['nb_buildnames'])
+                           for row in table.rows()],
+                          [('1', 2), ('2', 1), ('4', 2)])
@@ -0,0 +1,281 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from mozbattue import store
+from mozbattue.utils import create_filter_intermittents
+from mozbattue.summary import compute_summary
+
+
+def create_bugs():
+    def intermittent(buildname, day):
+        return {
+            'buildname': buildname,
+            'revision': 'rev%d' % day,
+            'timestamp': datetime.datetime(2015, 4, day, 3, 16, 25),
+        }
+
+    def bug(intermittents, **kwargs):
+        data = {
+            'intermittents': intermittents,
+            'status': 'NEW',
+            'product': 'core',
+            'assigned_to': 'nobody@mozilla.org',
+            'last_change_time': '2015-04-20T00:00:00Z',
+            'creation_time': '2015-04-01T00:00:00Z',
+            'last_comment_id': 12,
+            'last_comment_time': '2015-04-20T00:00:00Z',
+        }
+        data.update(kwargs)
+        return data
+
+    return {
+        '1': bug([intermittent('linux test a', 1),
+                  intermittent('comm-central test a', 2)]),
+        '2': bug([intermittent('linux test b', 3)], status='RESOLVED'),
+        '3': bug([intermittent('comm-central test c', 4)], product='Testing'),
+        '4': bug([]),
+    }
+
+
+def without_summary(bug):
+    if bug is None:
+        return None
+    return dict((k, v) for k, v in bug.iteritems() if k != 'summary')
+
+
+def without_summaries(bugs):
+    return dict((bugid, without_summary(bug))
+                for bugid, bug in bugs.iteritems())
+
+
+class StoreTestMixin(object):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.store = self.create_store()
+        self.store.save(create_bugs(), metadata={'last_sync': 'now'})
+        self.store = self.create_store()
+        self.filter = create_filter_intermittents('.*comm-central.*')
+
+    def test_load(self):
+        self.assertEquals(
+            without_summaries(self.store.load(kept_no_intermittents=True)),
+            create_bugs())
+        self.assertEquals(sorted(self.store.load()), ['1', '2', '3'])
+
+    def test_metadata(self):
+        self.assertEquals(self.store.metadata()['last_sync'], 'now')
+
+    def test_load_filter_intermittents(self):
+        bugs = self.store.load(filter_intermittents=self.filter)
+        self.assertEquals(sorted(bugs), ['1', '2'])
+        self.assertEquals(bugs['1']['intermittents'],
+                          create_bugs()['1']['intermittents'][:1])
+
+    def test_load_conditions(self):
+        bugs = self.store.load(conditions=[
+            ('status', '!=', 'RESOLVED'),
+            ('product', 'not in', set(['Testing'])),
+        ])
+        self.assertEquals(sorted(bugs), ['1'])
+        bugs = self.store.load(conditions=[('id', '>=', 2)])
+        self.assertEquals(sorted(bugs), ['2', '3'])
+
+    def test_get(self):
+        self.assertEquals(without_summary(self.store.get('1')),
+                          create_bugs()['1'])
+        self.assertEquals(without_summary(self.store.get('3')),
+                          create_bugs()['3'])
+        self.assertIsNone(self.store.get('3',
+                                         filter_intermittents=self.filter))
+        self.assertIsNone(self.store.get('4'))
+        self.assertIsNone(self.store.get('12'))
+
+    def test_count(self):
+        self.assertEquals(self.store.count(), 3)
+        self.assertEquals(self.store.count(filter_intermittents=self.filter),
+                          2)
+
+    def test_load_summaries(self):
+        summaries = self.store.load_summaries()
+        self.assertEquals(sorted(summaries), ['1', '2', '3'])
+        for bugid, record in summaries.iteritems():
+            self.assertNotIn('intermittents', record)
+            self.assertEquals(record['summary'], compute_summary(
+                create_bugs()[bugid]['intermittents']))
+        self.assertEquals(summaries['2']['status'], 'RESOLVED')
+
+    def test_load_summaries_filter(self):
+        summaries = self.store.load_summaries(
+            filter_intermittents=self.filter,
+            conditions=[('status', '!=', 'RESOLVED')])
+        self.assertEquals(sorted(summaries), ['1'])
+        self.assertEquals(summaries['1']['summary']['nb'], 1)
+
+    def test_load_summaries_totals(self):
+        totals = {}
+        summaries = self.store.load_summaries(
+            conditions=[('status', '!=', 'RESOLVED')], totals=totals)
+        self.assertEquals(sorted(summaries), ['1', '3'])
+        self.assertEquals(totals, {'nb_bugs': self.store.count()})
+        self.store.load_summaries(filter_intermittents=self.filter,
+                                  conditions=[('id', '=', 1)],
+                                  totals=totals)
+        self.assertEquals(totals['nb_bugs'], 2)
+
+    def test_unchanged_summaries_are_not_computed(self):
+        bugs = self.store.load(kept_no_intermittents=True)
+        bugs['2'] = create_bugs()['2']
+        bugs['2']['intermittents'].append(bugs['2']['intermittents'][0])
+        # the summary may be computed by encode_bug or with_summary
+        with patch('mozbattue.utils.compute_summary',
+                   wraps=compute_summary) as compute1, \
+                patch('mozbattue.summary.compute_summary',
+                      wraps=compute_summary) as compute2:
+            self.store.save(bugs)
+        self.assertEquals(compute1.call_count + compute2.call_count, 1)
+        self.assertEquals(
+            self.create_store().load_summaries()['2']['summary']['nb'], 2)
+
+
+class TestJsonBugStore(StoreTestMixin, unittest.TestCase):
+    def create_store(self):
+        return store.JsonBugStore(os.path.join(self.tmpdir, 'bugs.json'))
+
+    def test_get_uses_the_index(self):
+        self.assertTrue(os.path.isfile(self.store.index_path))
+        with patch('mozbattue.store.load_bugs_from_file') as load:
+            self.assertEquals(without_summary(self.store.get('1')),
+                              create_bugs()['1'])
+            self.assertIsNone(self.store.get('12'))
+            self.assertFalse(load.called)
+
+    def test_load_summaries_uses_the_summary_file(self):
+        self.assertTrue(os.path.isfile(self.store.summary_path))
+        with patch('mozbattue.store.load_bugs_from_file') as load:
+            self.assertEquals(sorted(self.store.load_summaries()),
+                              ['1', '2', '3'])
+            self.assertFalse(load.called)
+
+    def test_get_with_outdated_index(self):
+        with open(self.store.path, 'a') as f:
+            f.write('\n')
+        with patch('mozbattue.store.load_bugs_from_file',
+                   wraps=store.load_bugs_from_file) as load:
+            self.assertEquals(without_summary(self.store.get('1')),
+                              create_bugs()['1'])
+            self.assertTrue(load.called)
+
+    def test_migrate_format_1_2(self):
+        bugs = create_bugs()
+        for bug in bugs.itervalues():
+            for intermittent in bug['intermittents']:
+                intermittent['timestamp'] = \
+                    intermittent['timestamp'].strftime('%Y-%m-%dT%H:%M:%S')
+        with open(self.store.path, 'w') as f:
+            json.dump({'metadata': {'version': '1.2', 'last_sync': 'now'},
+                       'bugs': bugs}, f, indent=4)
+
+        self.assertEquals(without_summary(self.store.get('1')),
+                          create_bugs()['1'])
+        with open(self.store.path) as f:
+            self.assertEquals(json.load(f)['metadata'],
+                              {'version': '1.3', 'last_sync': 'now'})
+        self.assertEquals(without_summaries(self.create_store().load()),
+                          without_summaries(self.store.load()))
+
+
+class TestSqliteBugStore(StoreTestMixin, unittest.TestCase):
+    def create_store(self):
+        return store.SqliteBugStore(os.path.join(self.tmpdir, 'bugs.sqlite'))
+
+    def test_load_summaries_without_stored_summaries(self):
+        self.store.conn.execute("UPDATE bugs SET summary = NULL")
+        self.assertEquals(sorted(self.store.load_summaries()),
+                          ['1', '2', '3'])
+
+    def test_indexes(self):
+        indexes = set(r[0] for r in self.store.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"))
+        for column in ('bug_id', 'buildname', 'revision', 'timestamp'):
+            self.assertIn('intermittents_%s_idx' % column, indexes)
+
+
+class TestLogBugStore(StoreTestMixin, unittest.TestCase):
+    def create_store(self, compaction_size=1024 * 1024):
+        return store.LogBugStore(os.path.join(self.tmpdir, 'bugs.json'),
+                                 compaction_size=compaction_size)
+
+    def log_lines(self):
+        with open(self.store.log_path) as f:
+            return f.readlines()
+
+    def test_save_appends_changes_only(self):
+        self.assertFalse(os.path.exists(self.store.path))
+        nb_lines = len(self.log_lines())
+        bugs = create_bugs()
+        bugs['2']['status'] = 'NEW'
+        del bugs['4']
+
+        self.store.save(bugs, metadata={'last_sync': 'now'})
+
+        self.assertEquals(len(self.log_lines()), nb_lines + 2)
+        self.assertEquals(without_summaries(
+            self.create_store().load(kept_no_intermittents=True)), bugs)
+        self.assertEquals(self.store.get('2')['status'], 'NEW')
+        self.assertIsNone(self.store.get('4'))
+
+    def test_compaction(self):
+        self.store = self.create_store(compaction_size=0)
+        bugs = create_bugs()
+        bugs['2']['status'] = 'NEW'
+
+        self.store.save(bugs, metadata={'last_sync': 'later'})
+
+        self.assertFalse(os.path.exists(self.store.log_path))
+        self.assertTrue(os.path.exists(self.store.path))
+        store = self.create_store()
+        self.assertEquals(
+            without_summaries(store.load(kept_no_intermittents=True)), bugs)
+        self.assertEquals(store.metadata(), {'last_sync': 'later'})
+
+    def test_load_summaries_replays_the_log(self):
+        self.store.compact()
+        bugs = create_bugs()
+        bugs['2']['status'] = 'NEW'
+        del bugs['3']
+        self.store.save(bugs)
+
+        with patch('mozbattue.store.load_bugs_from_file') as load:
+            summaries = self.create_store().load_summaries()
+            self.assertFalse(load.called)
+        self.assertEquals(sorted(summaries), ['1', '2'])
+        self.assertEquals(summaries['2']['status'], 'NEW')
+
+    def test_save_after_interrupted_save(self):
+        bugs = create_bugs()
+        with open(self.store.log_path, 'a') as f:
+            f.write('{"id": "5", "bug": {"intermitt')
+        bugs['5'] = bugs.pop('4')
+        self.create_store().save(bugs, metadata={'last_sync': 'now'})
+
+        self.assertEquals(without_summaries(
+            self.create_store().load(kept_no_intermittents=True)), bugs)
+        self.assertTrue(self.log_lines()[-1].endswith('\n'))
+
+    def test_replay_after_compaction_crash(self):
+        # the snapshot was written, but the log was not removed
+        log = self.log_lines()
+        self.store.compact()
+        with open(self.store.log_path, 'w') as f:
+            f.writelines(log)
+            f.write('{"id": "5", "bug": {"intermitt')
+
+        self.assertEquals(without_summaries(
+            self.create_store().load(kept_no_intermittents=True)),
+            create_bugs())
@@ -0,0 +1,86 @@
+import datetime
+import unittest
+
+from mozbattue.intermittents import Intermittents, to_epoch
+from mozbattue.summary import compute_summary, filter_summary, \
+    summary_record, with_summary
+from mozbattue.utils import create_filter_intermittents
+from mozbattue.bugs_info import BugTable
+
+
+def intermittent(buildname, day, revision='rev'):
+    return {
+        'buildname': buildname,
+        'revision': revision,
+        'timestamp': datetime.datetime(2015, 4, day, 3, 16, 25),
+    }
+
+
+def epoch(day):
+    return to_epoch(datetime.datetime(2015, 4, day, 3, 16, 25))
+
+
+class TestSummary(unittest.TestCase):
+    def setUp(self):
+        self.dicts = [
+            intermittent('b', 3, 'rev1'),
+            intermittent('a', 1, 'rev2'),
+            intermittent('b', 1, 'rev3'),
+            intermittent('c', 5, 'rev4'),
+        ]
+
+    def test_compute_summary(self):
+        summary = compute_summary(Intermittents.from_dicts(self.dicts))
+        self.assertEquals(summary['nb'], 4)
+        self.assertEquals(summary['oldest'], epoch(1))
+        # on ties, the first intermittent wins, like in the unsorted data
+        self.assertEquals(summary['oldest_buildname'], 'a')
+        self.assertEquals(summary['oldest_revision'], 'rev2')
+        self.assertEquals(summary['newest'], epoch(5))
+        self.assertEquals(summary['average_day'], 1.0)
+        self.assertEquals(
+            dict((b, e[0]) for b, e in summary['buildnames'].iteritems()),
+            {'a': 1, 'b': 2, 'c': 1})
+
+    def test_compute_summary_from_dicts(self):
+        intermittents = Intermittents.from_dicts(self.dicts)
+        self.assertEquals(compute_summary(self.dicts),
+                          compute_summary(intermittents))
+
+    def test_compute_summary_empty(self):
+        self.assertEquals(compute_summary([]), {'nb': 0, 'buildnames': {}})
+
+    def test_filter_summary(self):
+        filter = create_filter_intermittents('a')
+        summary = filter_summary(compute_summary(self.dicts), filter)
+        intermittents = Intermittents.from_dicts(self.dicts).filtered(filter)
+        expected = compute_summary(intermittents)
+        # positions of the oldest intermittents are those in the unfiltered
+        # intermittents, only their order matters
+        for key in ('nb', 'oldest', 'oldest_revision', 'oldest_buildname',
+                    'newest', 'average_day'):
+            self.assertEquals(summary[key], expected[key])
+        self.assertEquals(sorted(summary['buildnames']), ['b', 'c'])
+        self.assertEquals(summary['oldest_revision'], 'rev3')
+        self.assertEquals(filter_summary(summary, None), summary)
+
+    def test_with_summary(self):
+        bug = with_summary({'intermittents': self.dicts})
+        self.assertEquals(bug['summary'], compute_summary(self.dicts))
+        self.assertIs(with_summary(bug), bug)
+
+    def test_summary_record(self):
+        record = summary_record({'intermittents': self.dicts,
+                                 'status': 'NEW'})
+        self.assertEquals(record, {'status': 'NEW',
+                                   'summary': compute_summary(self.dicts)})
+
+    def test_bug_table(self):
+        bug = {'intermittents': Intermittents.from_dicts(self.dicts),
+               'status': 'NEW', 'assigned_to': 'nobody', 'product': 'core'}
+        rows = BugTable({'1': bug}).data
+        self.assertEquals(rows, BugTable({'1': summary_record(bug)}).data)
+        self.assertEquals(rows[0]['nb'], 4)
+        self.assertEquals(rows[0]['date'],
+                          datetime.datetime(2015, 4, 1, 3, 16, 25))
+        self.assertEquals(rows[0]['rev'], 'rev2')
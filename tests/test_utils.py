@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from mozbattue import utils
+
+
+class TestParseSweep(unittest.TestCase):
+    def test_sweep(self):
+        self.assertEquals(utils.parse_sweep('-30:0:5'),
+                          [30, 25, 20, 15, 10, 5, 0])
+        self.assertEquals(utils.parse_sweep('0:-3'), [3, 2, 1, 0])
+        self.assertEquals(utils.parse_sweep('-10:-1:4'), [10, 6, 2])
+
+    def test_invalid(self):
+        for sweep in ('-30', '-30:0:x', '1:2:3:4', '-30:0:0', '-30:0:-5'):
+            self.assertRaises(utils.MozBattueError, utils.parse_sweep, sweep)
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'sub', 'data.json')
+
+    def test_write(self):
+        with utils.atomic_write(self.path) as f:
+            f.write('new')
+        with open(self.path) as f:
+            self.assertEquals(f.read(), 'new')
+
+    def test_error_keeps_previous_file(self):
+        with utils.atomic_write(self.path) as f:
+            f.write('old')
+        with self.assertRaises(ValueError):
+            with utils.atomic_write(self.path) as f:
+                f.write('new')
+                raise ValueError
+        with open(self.path) as f:
+            self.assertEquals(f.read(), 'old')
+        self.assertEquals(os.listdir(os.path.dirname(self.path)),
+                          ['data.json'])
+
+    def test_synced_before_rename(self):
+        with patch('os.fsync') as fsync:
+            with utils.atomic_write(self.path) as f:
+                f.write('new')
+                self.assertFalse(fsync.called)
+            self.assertEquals(fsync.call_count, 1)
+
+
+class TestReadJsonLines(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'data.log')
+
+    def test_truncated_line(self):
+        with open(self.path, 'w') as f:
+            f.write('{"id": 1}\n{"id": 2}\n{"id"')
+        self.assertEquals(list(utils.read_json_lines(self.path)),
+                          [{'id': 1}, {'id': 2}])
+
+    def test_missing_file(self):
+        self.assertEquals(list(utils.read_json_lines(self.path)), [])
@@ -0,0 +1,99 @@
+import datetime
+import json
+import unittest
+from StringIO import StringIO
+from mock import Mock
+
+from mozbattue import watch
+from mozbattue.intermittents import Intermittents
+from mozbattue.utils import MozBattueError
+
+
+def create_bug(nb, status='NEW'):
+    return {
+        'status': status,
+        'intermittents': [{
+            'buildname': 'linux test %d' % (i % 3),
+            'revision': 'rev%d' % i,
+            'timestamp': datetime.datetime(2015, 4, 1 + i % 28),
+        } for i in range(nb)],
+    }
+
+
+class TestParseInterval(unittest.TestCase):
+    def test_interval(self):
+        self.assertEquals(watch.parse_interval('15m'), 900)
+        self.assertEquals(watch.parse_interval('90'), 90)
+        self.assertEquals(watch.parse_interval(' 1.5h'), 5400)
+        self.assertEquals(watch.parse_interval('1d'), 86400)
+        for interval in ('', '15x', 'm', '0s', '-1m'):
+            self.assertRaises(MozBattueError, watch.parse_interval, interval)
+
+
+class TestDiff(unittest.TestCase):
+    def test_diff_states(self):
+        previous = {'1': (10, 'NEW'), '2': (3, 'NEW'), '3': (5, 'NEW'),
+                    '4': (1, 'RESOLVED'), '5': (2, 'NEW')}
+        current = {'1': (15, 'NEW'), '2': (7, 'RESOLVED'), '3': (5, 'NEW'),
+                   '4': (1, 'VERIFIED'), '10': (1, 'NEW')}
+        self.assertEquals(watch.diff_states(previous, current, min_jump=5), [
+            {'event': 'jump', 'id': '1', 'nb': 15, 'previous_nb': 10,
+             'increase': 5},
+            {'event': 'resolved', 'id': '2', 'status': 'RESOLVED',
+             'previous_status': 'NEW'},
+            {'event': 'new', 'id': '10', 'nb': 1, 'status': 'NEW'},
+        ])
+
+    def test_bugs_state(self):
+        self.assertEquals(watch.bugs_state({1: create_bug(2),
+                                            2: create_bug(0)}),
+                          {'1': (2, 'NEW')})
+
+    def test_compact_bugs(self):
+        bugs = watch.compact_bugs({12: create_bug(4)})
+        self.assertEquals(bugs.keys(), ['12'])
+        intermittents = bugs['12']['intermittents']
+        self.assertIsInstance(intermittents, Intermittents)
+        self.assertEquals(intermittents.to_dicts(),
+                          create_bug(4)['intermittents'])
+
+
+class TestWatch(unittest.TestCase):
+    def run_watch(self, results, bugs=None, **kwargs):
+        stream = StringIO()
+        update = Mock(side_effect=results)
+        sleep = Mock()
+        watch.watch(update, bugs, 60, stream=stream, min_jump=2,
+                    iterations=len(results), sleep=sleep, **kwargs)
+        self.update, self.sleep = update, sleep
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_events(self):
+        events = self.run_watch([
+            {1: create_bug(2)},
+            {1: create_bug(5), 2: create_bug(1)},
+            {1: create_bug(6, status='RESOLVED'), 2: create_bug(1)},
+        ])
+        self.assertEquals([(e['event'], e['id']) for e in events],
+                          [('jump', '1'), ('new', '2'), ('resolved', '1')])
+        self.assertTrue(all('time' in e for e in events))
+        self.assertEquals(self.sleep.call_count, 2)
+        # the bugs of an update are given to the next one
+        self.assertIsNone(self.update.call_args_list[0][0][0])
+        self.assertEquals(sorted(self.update.call_args_list[2][0][0]),
+                          ['1', '2'])
+
+    def test_compare_with_stored_bugs(self):
+        events = self.run_watch([{1: create_bug(2)}],
+                                bugs={'1': create_bug(2)})
+        self.assertEquals(events, [])
+
+    def test_failed_update(self):
+        events = self.run_watch([{1: create_bug(2)}, IOError('network'),
+                                 {1: create_bug(2), 2: create_bug(1)}])
+        self.assertEquals([(e['event'], e['id']) for e in events],
+                          [('new', '2')])
+
+    def test_error(self):
+        self.assertRaises(MozBattueError, self.run_watch,
+                          [MozBattueError('bad')])
@@ -0,0 +1,107 @@
+import datetime
+import unittest
+
+from mozbattue.bugs_info import BugTable
+from mozbattue.utils import MozBattueError
+from mozbattue.where import parse_where, split_conditions, partition, \
+    Comparison, And, Or, Not
+
+
+def parse(text):
+    return parse_where(text, BugTable.columns)
+
+
+class TestParse(unittest.TestCase):
+    def test_comparison(self):
+        self.assertEquals(parse("nb >= 10"), Comparison('nb', '>=', 10))
+        self.assertEquals(parse("average_day==2.5"),
+                          Comparison('average_day', '=', 2.5))
+        self.assertEquals(parse("product != 'Test \\'ing'"),
+                          Comparison('product', '!=', "Test 'ing"))
+        self.assertEquals(parse('status = "NEW"'),
+                          Comparison('status', '=', 'NEW'))
+
+    def test_in(self):
+        self.assertEquals(parse("id in (1, 2)"),
+                          Comparison('id', 'in', (1, 2)))
+        self.assertEquals(parse("product NOT IN ('a')"),
+                          Comparison('product', 'not in', ('a',)))
+
+    def test_values_are_converted(self):
+        self.assertEquals(parse("date >= '2015-04-20'").value,
+                          datetime.datetime(2015, 4, 20))
+        self.assertEquals(parse("average_day > 2").value, 2.0)
+        self.assertEquals(parse("id = '12'").value, 12)
+        self.assertEquals(parse("nb = 12.0").value, 12)
+
+    def test_precedence(self):
+        a, b, c = (Comparison('nb', '=', i) for i in (1, 2, 3))
+        self.assertEquals(parse("nb = 1 or nb = 2 and nb = 3"),
+                          Or([a, And([b, c])]))
+        self.assertEquals(parse("(nb = 1 or nb = 2) and not nb = 3"),
+                          And([Or([a, b]), Not(c)]))
+
+    def test_errors(self):
+        for text in ("nb >> 3", "foo = 3", "nb = 'x'", "product = 3",
+                     "nb = 1 and", "(nb = 1", "nb = 1 nb = 2", "nb ~ 2",
+                     "date > '2015'", "nb in 3", "id = 12.5",
+                     "nb in (1, 2.5)"):
+            self.assertRaises(MozBattueError, parse, text)
+
+
+class TestCompile(unittest.TestCase):
+    def setUp(self):
+        self.row = {'id': '12', 'nb': 15, 'product': 'Core',
+                    'status': 'NEW', 'average_day': 1.5,
+                    'date': datetime.datetime(2015, 4, 20), 'last_7d': None}
+
+    def check(self, text, expected=True):
+        self.assertEquals(parse(text).compile()(self.row), expected, text)
+
+    def test_evaluate(self):
+        self.check("nb >= 10 and product != 'Testing' and average_day > 1")
+        self.check("nb >= 10 and average_day > 2", False)
+        self.check("nb > 20 or not status in ('RESOLVED', 'VERIFIED')")
+        self.check("id > 2 and id < 100")
+        self.check("date >= '2015-04-20' and date < '2015-04-20T00:00:01'")
+        self.check("last_7d > 0", False)
+
+    def test_missing_values(self):
+        self.row.update(median_gap=None, wow_growth=None)
+        for text in ("wow_growth < 0", "median_gap <= 5", "wow_growth > 0",
+                     "median_gap >= 0", "wow_growth = 0"):
+            self.check(text, False)
+        self.check("wow_growth != 0")
+        self.check("not median_gap <= 5")
+
+    def test_cheap_conditions_first(self):
+        evaluated = []
+
+        class Row(dict):
+            def __getitem__(self, key):
+                evaluated.append(key)
+                return dict.__getitem__(self, key)
+
+        parse("last_7d > 0 and nb > 20 and status != 'NEW' "
+              "and product = 'Core'").compile()(Row(self.row))
+        self.assertEquals(evaluated, ['product', 'status'])
+
+
+class TestSplit(unittest.TestCase):
+    def test_split_conditions(self):
+        conditions, rest = split_conditions(parse(
+            "product = 'Core' and (nb > 2 or status = 'NEW') and id >= 3"))
+        self.assertEquals(conditions, [('product', '=', 'Core'),
+                                       ('id', '>=', 3)])
+        self.assertEquals(rest, parse("nb > 2 or status = 'NEW'"))
+
+    def test_split_all(self):
+        self.assertEquals(split_conditions(parse("status = 'NEW'")),
+                          ([('status', '=', 'NEW')], None))
+        self.assertEquals(split_conditions(None), ([], None))
+
+    def test_partition(self):
+        self.assertEquals(
+            partition(parse("nb > 2 and last_7d > 1 and average_day > 1"),
+                      lambda node: 'last_7d' not in node.columns()),
+            (parse("nb > 2 and average_day > 1"), parse("last_7d > 1")))